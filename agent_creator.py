@@ -1,4 +1,7 @@
-from langchain.agents import AgentExecutor, create_tool_calling_agent
+from typing import Dict, List
+from langchain_core.agents import AgentAction
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig, ensure_config
 from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
@@ -6,21 +9,134 @@ from langchain_core.prompts import (
     SystemMessagePromptTemplate,
 )
 from langchain_google_genai import ChatGoogleGenerativeAI
+from langgraph.prebuilt import ToolNode
+from clock import current_datetime_context
+from constants import (
+    CLOCK_PROMPT,
+    INJECT_CLOCK,
+    TOOL_AGENT_MAX_STEPS,
+    TOOL_CALL_WORKERS,
+)
+
+# answer of a tool agent which used up its steps, as AgentExecutor words it.
+MAX_STEPS_ANSWER = "Agent stopped due to iteration limit or time limit."
+
+
+def run_tools(
+    tool_node: ToolNode, message: AIMessage, config: RunnableConfig = None
+) -> List[BaseMessage]:
+    """
+    Runs the tool calls of a model step concurrently, at most TOOL_CALL_WORKERS at
+    once, and returns their ToolMessages in call order. Failing and unknown tools
+    come back as error observations.
+    """
+    # merged with the calling graph node's config, which carries the callbacks and tracing of the turn.
+    return tool_node.invoke(
+        [message], config=dict(ensure_config(config), max_concurrency=TOOL_CALL_WORKERS)
+    )
+
+
+async def arun_tools(
+    tool_node: ToolNode, message: AIMessage, config: RunnableConfig = None
+) -> List[BaseMessage]:
+    """
+    Asyncio variant of `run_tools`.
+    """
+    return await tool_node.ainvoke(
+        [message], config=dict(ensure_config(config), max_concurrency=TOOL_CALL_WORKERS)
+    )
 
 
-def create_tool_agent(llm: ChatGoogleGenerativeAI, tools: list, system_prompt: str):
+class ToolAgent:
+    """
+    Tool calling loop: the model is called with the tool calls and observations
+    of the turn so far until it answers without calling a tool, or `max_steps`
+    model calls were made. The tool calls of one step run concurrently through
+    LangGraph's ToolNode. Returns the answer as `output` and the
+    (tool call, observation) pairs as `intermediate_steps`, like AgentExecutor.
+    """
+
+    def __init__(
+        self, chain: Runnable, tools: list, max_steps: int = TOOL_AGENT_MAX_STEPS
+    ) -> None:
+        """
+        Sets up the agent on a `chain` from the prompt inputs to a model bound to `tools`.
+        """
+        self.chain = chain
+        self.tool_node = ToolNode(tools)
+        self.max_steps = max_steps
+
+    @staticmethod
+    def step(message: AIMessage, observations: List[BaseMessage]) -> List:
+        """
+        Returns the intermediate steps of a model step and the observations of its tool calls.
+        """
+        return [
+            (
+                AgentAction(tool=call["name"], tool_input=call["args"], log=""),
+                observation.content,
+            )
+            for call, observation in zip(message.tool_calls, observations)
+        ]
+
+    def invoke(self, input: Dict, config: RunnableConfig = None) -> Dict:
+        """
+        Runs the loop on the prompt inputs, see the class docstring.
+        """
+        scratchpad, steps = list(), list()
+        for _ in range(self.max_steps):
+            message = self.chain.invoke(
+                dict(input, agent_scratchpad=scratchpad), config
+            )
+            if not message.tool_calls:
+                return {"output": message.content, "intermediate_steps": steps}
+            observations = run_tools(self.tool_node, message, config)
+            scratchpad += [message] + observations
+            steps += self.step(message, observations)
+        return {"output": MAX_STEPS_ANSWER, "intermediate_steps": steps}
+
+    async def ainvoke(self, input: Dict, config: RunnableConfig = None) -> Dict:
+        """
+        Asyncio variant of `invoke`.
+        """
+        scratchpad, steps = list(), list()
+        for _ in range(self.max_steps):
+            message = await self.chain.ainvoke(
+                dict(input, agent_scratchpad=scratchpad), config
+            )
+            if not message.tool_calls:
+                return {"output": message.content, "intermediate_steps": steps}
+            observations = await arun_tools(self.tool_node, message, config)
+            scratchpad += [message] + observations
+            steps += self.step(message, observations)
+        return {"output": MAX_STEPS_ANSWER, "intermediate_steps": steps}
+
+
+def create_tool_agent(
+    llm: ChatGoogleGenerativeAI,
+    tools: list,
+    system_prompt: str,
+    inject_clock: bool = INJECT_CLOCK,
+):
     """Helper function to create agents with custom tools and system prompt
     Args:
         llm (ChatGoogleGenerativeAI): LLM for the agent
         tools (list): list of tools the agent will use
         system_prompt (str): text describing specific agent purpose
+        inject_clock (bool): add the current date and time to the system prompt
 
     Returns:
-        executor (AgentExecutor): Runnable for the agent created.
+        agent (ToolAgent): Runnable for the agent created.
     """
 
     # Each worker node will be given a name and some tools.
 
+    partial_variables = dict()
+    if inject_clock:
+        system_prompt += CLOCK_PROMPT
+        # evaluated every time the prompt is formatted.
+        partial_variables["current_datetime"] = current_datetime_context
+
     system_prompt_template = PromptTemplate(
         template=system_prompt
         + """
@@ -30,6 +146,7 @@ def create_tool_agent(llm: ChatGoogleGenerativeAI, tools: list, system_prompt: s
                 if available: \n {agent_history} \n
                 """,
         input_variables=["agent_history"],
+        partial_variables=partial_variables,
     )
 
     # define system message
@@ -42,8 +159,4 @@ def create_tool_agent(llm: ChatGoogleGenerativeAI, tools: list, system_prompt: s
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ]
     )
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    executor = AgentExecutor(
-        agent=agent, tools=tools, return_intermediate_steps=True, verbose=False
-    )
-    return executor
+    return ToolAgent(prompt | llm.bind_tools(tools), tools)
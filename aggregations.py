@@ -0,0 +1,150 @@
+"""Aggregations over raw calendar events, computed in Python instead of by the LLM"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from interval_index import IntervalIndex
+from parser import attendee_emails, event_datetime
+
+
+def is_timed(event: Dict) -> bool:
+    """
+    True for events with a start time, all day events (holidays, OOO) do not count as meetings.
+    """
+    return "dateTime" in event["start"]
+
+
+def meeting_index(events: List[Dict]) -> IntervalIndex:
+    """
+    Builds an interval index over the timed events.
+    """
+    return IntervalIndex.from_events([event for event in events if is_timed(event)])
+
+
+def day_bounds(day: date, timezone) -> Tuple[datetime, datetime]:
+    """
+    Returns the start of a day and of the following one in `timezone`.
+    """
+    start = timezone.localize(datetime.combine(day, time.min))
+    end = timezone.localize(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def hours(duration: timedelta) -> float:
+    """
+    Length of a duration in hours, rounded for presentation.
+    """
+    return round(duration.total_seconds() / 3600, 2)
+
+
+def busy_hours_per_day(
+    index: IntervalIndex, start: datetime, end: datetime, timezone
+) -> Dict[str, float]:
+    """
+    Returns the hours spent in meetings on each day between `start` and `end`.
+    Overlapping meetings are counted once.
+    """
+    busy = dict()
+    day = start.astimezone(timezone).date()
+    while True:
+        day_start, day_end = day_bounds(day, timezone)
+        if day_start >= end:
+            return busy
+        intervals = index.busy_intervals(max(day_start, start), min(day_end, end))
+        busy[day.isoformat()] = hours(
+            sum(
+                (busy_end - busy_start for busy_start, busy_end in intervals),
+                timedelta(),
+            )
+        )
+        day += timedelta(days=1)
+
+
+def next_free_slot(
+    index: IntervalIndex,
+    start: datetime,
+    end: datetime,
+    duration: timedelta,
+    timezone,
+    work_hours: Optional[Tuple[int, int]] = None,
+) -> Optional[Tuple[datetime, datetime]]:
+    """
+    Returns the first free slot of `duration` after `start`, None if there is none before `end`.
+    With `work_hours` (start hour, end hour), only slots within working hours qualify.
+    """
+    if work_hours is None:
+        windows = [(start, end)]
+    else:
+        windows = list()
+        day = start.astimezone(timezone).date()
+        while True:
+            day_start, _ = day_bounds(day, timezone)
+            if day_start >= end:
+                break
+            windows.append(
+                (
+                    max(day_start + timedelta(hours=work_hours[0]), start),
+                    min(day_start + timedelta(hours=work_hours[1]), end),
+                )
+            )
+            day += timedelta(days=1)
+
+    for window_start, window_end in windows:
+        if window_end - window_start < duration:
+            continue
+        slots = index.free_slots(window_start, window_end, duration)
+        if slots:
+            return slots[0][0], slots[0][0] + duration
+    return None
+
+
+def events_with_attendee(events: List[Dict], attendee: str) -> List[Dict]:
+    """
+    Returns the events with an attendee whose email or name contains `attendee`, ignoring case.
+    """
+    attendee = attendee.lower()
+    matches = list()
+    for event in events:
+        names = attendee_emails(event) + [
+            person.get("displayName", "") for person in event.get("attendees", list())
+        ]
+        if any(attendee in name.lower() for name in names):
+            matches.append(event)
+    return matches
+
+
+def meeting_load_per_week(
+    index: IntervalIndex, start: datetime, end: datetime, timezone
+) -> List[Dict]:
+    """
+    Returns the number of meetings and the hours spent in them for every week
+    (starting Monday) between `start` and `end`.
+    """
+    weeks = defaultdict(lambda: {"meetings": 0, "hours": 0.0})
+    for event in index.overlapping(start, end):
+        meeting_start = max(event_datetime(event, "start"), start)
+        week = meeting_start.astimezone(timezone).date()
+        week -= timedelta(days=week.weekday())
+        weeks[week]["meetings"] += 1
+
+    busy_hours = busy_hours_per_day(index, start, end, timezone)
+    for day, day_hours in busy_hours.items():
+        week = date.fromisoformat(day)
+        week -= timedelta(days=week.weekday())
+        if day_hours:
+            weeks[week]["hours"] = round(weeks[week]["hours"] + day_hours, 2)
+
+    return [{"week_of": week.isoformat(), **weeks[week]} for week in sorted(weeks)]
+
+
+def event_summary(event: Dict, timezone) -> Dict:
+    """
+    Small structured view of an event.
+    """
+    start = event_datetime(event, "start").astimezone(timezone)
+    end = event_datetime(event, "end").astimezone(timezone)
+    return {
+        "summary": event.get("summary", ""),
+        "start": start.isoformat(timespec="minutes"),
+        "end": end.isoformat(timespec="minutes"),
+    }
@@ -0,0 +1,519 @@
+"""
+Offline stand-ins for Gemini and the Google Calendar API, so the agents can be
+benchmarked without network access or credentials.
+"""
+
+import asyncio
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from urllib.parse import urlencode
+import pytz
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    ToolMessage,
+)
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+from constants import PRIMARY_CALENDAR, USER_TIMEZONE
+from history import estimate_tokens
+from logger import correlation_id
+from parser import event_datetime, to_datetime
+from scenarios import DEFAULT_SCENARIO, Scenario
+
+# Text identifying the prompts of the model calls which are not tool agent calls.
+SUPERVISOR_MARKER = "You are a supervisor"
+SUMMARY_MARKER = "running summary"
+SUMMARY_REPLY = "The crew looked up the calendar data the user asked for."
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Scripted chat model standing in for ChatGoogleGenerativeAI.
+    Replies are looked up by the users query in `scenarios`: tool agents replay
+    the scenario's tool calls and then answer, the supervisor walks the scenario's
+    route and every other prompt gets the scenario's answer. Each call waits
+    `latency` seconds plus `prefill_latency` seconds per prompt token, and streams
+    its answer word by word, `token_latency` seconds apart.
+    Calls are recorded, with their token counts, against the correlation id they ran under.
+    """
+
+    scenarios: Dict[str, Scenario]
+    latency: float = 0.0
+    prefill_latency: float = 0.0
+    token_latency: float = 0.0
+    _calls: List[Dict] = PrivateAttr(default_factory=list)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(
+            tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs
+        )
+
+    @property
+    def calls(self) -> List[Dict]:
+        """
+        The calls made so far.
+        """
+        with self._lock:
+            return list(self._calls)
+
+    def scenario(self, messages: List[BaseMessage]) -> Scenario:
+        """
+        The scenario of the users query, the last human message of the prompt.
+        """
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                return self.scenarios.get(message.content, DEFAULT_SCENARIO)
+        return DEFAULT_SCENARIO
+
+    def reply(
+        self, messages: List[BaseMessage], tools: Optional[List[Dict]] = None
+    ) -> AIMessage:
+        """
+        The scripted reply to a prompt.
+        """
+        system = messages[0].content if messages else ""
+        if SUMMARY_MARKER in str(messages[-1].content):
+            return AIMessage(content=SUMMARY_REPLY)
+        scenario = self.scenario(messages)
+        if SUPERVISOR_MARKER in system:
+            decision = {"next": self.next_node(scenario, messages)}
+            if tools:
+                # structured output, the decision is the argument of the bound function.
+                return AIMessage(
+                    content="",
+                    tool_calls=[
+                        {
+                            "name": tools[0]["function"]["name"],
+                            "args": decision,
+                            "id": "call-route",
+                        }
+                    ],
+                )
+            return AIMessage(content=json.dumps(decision))
+        if tools and not isinstance(messages[-1], ToolMessage):
+            available = {tool["function"]["name"] for tool in tools}
+            tool_calls = [
+                {"name": name, "args": args, "id": f"call-{position}"}
+                for position, (name, args) in enumerate(scenario.tool_calls)
+                if name in available
+            ]
+            if tool_calls:
+                return AIMessage(content="", tool_calls=tool_calls)
+        return AIMessage(content=scenario.answer)
+
+    @staticmethod
+    def next_node(scenario: Scenario, messages: List[BaseMessage]) -> str:
+        """
+        The step of the scenario's route the turn is at, from the crew answers
+        trailing the prompt.
+        """
+        done = 0
+        for message in reversed(messages):
+            if not isinstance(message, AIMessage) or message.content != scenario.answer:
+                break
+            done += 1
+        return scenario.route[min(done, len(scenario.route) - 1)]
+
+    def record(
+        self, messages: List[BaseMessage], tools: Optional[List[Dict]], reply: AIMessage
+    ) -> None:
+        """
+        Records a call and sets its usage on the reply.
+        """
+        input_tokens = sum(estimate_tokens(message.content) for message in messages)
+        if tools:
+            input_tokens += estimate_tokens(json.dumps(tools))
+        output_tokens = estimate_tokens(reply.content)
+        if reply.tool_calls:
+            output_tokens += estimate_tokens(
+                json.dumps([[call["name"], call["args"]] for call in reply.tool_calls])
+            )
+        reply.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        with self._lock:
+            self._calls.append(
+                {
+                    "correlation_id": correlation_id.get(),
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                }
+            )
+
+    def prepare(
+        self, messages: List[BaseMessage], tools: Optional[List[Dict]]
+    ) -> AIMessage:
+        reply = self.reply(messages, tools)
+        self.record(messages, tools, reply)
+        return reply
+
+    def duration(self, reply: AIMessage) -> float:
+        """
+        Seconds it takes to generate a whole reply.
+        """
+        return self.first_token_delay(reply) + self.token_latency * len(
+            reply.content.split(" ")
+        )
+
+    def first_token_delay(self, reply: AIMessage) -> float:
+        """
+        Seconds before the first chunk of a reply, growing with the prompt size.
+        """
+        return (
+            self.latency + self.prefill_latency * reply.usage_metadata["input_tokens"]
+        )
+
+    @staticmethod
+    def chunks(reply: AIMessage) -> Iterator[ChatGenerationChunk]:
+        """
+        Splits a reply into word chunks, tool calls and usage come with the last one.
+        """
+        words = reply.content.split(" ") if reply.content else [""]
+        for position, word in enumerate(words):
+            last = position == len(words) - 1
+            chunk = AIMessageChunk(content=word if last else word + " ")
+            if last:
+                chunk = AIMessageChunk(
+                    content=chunk.content,
+                    tool_call_chunks=[
+                        {
+                            "name": call["name"],
+                            "args": json.dumps(call["args"]),
+                            "id": call["id"],
+                            "index": index,
+                        }
+                        for index, call in enumerate(reply.tool_calls)
+                    ],
+                    usage_metadata=reply.usage_metadata,
+                )
+            yield ChatGenerationChunk(message=chunk)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        reply = self.prepare(messages, tools)
+        time.sleep(self.duration(reply))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict]] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        reply = self.prepare(messages, tools)
+        await asyncio.sleep(self.duration(reply))
+        return ChatResult(generations=[ChatGeneration(message=reply)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict]] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        reply = self.prepare(messages, tools)
+        time.sleep(self.first_token_delay(reply))
+        for chunk in self.chunks(reply):
+            time.sleep(self.token_latency)
+            yield chunk
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        tools: Optional[List[Dict]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        reply = self.prepare(messages, tools)
+        await asyncio.sleep(self.first_token_delay(reply))
+        for chunk in self.chunks(reply):
+            await asyncio.sleep(self.token_latency)
+            yield chunk
+
+
+class FakeRequest:
+    """
+    A google api request, executed against the fake service.
+    """
+
+    def __init__(
+        self, method_id: str, method: str, uri: str, run, latency: float
+    ) -> None:
+        self.methodId = method_id
+        self.method = method
+        self.uri = uri
+        self.body = None
+        self.run = run
+        self.latency = latency
+
+    def execute(self, http=None, num_retries: int = 0) -> Dict:
+        time.sleep(self.latency)
+        return self.run()
+
+
+class FakeBatchRequest:
+    """
+    A batch of requests, executed one after the other in a single round trip.
+    """
+
+    def __init__(self, callback, latency: float) -> None:
+        self.callback = callback
+        self.latency = latency
+        self.requests = list()
+
+    def add(self, request: FakeRequest, request_id: str) -> None:
+        self.requests.append((request, request_id))
+
+    def execute(self, http=None) -> None:
+        time.sleep(self.latency)
+        for request, request_id in self.requests:
+            try:
+                self.callback(request_id, request.run(), None)
+            except Exception as err:
+                self.callback(request_id, None, err)
+
+
+class FakeEvents:
+    """
+    The events collection of the fake service.
+    """
+
+    def __init__(self, service: "FakeCalendarService") -> None:
+        self.service = service
+
+    def list(
+        self, calendarId: str, pageToken: Optional[str] = None, **params
+    ) -> FakeRequest:
+        query = dict(params, calendarId=calendarId, pageToken=pageToken)
+        return FakeRequest(
+            "calendar.events.list",
+            "GET",
+            f"/calendars/{calendarId}/events?{urlencode(sorted(query.items()))}",
+            lambda: self.service.list_events(calendarId, pageToken, **params),
+            self.service.latency,
+        )
+
+    def insert(self, calendarId: str, body: Dict) -> FakeRequest:
+        return FakeRequest(
+            "calendar.events.insert",
+            "POST",
+            f"/calendars/{calendarId}/events",
+            lambda: self.service.insert_event(calendarId, body),
+            self.service.latency,
+        )
+
+
+class FakeCalendarList:
+    """
+    The calendar list collection of the fake service.
+    """
+
+    def __init__(self, service: "FakeCalendarService") -> None:
+        self.service = service
+
+    def list(self, **params) -> FakeRequest:
+        return FakeRequest(
+            "calendar.calendarList.list",
+            "GET",
+            "/users/me/calendarList",
+            lambda: {"items": [dict(calendar) for calendar in self.service.calendars]},
+            self.service.latency,
+        )
+
+
+class FakeCalendarService:
+    """
+    In-memory Google Calendar API service, supporting what GoogleCalendarClient and
+    EventStore use: events().list (time ranges, pagination and sync tokens),
+    events().insert, calendarList().list and batch requests. Every API call waits
+    `latency` seconds.
+    """
+
+    def __init__(
+        self,
+        events: Optional[Dict[str, List[Dict]]] = None,
+        calendars: Optional[List[Dict]] = None,
+        latency: float = 0.0,
+    ) -> None:
+        self.calendars = calendars or [
+            {"id": PRIMARY_CALENDAR, "summary": "Personal"},
+            {"id": "team", "summary": "Team"},
+        ]
+        self.latency = latency
+        self.version = 0
+        # calendar -> event id -> event, every event carries the version it last changed at.
+        self.store = {calendar["id"]: dict() for calendar in self.calendars}
+        self.lock = threading.Lock()
+        for calendar, calendar_events in (events or dict()).items():
+            for event in calendar_events:
+                self.put(calendar, dict(event))
+
+    def put(self, calendar: str, event: Dict) -> Dict:
+        with self.lock:
+            self.version += 1
+            event["updated_version"] = self.version
+            self.store.setdefault(calendar, dict())[event["id"]] = event
+        return event
+
+    def events(self) -> FakeEvents:
+        return FakeEvents(self)
+
+    def calendarList(self) -> FakeCalendarList:
+        return FakeCalendarList(self)
+
+    def new_batch_http_request(self, callback) -> FakeBatchRequest:
+        return FakeBatchRequest(callback, self.latency)
+
+    def insert_event(self, calendar: str, body: Dict) -> Dict:
+        event = dict(body, id=f"created{self.version + 1}", status="confirmed")
+        return dict(self.put(calendar, event))
+
+    def list_events(
+        self,
+        calendar: str,
+        page_token: Optional[str] = None,
+        timeMin: Optional[str] = None,
+        timeMax: Optional[str] = None,
+        maxResults: int = 250,
+        syncToken: Optional[str] = None,
+        orderBy: Optional[str] = None,
+        **params,
+    ) -> Dict:
+        with self.lock:
+            events = list(self.store.get(calendar, dict()).values())
+            version = self.version
+        if syncToken:
+            events = [
+                event for event in events if event["updated_version"] > int(syncToken)
+            ]
+        else:
+            events = [event for event in events if event.get("status") != "cancelled"]
+            after, before = to_datetime(timeMin), to_datetime(timeMax)
+            if after is not None:
+                events = [
+                    event for event in events if event_datetime(event, "end") > after
+                ]
+            if before is not None:
+                events = [
+                    event for event in events if event_datetime(event, "start") < before
+                ]
+        events.sort(key=lambda event: event_datetime(event, "start"))
+
+        offset = int(page_token or 0)
+        page = {
+            "items": [dict(event) for event in events[offset : offset + maxResults]]
+        }
+        if offset + maxResults < len(events):
+            page["nextPageToken"] = str(offset + maxResults)
+        else:
+            page["nextSyncToken"] = str(version)
+        return page
+
+
+ATTENDEES = [
+    "alice@example.com",
+    "bob@example.com",
+    "carol@example.com",
+    "dave@example.com",
+    "erin@example.com",
+]
+MEETING_TITLES = [
+    "Standup",
+    "Design review",
+    "1:1",
+    "Sprint planning",
+    "Customer call",
+    "Interview",
+    "Roadmap sync",
+    "Lunch",
+]
+
+
+def generate_events(
+    days: int = 28, per_day: int = 4, seed: int = 7, now: Optional[datetime] = None
+) -> Dict[str, List[Dict]]:
+    """
+    Generates a reproducible calendar around `now`: timed meetings on working days,
+    some of them overlapping, an all day event every week, and team meetings on
+    the team calendar.
+    """
+    rng = random.Random(seed)
+    timezone = pytz.timezone(USER_TIMEZONE)
+    now = now or datetime.now(timezone)
+    first_day = (now - timedelta(days=days // 4)).date()
+    events = {PRIMARY_CALENDAR: list(), "team": list()}
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        if day.weekday() == 0:
+            events[PRIMARY_CALENDAR].append(
+                {
+                    "id": f"allday{offset}",
+                    "status": "confirmed",
+                    "summary": "Focus week",
+                    "start": {"date": day.isoformat()},
+                    "end": {"date": (day + timedelta(days=1)).isoformat()},
+                }
+            )
+        if day.weekday() >= 5:
+            continue
+        for position in range(per_day):
+            start = timezone.localize(
+                datetime(
+                    day.year,
+                    day.month,
+                    day.day,
+                    rng.randint(9, 17),
+                    rng.choice([0, 30]),
+                )
+            )
+            end = start + timedelta(minutes=rng.choice([30, 45, 60, 90]))
+            calendar = "team" if position == 0 else PRIMARY_CALENDAR
+            events[calendar].append(
+                {
+                    "id": f"event{offset}x{position}",
+                    "status": "confirmed",
+                    "summary": rng.choice(MEETING_TITLES),
+                    "description": "Agenda: review the open items and agree on next steps. "
+                    * rng.randint(0, 3),
+                    "location": rng.choice(
+                        ["", "Room 4", "https://meet.example.com/abc"]
+                    ),
+                    "start": {"dateTime": start.isoformat(), "timeZone": USER_TIMEZONE},
+                    "end": {"dateTime": end.isoformat(), "timeZone": USER_TIMEZONE},
+                    "attendees": [
+                        {"email": email, "responseStatus": "accepted"}
+                        for email in rng.sample(ATTENDEES, rng.randint(1, 3))
+                    ],
+                }
+            )
+    return events
@@ -0,0 +1,251 @@
+"""
+Offline benchmark of the agents, on a scripted chat model and an in-memory calendar.
+Reports per node latency, LLM calls, tokens and calendar API calls per query, and
+the throughput at each number of concurrent sessions.
+
+    python benchmarks/harness.py --agent multi --sessions 1 4 16 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# the agents only build Gemini when no model is injected, the key is never used.
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from checkpointer import SqliteCheckpointer
+from constants import GRAPH_MODE, GRAPH_MODES
+from event_store import EventStore
+from fakes import FakeCalendarService, FakeChatModel, generate_events
+from llm_cache import create_response_cache
+from logger import correlation_scope
+from scenarios import Scenario, build_corpus, corpus_by_query
+import tools
+
+
+def install_calendar(api_latency: float) -> None:
+    """
+    Points the calendar client the tools use at a fresh fake service and event store.
+    """
+    client = tools.calendar_client()
+    client.shared_service = FakeCalendarService(generate_events(), latency=api_latency)
+    if client.event_store is not None:
+        client.event_store = EventStore(":memory:")
+
+
+def build_agent(agent_name: str, model: FakeChatModel, graph_mode: str):
+    """
+    Builds the agent on the fake model, with throwaway checkpoints.
+    `graph_mode` picks the multi agent graph.
+    """
+    checkpointer = SqliteCheckpointer(":memory:")
+    if agent_name == "multi":
+        from multi_agent import MultiAgent
+
+        return MultiAgent(model=model, checkpointer=checkpointer, graph_mode=graph_mode)
+    from jarvis import Jarvis
+
+    return Jarvis(model=model, checkpointer=checkpointer)
+
+
+def turn_stream(agent, query: str, thread_id: str):
+    """
+    Streams the node updates of one turn of either agent.
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    if hasattr(agent, "graph"):
+        return agent.graph.astream(
+            agent.turn_input(query), config=config, stream_mode="updates"
+        )
+    return agent.agent_executor.astream(
+        {"messages": [("human", query)]}, config=config, stream_mode="updates"
+    )
+
+
+async def run_session(
+    agent, session: int, corpus: List[Scenario], turns: int, results: Dict
+) -> None:
+    """
+    Runs `turns` queries of the corpus in one conversation thread, starting at a
+    different query for every session. Records the latency of each turn and node.
+    """
+    for turn in range(turns):
+        scenario = corpus[(session + turn) % len(corpus)]
+        with correlation_scope(f"s{session}t{turn}") as turn_id:
+            start = last = time.perf_counter()
+            async for update in turn_stream(
+                agent, scenario.query, f"session-{session}"
+            ):
+                now = time.perf_counter()
+                # the nodes of a turn run one after the other.
+                for node in update:
+                    if not node.startswith("__"):
+                        results["nodes"][node].append(now - last)
+                last = now
+            results["turns"][turn_id] = last - start
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """
+    The `fraction` percentile of the values.
+    """
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+async def benchmark(args, sessions: int) -> Dict:
+    """
+    Runs `sessions` concurrent sessions against a fresh agent and calendar, returns the report.
+    """
+    install_calendar(args.api_latency)
+    corpus = build_corpus()
+    cache = create_response_cache(tools.calendar_client()) if args.cache else None
+    model = FakeChatModel(
+        scenarios=corpus_by_query(corpus),
+        latency=args.latency,
+        prefill_latency=args.prefill_latency,
+        token_latency=args.token_latency,
+        cache=cache,
+    )
+    agent = build_agent(args.agent, model, args.graph)
+    results = {"nodes": defaultdict(list), "turns": dict()}
+    api_calls = tools.calendar_client().requests.report()["api_calls"]
+
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            run_session(agent, session, corpus, args.turns, results)
+            for session in range(sessions)
+        ]
+    )
+    wall = time.perf_counter() - start
+
+    queries = len(results["turns"])
+    calls = model.calls
+    latencies = list(results["turns"].values())
+    return {
+        "agent": args.agent,
+        # the graph that ran, --graph only applies to the multi agent.
+        "graph": getattr(agent, "graph_mode", "react"),
+        "sessions": sessions,
+        "queries": queries,
+        "wall_seconds": wall,
+        "throughput_qps": queries / wall,
+        "turn_p50_seconds": statistics.median(latencies),
+        "turn_p95_seconds": percentile(latencies, 0.95),
+        "llm_calls_per_query": len(calls) / queries,
+        "input_tokens_per_query": sum(call["input_tokens"] for call in calls) / queries,
+        "output_tokens_per_query": sum(call["output_tokens"] for call in calls)
+        / queries,
+        "api_calls_per_query": (
+            tools.calendar_client().requests.report()["api_calls"] - api_calls
+        )
+        / queries,
+        "early_stops": agent.guard.report() if hasattr(agent, "guard") else dict(),
+        "nodes": {
+            node: {
+                "calls": len(timings),
+                "mean_seconds": statistics.mean(timings),
+                "p95_seconds": percentile(timings, 0.95),
+            }
+            for node, timings in sorted(results["nodes"].items())
+        },
+    }
+
+
+def print_report(report: Dict) -> None:
+    """
+    Prints a report as a table.
+    """
+    print(
+        f"\n{report['agent']} agent ({report['graph']} graph), {report['sessions']} sessions: "
+        f"{report['queries']} queries in {report['wall_seconds']:.2f}s, "
+        f"{report['throughput_qps']:.2f} queries/s"
+    )
+    print(
+        f"  turn latency p50 {report['turn_p50_seconds']:.3f}s, p95 {report['turn_p95_seconds']:.3f}s"
+    )
+    print(
+        f"  per query: {report['llm_calls_per_query']:.2f} LLM calls, "
+        f"{report['input_tokens_per_query']:.0f} input / {report['output_tokens_per_query']:.0f} output tokens, "
+        f"{report['api_calls_per_query']:.2f} calendar API calls"
+    )
+    early_stops = sum(report["early_stops"].values())
+    if early_stops:
+        print(f"  turns stopped early: {report['early_stops']}")
+    print(f"  {'node':<20}{'calls':>8}{'mean':>10}{'p95':>10}")
+    for node, stats in report["nodes"].items():
+        print(
+            f"  {node:<20}{stats['calls']:>8}"
+            f"{stats['mean_seconds']:>9.3f}s{stats['p95_seconds']:>9.3f}s"
+        )
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Offline agent benchmark.")
+    arg_parser.add_argument("--agent", choices=["multi", "jarvis"], default="multi")
+    arg_parser.add_argument(
+        "--graph",
+        choices=GRAPH_MODES,
+        default=GRAPH_MODE,
+        help="multi agent graph to measure",
+    )
+    arg_parser.add_argument(
+        "--sessions",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16],
+        help="numbers of concurrent sessions to measure",
+    )
+    arg_parser.add_argument("--turns", type=int, default=9, help="queries per session")
+    arg_parser.add_argument(
+        "--latency", type=float, default=0.2, help="seconds per LLM call"
+    )
+    arg_parser.add_argument(
+        "--prefill-latency",
+        type=float,
+        default=0.00002,
+        help="seconds per prompt token of an LLM call",
+    )
+    arg_parser.add_argument(
+        "--token-latency",
+        type=float,
+        default=0.005,
+        help="seconds per streamed answer word",
+    )
+    arg_parser.add_argument(
+        "--api-latency", type=float, default=0.05, help="seconds per calendar API call"
+    )
+    arg_parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="run without the LLM response cache",
+    )
+    arg_parser.add_argument(
+        "--json", action="store_true", help="print the reports as JSON"
+    )
+    args = arg_parser.parse_args()
+
+    # the tools print progress lines meant for the REPL.
+    with contextlib.redirect_stdout(io.StringIO()):
+        reports = [asyncio.run(benchmark(args, sessions)) for sessions in args.sessions]
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        for report in reports:
+            print_report(report)
+
+
+if __name__ == "__main__":
+    main()
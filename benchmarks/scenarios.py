@@ -0,0 +1,146 @@
+"""
+Corpus of typical user queries, with the model behaviour the fake chat model replays for them.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import pytz
+from constants import USER_TIMEZONE
+
+
+class Scenario(NamedTuple):
+    """
+    A user query, the nodes the supervisor routes it through, the tool calls the
+    tool agents make for it and the final answer.
+    """
+
+    name: str
+    query: str
+    route: List[str]
+    tool_calls: List[Tuple[str, Dict]]
+    answer: str
+
+
+DEFAULT_SCENARIO = Scenario(
+    name="unknown",
+    query="",
+    route=["Communicate"],
+    tool_calls=list(),
+    answer="Sorry, I can only help with your calendar.",
+)
+
+
+def build_corpus(now: Optional[datetime] = None) -> List[Scenario]:
+    """
+    Builds the corpus, tool call arguments are relative to `now`.
+    """
+    now = now or datetime.now(pytz.timezone(USER_TIMEZONE))
+    tomorrow = (now + timedelta(days=1)).date()
+
+    def at(day, hour: int, minute: int = 0) -> str:
+        return f"{day.isoformat()}T{hour:02d}:{minute:02d}:00"
+
+    return [
+        Scenario(
+            name="current_time",
+            query="What time is it?",
+            route=["DateTime", "Communicate"],
+            tool_calls=[("get_date_time_multiagent", {}), ("get_current_time", {})],
+            answer=f"It is {now.strftime('%H:%M')} on {now.strftime('%A, %d %B %Y')}.",
+        ),
+        Scenario(
+            name="upcoming_events",
+            query="What are my upcoming meetings?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[("fetch_upcoming_events_for_calendar", {"num_events": 5})],
+            answer="Your next five meetings are a standup, a design review, a 1:1, "
+            "a customer call and sprint planning.",
+        ),
+        Scenario(
+            name="calendar_list",
+            query="Which calendars do I have?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[("fetch_calendar_list", {})],
+            answer="You have two calendars: Personal and Team.",
+        ),
+        Scenario(
+            name="day_agenda",
+            query="What do I have tomorrow?",
+            route=["DateTime", "Calendar", "Communicate"],
+            tool_calls=[
+                ("get_current_day_and_date", {}),
+                ("get_current_time", {}),
+                (
+                    "fetch_calendar_events",
+                    {
+                        "count_events": 20,
+                        "start_datetime": at(tomorrow, 0),
+                        "end_datetime": at(tomorrow, 23, 59),
+                    },
+                ),
+            ],
+            answer="Tomorrow you have four meetings, starting with a standup at 9:30.",
+        ),
+        Scenario(
+            name="conflicts",
+            query="Am I free tomorrow between 2 and 4 pm?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[
+                (
+                    "check_conflicts",
+                    {
+                        "start_datetime": at(tomorrow, 14),
+                        "end_datetime": at(tomorrow, 16),
+                    },
+                )
+            ],
+            answer="You have one meeting in that window, a design review at 3 pm.",
+        ),
+        Scenario(
+            name="next_free_slot",
+            query="When is my next free hour?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[("get_next_free_slot", {"duration_minutes": 60})],
+            answer="Your next free hour starts tomorrow at 11 am.",
+        ),
+        Scenario(
+            name="meeting_load",
+            query="How many hours of meetings do I have per day this week?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[("get_busy_hours_per_day", {})],
+            answer="You are in meetings for about three hours a day this week.",
+        ),
+        Scenario(
+            name="attendee_search",
+            query="When am I meeting alice@example.com next?",
+            route=["Calendar", "Communicate"],
+            tool_calls=[
+                ("find_events_with_attendee", {"attendee": "alice@example.com"})
+            ],
+            answer="You meet Alice tomorrow at 10 am for the roadmap sync.",
+        ),
+        Scenario(
+            name="create_event",
+            query="Schedule a sync with bob@example.com tomorrow at 6 pm for 30 minutes",
+            route=["Calendar", "Communicate"],
+            tool_calls=[
+                (
+                    "create_event",
+                    {
+                        "start_datetime": at(tomorrow, 18),
+                        "end_datetime": at(tomorrow, 18, 30),
+                        "attendees": "bob@example.com",
+                        "summary": "Sync",
+                    },
+                )
+            ],
+            answer="Done, the sync with Bob is scheduled tomorrow from 6 to 6:30 pm.",
+        ),
+    ]
+
+
+def corpus_by_query(corpus: List[Scenario]) -> Dict[str, Scenario]:
+    """
+    Indexes scenarios by their query, the way the fake chat model looks them up.
+    """
+    return {scenario.query: scenario for scenario in corpus}
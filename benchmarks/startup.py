@@ -0,0 +1,73 @@
+"""
+Measures the time until the REPL prompt shows up for each command line entry point.
+
+    python benchmarks/startup.py --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = [
+    ["main.py"],
+    ["main.py", "--multi-agent"],
+    ["jarvis.py"],
+    ["multi_agent.py"],
+]
+PROMPT = b"> "
+
+
+def time_to_prompt(entry_point: List[str]) -> float:
+    """
+    Starts an entry point and returns the seconds until it prints the prompt.
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    # building the chat model needs a key, it is not used before the first query.
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable] + entry_point,
+        cwd=REPO_ROOT,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        output = b""
+        while not output.endswith(PROMPT):
+            char = process.stdout.read(1)
+            if not char:
+                raise RuntimeError(f"{' '.join(entry_point)} exited before the prompt")
+            output += char
+        return time.perf_counter() - start
+    finally:
+        process.kill()
+        process.wait()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Startup time benchmark.")
+    arg_parser.add_argument("--runs", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    print(f"{'entry point':<28}{'median':>10}{'min':>10}")
+    for entry_point in ENTRY_POINTS:
+        try:
+            timings = [time_to_prompt(entry_point) for _ in range(args.runs)]
+        except RuntimeError as err:
+            print(f"{' '.join(entry_point):<28}{str(err):>20}")
+            continue
+        print(
+            f"{' '.join(entry_point):<28}"
+            f"{statistics.median(timings):>9.3f}s{min(timings):>9.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Compares the prompt tokens and latency per routing decision of the JSON text
+supervisor and the structured output (function calling) supervisor.
+Runs offline on the scripted model by default, `--live` calls Gemini (needs GEMINI_API_KEY).
+
+    python benchmarks/supervisor.py --repeat 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+from typing import Dict, List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+from langchain_core.messages import AIMessage, HumanMessage
+from checkpointer import SqliteCheckpointer
+from constants import MODEL
+from fakes import FakeChatModel
+from harness import install_calendar, percentile
+from logger import correlation_scope
+from multi_agent import MultiAgent, members
+from scenarios import Scenario, build_corpus, corpus_by_query
+from tracing import tracer, tracing_handler
+
+MODES = {"json": False, "structured": True}
+
+
+def decision_inputs(corpus: List[Scenario]) -> List[Tuple[Dict, str]]:
+    """
+    Supervisor inputs at every hop of every scenario, with the expected decision.
+    """
+    inputs = list()
+    for scenario in corpus:
+        for hop, expected in enumerate(scenario.route):
+            history = [
+                AIMessage(content=scenario.answer, name=worker)
+                for worker in scenario.route[:hop]
+            ]
+            inputs.append(
+                (
+                    {
+                        "messages": [HumanMessage(content=scenario.query)],
+                        "agent_history": history,
+                    },
+                    expected,
+                )
+            )
+    return inputs
+
+
+def measure(agent, inputs: List[Tuple[Dict, str]], mode: str, repeat: int) -> Dict:
+    """
+    Runs every supervisor input `repeat` times, returns the per decision averages.
+    """
+    correct, failures = 0, 0
+    for round_number in range(repeat):
+        for position, (supervisor_input, expected) in enumerate(inputs):
+            with correlation_scope(f"{mode}-{round_number}-{position}"):
+                try:
+                    decision = agent.supervisor_chain.invoke(
+                        supervisor_input, config={"callbacks": [tracing_handler]}
+                    )
+                except Exception:
+                    decision = None
+            if not decision or decision.get("next") not in members:
+                failures += 1
+            elif decision["next"] == expected:
+                correct += 1
+    spans = [
+        span
+        for span in tracer.spans()
+        if span.kind == "llm" and span.trace.startswith(f"{mode}-")
+    ]
+    latencies = [span.duration for span in spans]
+    decisions = repeat * len(inputs)
+    return {
+        "mode": mode,
+        "decisions": decisions,
+        "prompt_tokens": statistics.mean(
+            span.attributes["gen_ai.usage.input_tokens"] for span in spans
+        ),
+        "output_tokens": statistics.mean(
+            span.attributes["gen_ai.usage.output_tokens"] for span in spans
+        ),
+        "latency_mean": statistics.mean(latencies),
+        "latency_p95": percentile(latencies, 0.95),
+        "accuracy": correct / decisions,
+        "parse_failures": failures,
+    }
+
+
+def build_model(args, corpus: List[Scenario]):
+    """
+    The model to measure: Gemini with `--live`, the scripted model otherwise. Uncached either way.
+    """
+    if args.live:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        return ChatGoogleGenerativeAI(api_key=os.getenv("GEMINI_API_KEY"), model=MODEL)
+    return FakeChatModel(
+        scenarios=corpus_by_query(corpus),
+        latency=args.latency,
+        prefill_latency=args.prefill_latency,
+    )
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Supervisor decision benchmark.")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument(
+        "--live", action="store_true", help="measure Gemini instead of the fake model"
+    )
+    arg_parser.add_argument(
+        "--latency", type=float, default=0.2, help="seconds per fake LLM call"
+    )
+    arg_parser.add_argument(
+        "--prefill-latency",
+        type=float,
+        default=0.00002,
+        help="seconds per prompt token of a fake LLM call",
+    )
+    args = arg_parser.parse_args()
+
+    install_calendar(0)
+    corpus = build_corpus()
+    inputs = decision_inputs(corpus)
+
+    reports = list()
+    for mode, structured in MODES.items():
+        agent = MultiAgent(
+            model=build_model(args, corpus),
+            checkpointer=SqliteCheckpointer(":memory:"),
+            structured_supervisor=structured,
+        )
+        reports.append(measure(agent, inputs, mode, args.repeat))
+
+    print(
+        f"{'mode':<12}{'decisions':>10}{'prompt tok':>12}{'output tok':>12}"
+        f"{'mean':>10}{'p95':>10}{'accuracy':>10}{'failures':>10}"
+    )
+    for report in reports:
+        print(
+            f"{report['mode']:<12}{report['decisions']:>10}{report['prompt_tokens']:>12.0f}"
+            f"{report['output_tokens']:>12.1f}{report['latency_mean']:>9.3f}s"
+            f"{report['latency_p95']:>9.3f}s{report['accuracy']:>10.0%}{report['parse_failures']:>10}"
+        )
+    baseline, structured = reports
+    print(
+        f"structured vs json: {1 - structured['prompt_tokens'] / baseline['prompt_tokens']:.0%} fewer prompt tokens, "
+        f"{1 - structured['latency_mean'] / baseline['latency_mean']:.0%} lower mean latency per decision"
+    )
+
+
+if __name__ == "__main__":
+    main()
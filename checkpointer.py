@@ -0,0 +1,424 @@
+"""Disk backed, bounded checkpointer for the langgraph agents"""
+
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+)
+from langgraph.checkpoint.serde.types import TASKS
+from constants import (
+    CHECKPOINT_DB_FILE,
+    CHECKPOINT_RETENTION,
+    CHECKPOINT_COMPACT_EVERY,
+    CHECKPOINT_CACHE_SIZE,
+)
+from logger import log_with_context, logging
+
+
+class SqliteCheckpointer(BaseCheckpointSaver):
+    """
+    Checkpoint saver persisting graph state to SQLite, replacing MemorySaver.
+    Only the latest `retention` checkpoints of a thread are kept, older ones are
+    compacted away every `compact_every` writes. The latest checkpoint of the most
+    recently used threads is cached in memory so hot conversations skip the disk.
+    """
+
+    def __init__(
+        self,
+        path: str = CHECKPOINT_DB_FILE,
+        retention: int = CHECKPOINT_RETENTION,
+        compact_every: int = CHECKPOINT_COMPACT_EVERY,
+        cache_size: int = CHECKPOINT_CACHE_SIZE,
+    ) -> None:
+        """
+        Opens (or creates) the checkpoint database at `path`. Use ":memory:" for a throwaway one.
+        """
+        super().__init__()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        # the latest checkpoint's parent is needed to restore pending sends.
+        self.retention = max(retention, 2)
+        self.compact_every = compact_every
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.puts_since_compaction = 0
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        """
+        Creates the checkpoint and pending write tables if missing.
+        """
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                )
+                """
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                )
+                """
+            )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Returns the checkpoint with the configured checkpoint id, or the latest
+        checkpoint of the thread when no id is set.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        key = (thread_id, checkpoint_ns)
+
+        with self.lock:
+            if checkpoint_id is None and key in self.cache:
+                self.cache.move_to_end(key)
+                return self.to_tuple(thread_id, checkpoint_ns, *self.cache[key])
+
+            if checkpoint_id is None:
+                row = self.connection.execute(
+                    """
+                    SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                    FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                    ORDER BY checkpoint_id DESC LIMIT 1
+                    """,
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            else:
+                row = self.connection.execute(
+                    """
+                    SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                    FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+                    """,
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            if row is None:
+                return None
+
+            writes, sends = self.load_writes(thread_id, checkpoint_ns, row)
+            if checkpoint_id is None:
+                self.cache[key] = (row, writes, sends)
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return self.to_tuple(thread_id, checkpoint_ns, row, writes, sends)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """
+        Lists the retained checkpoints, newest first, optionally of one thread, matching
+        the `filter` on metadata and older than `before`.
+        """
+        query = """
+            SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id,
+                   type, checkpoint, metadata_type, metadata
+            FROM checkpoints WHERE 1 = 1
+        """
+        params = list()
+        if config is not None:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if "checkpoint_ns" in config["configurable"]:
+                query += " AND checkpoint_ns = ?"
+                params.append(config["configurable"]["checkpoint_ns"])
+        if before is not None:
+            query += " AND checkpoint_id < ?"
+            params.append(get_checkpoint_id(before))
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self.lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        count = 0
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and count >= limit:
+                return
+            with self.lock:
+                writes, sends = self.load_writes(thread_id, checkpoint_ns, row)
+            checkpoint_tuple = self.to_tuple(
+                thread_id, checkpoint_ns, row, writes, sends
+            )
+            if filter and any(
+                checkpoint_tuple.metadata.get(key) != value
+                for key, value in filter.items()
+            ):
+                continue
+            count += 1
+            yield checkpoint_tuple
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """
+        Stores a checkpoint, compacting old checkpoints every `compact_every` writes.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        saved = checkpoint.copy()
+        saved.pop("pending_sends", None)
+        checkpoint_type, serialized_checkpoint = self.serde.dumps_typed(saved)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(metadata)
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    thread_id,
+                    checkpoint_ns,
+                    checkpoint["id"],
+                    config["configurable"].get("checkpoint_id"),
+                    checkpoint_type,
+                    serialized_checkpoint,
+                    metadata_type,
+                    serialized_metadata,
+                ),
+            )
+            self.cache.pop((thread_id, checkpoint_ns), None)
+            self.puts_since_compaction += 1
+            if self.puts_since_compaction >= self.compact_every:
+                self.compact()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """
+        Stores the pending writes of a task against a checkpoint.
+        Regular writes are kept if already present, special writes (errors, interrupts) are replaced.
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        with self.lock, self.connection:
+            for idx, (channel, value) in enumerate(writes):
+                write_idx = WRITES_IDX_MAP.get(channel, idx)
+                statement = (
+                    "INSERT OR IGNORE" if write_idx >= 0 else "INSERT OR REPLACE"
+                )
+                self.connection.execute(
+                    f"{statement} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint_id,
+                        task_id,
+                        write_idx,
+                        channel,
+                        *self.serde.dumps_typed(value),
+                    ),
+                )
+            self.cache.pop((thread_id, checkpoint_ns), None)
+
+    def compact(self) -> int:
+        """
+        Deletes every checkpoint, and its writes, older than the latest `retention` of its thread.
+        Returns the number of checkpoints deleted.
+        """
+        with self.lock, self.connection:
+            deleted = self.connection.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                        ) AS position FROM checkpoints
+                    ) WHERE position > ?
+                )
+                """,
+                (self.retention,),
+            ).rowcount
+            self.connection.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints
+                    WHERE checkpoints.thread_id = writes.thread_id
+                    AND checkpoints.checkpoint_ns = writes.checkpoint_ns
+                    AND checkpoints.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            self.puts_since_compaction = 0
+        log_with_context(logging.DEBUG, f"Compacted {deleted} old checkpoints.")
+        return deleted
+
+    def load_writes(
+        self, thread_id: str, checkpoint_ns: str, row: Tuple
+    ) -> Tuple[List[Tuple], List[Tuple]]:
+        """
+        Returns the serialized pending writes of a stored checkpoint, and the pending
+        sends written against its parent.
+        """
+        query = """
+            SELECT task_id, channel, type, value FROM writes
+            WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?
+            ORDER BY task_id, idx
+        """
+        checkpoint_id, parent_checkpoint_id = row[0], row[1]
+        writes = self.connection.execute(
+            query, (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        sends = list()
+        if parent_checkpoint_id:
+            sends = [
+                write
+                for write in self.connection.execute(
+                    query, (thread_id, checkpoint_ns, parent_checkpoint_id)
+                ).fetchall()
+                if write[1] == TASKS
+            ]
+        return writes, sends
+
+    def to_tuple(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        row: Tuple,
+        writes: List[Tuple],
+        sends: List[Tuple],
+    ) -> CheckpointTuple:
+        """
+        Deserializes a stored checkpoint with its pending writes and sends.
+        """
+        (
+            checkpoint_id,
+            parent_checkpoint_id,
+            checkpoint_type,
+            checkpoint,
+            metadata_type,
+            metadata,
+        ) = row
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint={
+                **self.serde.loads_typed((checkpoint_type, checkpoint)),
+                "pending_sends": [
+                    self.serde.loads_typed((value_type, value))
+                    for _, _, value_type, value in sends
+                ],
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """
+        Asynchronous version of get_tuple, run off the event loop.
+        """
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        """
+        Asynchronous version of list, run off the event loop.
+        """
+        checkpoints = await asyncio.to_thread(
+            lambda: [*self.list(config, filter=filter, before=before, limit=limit)]
+        )
+        for checkpoint_tuple in checkpoints:
+            yield checkpoint_tuple
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        """
+        Asynchronous version of put, run off the event loop.
+        """
+        return await asyncio.to_thread(
+            self.put, config, checkpoint, metadata, new_versions
+        )
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """
+        Asynchronous version of put_writes, run off the event loop.
+        """
+        return await asyncio.to_thread(
+            self.put_writes, config, writes, task_id, task_path
+        )
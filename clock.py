@@ -0,0 +1,14 @@
+"""Current date and time context injected into agent prompts"""
+
+import pytz
+from datetime import datetime
+from constants import USER_TIMEZONE
+
+
+def current_datetime_context() -> str:
+    """
+    Describes the current date, day, time and timezone of the user.
+    Minute resolution keeps prompts identical within a minute.
+    """
+    now = datetime.now(pytz.timezone(USER_TIMEZONE))
+    return f"{now.isoformat(timespec='minutes')} ({now.strftime('%A')}), timezone {USER_TIMEZONE}"
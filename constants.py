@@ -7,6 +7,13 @@ SCOPES = ["https://www.googleapis.com/auth/calendar"]
 TOKEN_FILE = "token.json"
 CREDENTIAL_FILE = "credentials.json"
 VALIDATION_PORT = 0
+# Seconds before expiry at which the access token is refreshed in the background.
+CREDENTIALS_REFRESH_MARGIN = 300
+CREDENTIALS_RETRY_INTERVAL = 30
+# Seconds a calendar API request may take.
+HTTP_TIMEOUT = 30
+# Authorized HTTP sessions kept open for calendar API requests, further requests wait for one.
+HTTP_POOL_SIZE = 8
 SERVICE_NAME = "calendar"
 SERVICE_VERSION = "v3"
 
@@ -17,7 +24,122 @@ PRIMARY_CALENDAR = "primary"
     Google Calendar API, AI Model & Prompt constants
 """
 EVENT_LIMIT = 25
+# Inject the current date and time into agent prompts, making the DateTime agent a fallback only.
+INJECT_CLOCK = True
+# Local event store, seeded once and kept current with incremental sync tokens.
+USE_EVENT_STORE = True
+EVENT_STORE_FILE = "events.db"
+# Seconds for which the local store is trusted before pulling the next delta.
+EVENT_STORE_SYNC_INTERVAL = 60
+EVENT_SYNC_PAGE_SIZE = 250
+# Days before and after now seeded by a full sync, queries reaching outside this window go to the API.
+# The window is seeded again once half of its future span has passed.
+EVENT_STORE_PAST_DAYS = 30
+EVENT_STORE_FUTURE_DAYS = 180
+# Background workers prefetching the next page of list requests.
+PREFETCH_WORKERS = 4
+# Calendars queried at once by multi calendar queries.
+CALENDAR_FANOUT_WORKERS = 10
+# Seconds for which the calendar names of multi calendar queries are reused.
+CALENDAR_LIST_TTL = 3600
+# Events inserted per batch HTTP request, the API accepts at most 50 calls per batch.
+CALENDAR_BATCH_SIZE = 50
+# Prefix of the progress lines printed while agents work on a turn.
+PROGRESS_PREFIX = "  ... "
+# Multi agent graph: "supervisor" routes every step through the supervisor model, "plan"
+# plans all tool calls in one model call, runs them in parallel and answers in one more.
+GRAPH_MODE = "supervisor"
+GRAPH_MODES = ["supervisor", "plan"]
+# Most tool calls a plan may run, further ones are dropped.
+MAX_PLAN_STEPS = 8
+# Threads running the tool calls a model requests in one step concurrently.
+TOOL_CALL_WORKERS = 4
+# Model calls a tool agent may make in one turn before it gives up.
+TOOL_AGENT_MAX_STEPS = 15
+# Client side rate limit of calendar API calls, sized to the per user quota of the project.
+CALENDAR_QPS = 10
+CALENDAR_BURST = 20
+# Attempts per calendar request, retries back off exponentially with full jitter.
+RETRY_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8
+# Consecutive failures opening the circuit breaker, and seconds before it lets a trial request through.
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+# Threads running blocking calendar calls for the asyncio execution path.
+CALENDAR_IO_WORKERS = 16
+# Conversation checkpoints, persisted across restarts.
+CHECKPOINT_DB_FILE = "checkpoints.db"
+# Checkpoints kept per conversation thread, older ones are compacted away.
+CHECKPOINT_RETENTION = 20
+CHECKPOINT_COMPACT_EVERY = 50
+# Threads whose latest checkpoint is cached in memory.
+CHECKPOINT_CACHE_SIZE = 128
+# Supervisor decides through a forced function call constrained to the workers (native structured
+# output) instead of JSON text following format instructions.
+STRUCTURED_SUPERVISOR = True
+# Minimum confidence for the fast-path router to skip the LLM supervisor.
+ROUTER_CONFIDENCE_THRESHOLD = 0.85
+# Per turn budgets of supervisor hops and LLM tokens (counted by tracing), and the most times
+# a turn may route to the same worker, past which the turn is handed to Communicate.
+MAX_HOPS_PER_TURN = 8
+MAX_TOKENS_PER_TURN = 60000
+ROUTE_REPEAT_LIMIT = 2
+# Agent history note telling Communicate the turn was stopped early.
+EARLY_STOP_NOTE = "Stopped before the task was complete ({reason}). Answer with the results gathered so far and tell the user what is missing."
+# Chat model responses cached in memory, dropped whenever calendar data changes.
+USE_LLM_CACHE = True
+LLM_CACHE_SIZE = 512
+# Seconds a cached response stays valid.
+LLM_CACHE_TTL = 600
+# Local sentence embedding model for similar prompt lookups, None disables the semantic tier.
+LLM_CACHE_EMBEDDING_MODEL = None
+LLM_CACHE_SIMILARITY_THRESHOLD = 0.95
+# Most recent agent history entries sent to the agents verbatim, older ones are folded into a rolling summary.
+HISTORY_WINDOW = 6
+# Entries outside the window that trigger a summary update, so the summary is not rewritten on every hop.
+HISTORY_SUMMARY_BATCH = 4
+# Agent history entries already folded into the summary that are kept in the graph state.
+HISTORY_MAX_ENTRIES = 40
+# Conversation messages kept in the graph state, older turns are dropped from the checkpoints.
+HISTORY_MAX_MESSAGES = 20
+# Rough characters per token, used to estimate prompt sizes.
+CHARS_PER_TOKEN = 4
+
+"""
+    Server constants
+"""
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+# Turns processed at once across all sessions, further turns wait for a free slot.
+SERVER_MAX_CONCURRENT_TURNS = 32
+# Seconds a turn may wait for a free slot before it is rejected as overloaded.
+SERVER_QUEUE_TIMEOUT = 10
+# Turns a single session may have in flight, each session maps to one checkpoint thread.
+SESSION_MAX_CONCURRENT_TURNS = 1
+# Sessions whose turn limiter the server keeps, the least recently used idle ones are dropped beyond it.
+SERVER_MAX_SESSIONS = 10000
+# Seconds after its last turn an idle session is dropped, its checkpoints are kept.
+SESSION_IDLE_TTL = 3600
+# Graph events buffered per websocket before the graph waits for the client to read.
+WS_SEND_QUEUE_SIZE = 16
+# Upper bound of events loaded into an interval index for conflict / free slot queries.
+EVENT_INDEX_LIMIT = 2500
+# Days covered by aggregation tools when no end date time is given.
+AGGREGATION_DEFAULT_DAYS = 7
+FREE_SLOT_SEARCH_DAYS = 14
+# Working hours (start hour, end hour) in the users timezone, used when looking for a free slot.
+WORK_DAY_HOURS = (9, 18)
 USER_TIMEZONE = "Asia/Kolkata"
+# Logging: level, and "text" or "json" (one object per line) output.
+LOGGER_NAME = "jarvis"
+LOG_LEVEL = "INFO"
+LOG_FORMAT = "text"
+# Tracing of graph nodes, LLM, tool and calendar API calls: on / off, spans kept for export,
+# and the latency histogram buckets (seconds) of the Prometheus export.
+TRACING = True
+TRACE_MAX_SPANS = 10000
+TRACE_LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
 MODEL = "gemini-1.5-flash-latest"
 GREET = """ 
     Hi! Just like every Tony Stark needs a Jarvis,
@@ -28,7 +150,13 @@ GREET = """
 SYSTEM_PROMPT = "You are a Jarvis, a helpful assistant managing users calendars and day to day events. Please ask clarifying questions only if needed."
 EVENT_INFO_PREFIX = "Here are the calendar events for the users: \n"
 CALENDAR_INFO_PREFIX = "Here are the different calendars for the user: \n"
-FILTERED_EVENT_FIELDS = ["summary", "description", "attendees"]
+FILTERED_EVENT_FIELDS = ["summary", "calendar", "description", "attendees"]
+# Serialize events for the LLM as a table with relative dates instead of one field per line.
+COMPACT_EVENT_FORMAT = True
+COMPACT_EVENT_HEADER = "Calendar events, times in {timezone}, today is {today}:"
+# Tokens shared by all event descriptions of a compact listing, descriptions get dropped below the minimum share.
+EVENT_DESCRIPTION_TOKEN_BUDGET = 400
+EVENT_DESCRIPTION_MIN_CHARS = 24
 FILTERED_CALENDAR_FIELDS = ["id", "summary", "description", "kind"]
 DATETIME_AGENT_SYSTEM_PROMPT = """ 
     You are a date time assistant for a calendar app having tools to fetch current day, date and time.
@@ -43,11 +171,31 @@ CALENDAR_AGENT_SYSTEM_PROMPT = """
     schedule events based on users queries. Use your tools to answer questions. 
     If you do not have a tool to answer the question, say so. 
 """
+PLANNER_SYSTEM_PROMPT = """
+    You are called Jarvis, an assistant managing users calendars and day to day events.
+    Plan how to answer the users request: call every tool the answer needs, all in this one response.
+    The calls run in parallel, so never make a call whose arguments depend on the result of another one.
+    If the request needs no tool, answer it directly.
+    Results of earlier requests, if any: \n{agent_history}\n
+"""
 COMMUNICATOR_SYSTEM_PROMPT = """
     You are called Jarvis, a talkative and helpful assistant managing users calendars and day to day events with help from other agents.
     You can use the agent history below to answer to users queries. 
     The agent history is as follows: \n{agent_history}\n
 """
+CLOCK_PROMPT = """
+    The current date and time is {current_datetime}.
+"""
+SUPERVISOR_CLOCK_PROMPT = """
+    Every worker already knows the current date and time, route to DateTime only if the date or time cannot be worked out otherwise.
+"""
+# Compact supervisor prompt of the structured output supervisor, the choice of worker is
+# constrained by the schema of the function it has to call instead of format instructions.
+SUPERVISOR_ROUTE_PROMPT = """
+    You are a supervisor of a crew of workers: {members}. Each worker performs a task and reports its results.
+    Given the user request and the crew responses below, call route with the worker to act next.
+    Route to Communicate once the task is done end to end, to deliver the result to the user.
+"""
 SUPERVISOR_PROMPT = """
     You are a supervisor tasked with managing a conversation between the
     crew of workers:  {members}. Given the following user request, and crew responses respond with the worker to act next.
@@ -57,6 +205,13 @@ SUPERVISOR_PROMPT = """
     Select one of: {options} 
     \n{format_instructions}\n
 """
+HISTORY_SUMMARY_PROMPT = """
+    You maintain a running summary of the work done by a crew of calendar assistants.
+    Update the summary with the new crew responses below. Keep every fact needed to answer
+    the user (dates, times, event names, attendees, decisions), drop everything else. Be brief.
+    Current summary: \n{summary}\n
+    New crew responses: \n{history}\n
+"""
 HUMAN_AGENT_PROMPT = """
     You are a clarifier, Based on the responses by other agents you ask clarifying questions from the user to fill out missing information
     required for completing the task. If there is any ambiguity or wrong assumptions by other agents, ask clarifying questions to the user to resolve those.
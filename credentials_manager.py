@@ -0,0 +1,226 @@
+"""Google credentials kept fresh in the background, with a pool of keep-alive HTTP sessions"""
+
+import os.path
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import List, Optional
+import httplib2
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from constants import (
+    CREDENTIAL_FILE,
+    CREDENTIALS_REFRESH_MARGIN,
+    CREDENTIALS_RETRY_INTERVAL,
+    HTTP_POOL_SIZE,
+    HTTP_TIMEOUT,
+    SCOPES,
+    TOKEN_FILE,
+    VALIDATION_PORT,
+)
+from logger import log_with_context, logging
+
+
+class HttpSessionPool:
+    """
+    Authorized HTTP sessions shared by the threads calling the API, standing in
+    for the http object of a service. httplib2 is not thread safe, so every request
+    checks a session out for its duration, idle sessions keep their connections
+    alive for the next one. At most `size` sessions are opened, further requests
+    wait for one to be returned.
+    """
+
+    def __init__(
+        self, credentials_manager: "CredentialsManager", size: int = HTTP_POOL_SIZE
+    ) -> None:
+        """
+        Sets up an empty pool, sessions are opened on demand.
+        """
+        self.credentials_manager = credentials_manager
+        self.size = size
+        # the most recently used session first, its connections are the likeliest to be open.
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    @property
+    def credentials(self) -> Credentials:
+        """
+        The credentials the sessions authorize with, googleapiclient reads them for batch requests.
+        """
+        return self.credentials_manager.credentials
+
+    def checkout(self) -> AuthorizedHttp:
+        """
+        Takes an idle session, opens a new one while under `size`, or waits for one.
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            can_open = self.opened < self.size
+            if can_open:
+                self.opened += 1
+        if not can_open:
+            return self.idle.get()
+        try:
+            return AuthorizedHttp(
+                self.credentials, http=httplib2.Http(timeout=HTTP_TIMEOUT)
+            )
+        except BaseException:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    @contextmanager
+    def session(self):
+        """
+        Checks a session out for the duration of the block.
+        """
+        http = self.checkout()
+        try:
+            yield http
+        finally:
+            self.idle.put(http)
+
+    def request(self, *args, **kwargs):
+        """
+        Sends a request on a checked out session, the call googleapiclient makes on its http object.
+        """
+        with self.session() as http:
+            return http.request(*args, **kwargs)
+
+    def close(self) -> None:
+        """
+        Closes the idle sessions.
+        """
+        while True:
+            try:
+                http = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.opened -= 1
+            http.close()
+
+
+class CredentialsManager:
+    """
+    Owns the OAuth credentials of the user.
+    Credentials are set up on first use and then refreshed by a background thread
+    CREDENTIALS_REFRESH_MARGIN seconds before they expire, so requests never wait
+    on a token refresh. Requests go through a pool of authorized HTTP sessions.
+    """
+
+    def __init__(
+        self,
+        token_file: str = TOKEN_FILE,
+        credential_file: str = CREDENTIAL_FILE,
+        scopes: List[str] = SCOPES,
+        refresh_margin: float = CREDENTIALS_REFRESH_MARGIN,
+    ) -> None:
+        """
+        Sets up the manager, no credentials are loaded until they are needed.
+        """
+        self.token_file = token_file
+        self.credential_file = credential_file
+        self.scopes = scopes
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        self.creds = None
+        self.lock = threading.RLock()
+        self.http_pool = HttpSessionPool(self)
+        self.stopped = threading.Event()
+        self.refresher = None
+
+    @property
+    def credentials(self) -> Credentials:
+        """
+        The users credentials, set up on first access.
+        """
+        with self.lock:
+            if self.creds is None:
+                self.creds = self.load()
+                self.start()
+            return self.creds
+
+    def load(self) -> Credentials:
+        """
+        Loads the credentials from the token file, refreshing them if expired.
+        Runs the OAuth flow when there are no usable credentials.
+        """
+        creds = None
+        if os.path.exists(self.token_file):
+            creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
+        if creds and creds.valid:
+            return creds
+        if creds and creds.expired and creds.refresh_token:
+            creds.refresh(Request())
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                self.credential_file, self.scopes
+            )
+            creds = flow.run_local_server(port=VALIDATION_PORT)
+        self.save(creds)
+        return creds
+
+    def save(self, creds: Credentials) -> None:
+        """
+        Persists the credentials, so the next run starts with a fresh token.
+        """
+        with open(self.token_file, "w") as token:
+            token.write(creds.to_json())
+
+    def refresh(self) -> None:
+        """
+        Refreshes the access token.
+        """
+        with self.lock:
+            self.creds.refresh(Request())
+            self.save(self.creds)
+        log_with_context(logging.DEBUG, "Refreshed Google credentials.")
+
+    def seconds_until_refresh(self) -> Optional[float]:
+        """
+        Seconds until the token is due for a refresh, None if it never expires.
+        """
+        if self.creds.expiry is None:
+            return None
+        # google-auth keeps expiry as a naive UTC datetime.
+        refresh_at = self.creds.expiry - self.refresh_margin
+        return max((refresh_at - datetime.utcnow()).total_seconds(), 0)
+
+    def start(self) -> None:
+        """
+        Starts the background refresher, once.
+        """
+        if self.refresher is not None or not self.creds.refresh_token:
+            return
+        self.refresher = threading.Thread(
+            target=self.refresh_loop, name="credentials-refresh", daemon=True
+        )
+        self.refresher.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background refresher.
+        """
+        self.stopped.set()
+
+    def refresh_loop(self) -> None:
+        """
+        Refreshes the token ahead of its expiry until stopped, retrying failed refreshes.
+        """
+        delay = self.seconds_until_refresh()
+        while delay is not None and not self.stopped.wait(delay):
+            try:
+                self.refresh()
+                delay = self.seconds_until_refresh()
+            except Exception as err:
+                log_with_context(
+                    logging.WARNING, f"Cannot refresh Google credentials: {err}"
+                )
+                delay = CREDENTIALS_RETRY_INTERVAL
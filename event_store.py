@@ -0,0 +1,314 @@
+"""Local event store for google calendar kept current through incremental sync tokens"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Optional, Tuple
+from googleapiclient.errors import HttpError
+from constants import (
+    EVENT_STORE_FILE,
+    EVENT_STORE_FUTURE_DAYS,
+    EVENT_STORE_PAST_DAYS,
+    EVENT_STORE_SYNC_INTERVAL,
+    EVENT_SYNC_PAGE_SIZE,
+)
+from pagination import iter_pages
+from resilience import RequestExecutor, calendar_requests
+from parser import event_datetime, to_datetime
+from logger import log_with_context, logging
+
+# Status returned by the API when a sync token is no longer valid.
+SYNC_TOKEN_EXPIRED = 410
+
+
+class EventStore:
+    """
+    Persistent index of calendar events.
+    The first sync pulls the events of a calendar from `past_days` before to
+    `future_days` after now, later syncs only pull the changes since the stored
+    sync token. Range queries within that window are answered locally, the
+    others are left to the API. The window is seeded again once half of its
+    future span has passed.
+    """
+
+    def __init__(
+        self,
+        path: str = EVENT_STORE_FILE,
+        sync_interval: float = EVENT_STORE_SYNC_INTERVAL,
+        past_days: float = EVENT_STORE_PAST_DAYS,
+        future_days: float = EVENT_STORE_FUTURE_DAYS,
+    ) -> None:
+        """
+        Opens (or creates) the store at `path`. Use ":memory:" for a throwaway store.
+        """
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        # one sync per calendar at a time, without blocking queries during the API calls.
+        self.sync_locks = defaultdict(threading.Lock)
+        self.sync_interval = sync_interval
+        self.past_days = past_days
+        self.future_days = future_days
+        self.last_sync = dict()
+        self.create_tables()
+
+    def create_tables(self) -> None:
+        """
+        Creates the event and sync state tables if missing.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    start_ts REAL NOT NULL,
+                    end_ts REAL NOT NULL,
+                    body TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, event_id)
+                )
+                """
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS events_range ON events (calendar_id, start_ts, end_ts)"
+            )
+            self.connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    calendar_id TEXT PRIMARY KEY,
+                    sync_token TEXT
+                )
+                """
+            )
+            columns = {
+                row[1]
+                for row in self.connection.execute("PRAGMA table_info(sync_state)")
+            }
+            # stores synced before the window existed are seeded again.
+            for column in ["window_start", "window_end"]:
+                if column not in columns:
+                    self.connection.execute(
+                        f"ALTER TABLE sync_state ADD COLUMN {column} REAL"
+                    )
+
+    def get_sync_state(
+        self, calendar: str
+    ) -> Tuple[Optional[str], Optional[Tuple[float, float]]]:
+        """
+        Returns the stored sync token of a calendar and the window its full sync
+        covered, as timestamps. Both are None if it was never synced.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT sync_token, window_start, window_end FROM sync_state WHERE calendar_id = ?",
+                (calendar,),
+            ).fetchone()
+        if row is None or row[1] is None or row[2] is None:
+            return None, None
+        return row[0], (row[1], row[2])
+
+    def next_window(self) -> Tuple[datetime, datetime]:
+        """
+        Returns the window a full sync starting now covers.
+        """
+        now = datetime.now(timezone.utc)
+        return (
+            now - timedelta(days=self.past_days),
+            now + timedelta(days=self.future_days),
+        )
+
+    def refresh(
+        self,
+        service,
+        calendar: str,
+        force: bool = False,
+        requests: RequestExecutor = calendar_requests,
+    ) -> int:
+        """
+        Syncs a calendar unless it was synced within the last `sync_interval` seconds,
+        its pages are requested through `requests`.
+        Concurrent callers wait for the sync in flight instead of starting another.
+        Returns the number of events that changed.
+        """
+        with self.sync_locks[calendar]:
+            last_sync = self.last_sync.get(calendar)
+            if (
+                not force
+                and last_sync is not None
+                and time.monotonic() - last_sync < self.sync_interval
+            ):
+                return 0
+            return self.sync(service, calendar, requests)
+
+    def sync(self, service, calendar: str, requests: RequestExecutor) -> int:
+        """
+        Pulls the changes of a calendar since the last sync and applies them to the store.
+        Falls back to a full sync of a new window when there is no token yet, the
+        stored one has expired, or half of the stored window's future span has passed.
+        Returns the number of events that changed.
+        """
+        sync_token, window = self.get_sync_state(calendar)
+        if window is not None and time.time() > window[1] - (
+            self.future_days * 86400 / 2
+        ):
+            log_with_context(
+                logging.INFO,
+                f"Event store window of {calendar} ran out, seeding it again.",
+            )
+            sync_token = None
+        try:
+            changed, deleted, next_token, window = self.pull_changes(
+                service, calendar, sync_token, requests
+            )
+        except HttpError as err:
+            if sync_token is None or err.resp.status != SYNC_TOKEN_EXPIRED:
+                raise
+            log_with_context(
+                logging.INFO, f"Sync token expired for {calendar}, running full sync."
+            )
+            self.clear(calendar)
+            sync_token = None
+            changed, deleted, next_token, window = self.pull_changes(
+                service, calendar, None, requests
+            )
+
+        with self.lock, self.connection:
+            if sync_token is None:
+                self.connection.execute(
+                    "DELETE FROM events WHERE calendar_id = ?", (calendar,)
+                )
+            self.connection.executemany(
+                "DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                [(calendar, event_id) for event_id in deleted],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                [self.to_row(calendar, event) for event in changed],
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)",
+                (calendar, next_token, *window),
+            )
+        self.last_sync[calendar] = time.monotonic()
+        log_with_context(
+            logging.DEBUG,
+            f"Synced {calendar}: {len(changed)} updated, {len(deleted)} deleted.",
+        )
+        return len(changed) + len(deleted)
+
+    def pull_changes(
+        self,
+        service,
+        calendar: str,
+        sync_token: Optional[str],
+        requests: RequestExecutor,
+    ) -> Tuple[List[Dict], List[str], Optional[str], Tuple[float, float]]:
+        """
+        Reads every page of changes from the API, of a new window without a sync token.
+        Returns the updated events, the ids of deleted events, the next sync token
+        and the window covered.
+        """
+        params = {
+            "calendarId": calendar,
+            "singleEvents": True,
+            "maxResults": EVENT_SYNC_PAGE_SIZE,
+        }
+        if sync_token:
+            # time bounds cannot be combined with a sync token, the window stays the one seeded.
+            params["syncToken"] = sync_token
+            window = self.get_sync_state(calendar)[1]
+        else:
+            window_start, window_end = self.next_window()
+            params["timeMin"] = window_start.isoformat()
+            params["timeMax"] = window_end.isoformat()
+            window = (window_start.timestamp(), window_end.timestamp())
+
+        changed, deleted = list(), list()
+        next_token = None
+        for result in iter_pages(
+            lambda page_token: service.events().list(pageToken=page_token, **params),
+            requests,
+        ):
+            for event in result.get("items", []):
+                if event.get("status") == "cancelled":
+                    deleted.append(event["id"])
+                else:
+                    changed.append(event)
+            # only the last page carries the next sync token.
+            next_token = result.get("nextSyncToken")
+        return changed, deleted, next_token, window
+
+    def upsert(self, calendar: str, events: List[Dict]) -> None:
+        """
+        Writes events into the store, e.g. ones just created through the API.
+        """
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)",
+                [self.to_row(calendar, event) for event in events],
+            )
+
+    def clear(self, calendar: str) -> None:
+        """
+        Drops every event and the sync token of a calendar.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM events WHERE calendar_id = ?", (calendar,)
+            )
+            self.connection.execute(
+                "DELETE FROM sync_state WHERE calendar_id = ?", (calendar,)
+            )
+        self.last_sync.pop(calendar, None)
+
+    def query(
+        self,
+        calendar: str,
+        after_date_time: Optional[str],
+        before_start_time: Optional[str],
+        count_events: int,
+    ) -> Optional[List[Dict]]:
+        """
+        Returns up to `count_events` events ordered by start time, which end after
+        `after_date_time` and start before `before_start_time` (same semantics as
+        timeMin / timeMax of the events list API).
+        Returns None when the answer may need events outside the synced window.
+        """
+        window = self.get_sync_state(calendar)[1]
+        if window is None:
+            return None
+        after = to_datetime(after_date_time)
+        before = to_datetime(before_start_time)
+        after_ts = after.timestamp() if after else float("-inf")
+        before_ts = before.timestamp() if before else float("inf")
+        if after_ts < window[0]:
+            return None
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT body FROM events
+                WHERE calendar_id = ? AND end_ts > ? AND start_ts < ?
+                ORDER BY start_ts LIMIT ?
+                """,
+                (calendar, after_ts, min(before_ts, window[1]), count_events),
+            ).fetchall()
+        # events missing from the store start after the window, so a range reaching
+        # past it is only complete once the window alone filled the answer.
+        if before_ts > window[1] and len(rows) < count_events:
+            return None
+        return [json.loads(row[0]) for row in rows]
+
+    @staticmethod
+    def to_row(calendar: str, event: Dict) -> Tuple:
+        """
+        Converts an event to a row of the events table.
+        """
+        return (
+            calendar,
+            event["id"],
+            event_datetime(event, "start").timestamp(),
+            event_datetime(event, "end").timestamp(),
+            json.dumps(event),
+        )
@@ -1,98 +1,275 @@
 """Wrapper client for google calendar"""
 
 from datetime import datetime
-import os.path
+import functools
+import heapq
+import json
+import threading
+import time
 import pytz
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
-from typing import List, Dict
+from itertools import islice
+from typing import Callable, List, Dict, Iterator, Optional
 from constants import *
+from credentials_manager import CredentialsManager
+from event_store import EventStore
+from pagination import iter_items
+from resilience import CircuitOpenError, RequestExecutor, calendar_requests
+from parser import event_datetime
 from logger import log_with_context, logging
 
 
+@functools.lru_cache(maxsize=None)
+def discovery_document() -> Dict:
+    """
+    The Calendar API discovery document bundled with googleapiclient, parsed once per process.
+    Building services from it avoids fetching the document over the network.
+    """
+    return json.loads(get_static_doc(SERVICE_NAME, SERVICE_VERSION))
+
+
 class GoogleCalendarClient:
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        service=None,
+        event_store: Optional[EventStore] = None,
+        credentials_manager: Optional[CredentialsManager] = None,
+        request_executor: Optional[RequestExecutor] = None,
+    ) -> None:
         """
         Initializes the GoogleCalendarClient instance.
-        Sets up the token and builds the service.
+        The token is set up and the service built lazily on first use, unless a
+        `service` (e.g. a fake one) is passed in, so creating the client is cheap.
+        Range queries are served from `event_store` when enabled.
+        API calls go through `request_executor`, the process wide one by default.
         """
-        self.setup_token()
-        self.build_service()
+        self.shared_service = service
+        self.service_lock = threading.Lock()
+        self.credentials_manager = credentials_manager or CredentialsManager()
+        self.requests = request_executor or calendar_requests
+        self.fanout_executor = ThreadPoolExecutor(
+            max_workers=CALENDAR_FANOUT_WORKERS, thread_name_prefix="calendar-fanout"
+        )
+        if event_store is None and USE_EVENT_STORE:
+            event_store = EventStore()
+        self.event_store = event_store
+        self.change_listeners = list()
+        # (expiry, calendar summaries by id) of the last calendar list fetched.
+        self.calendar_names_cache = (0, dict())
         log_with_context(logging.INFO, "Google Calendar client setup done.")
-        pass
 
-    def setup_token(self) -> None:
+    def add_change_listener(self, listener: Callable[[str], None]) -> None:
         """
-        Sets up the credentials for accessing the Google Calendar API.
-        If a valid token file exists, it loads the credentials from the file.
-        If the credentials are expired or do not exist, it initiates the OAuth flow to obtain new credentials.
+        Registers a callback invoked with the calendar id whenever its events are seen to change,
+        either by a sync pulling changes or by an event created through this client.
         """
-        self.creds = None
-        if os.path.exists(TOKEN_FILE):
-            self.creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
-        if not self.creds or not self.creds.valid:
-            if self.creds and self.creds.expired and self.creds.refresh_token:
-                self.creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    CREDENTIAL_FILE, SCOPES
-                )
-                self.creds = flow.run_local_server(port=VALIDATION_PORT)
+        self.change_listeners.append(listener)
 
-                with open(TOKEN_FILE, "w") as token:
-                    token.write(self.creds.to_json())
+    def notify_change(self, calendar: str) -> None:
+        """
+        Invokes the change listeners for a calendar.
+        """
+        for listener in self.change_listeners:
+            listener(calendar)
+
+    def warm_up(self) -> None:
+        """
+        Sets up the token and builds the service ahead of the first request.
+        """
+        if self.shared_service is None:
+            self.credentials_manager.credentials
+            self.calendar_service
 
-    def build_service(self) -> None:
+    def build_service(self):
         """
-        Builds the Google Calendar API service using the credentials.
+        Builds the Google Calendar API service on the pooled authorized HTTP sessions.
         """
         try:
-            self.calendar_service = build(
-                SERVICE_NAME, SERVICE_VERSION, credentials=self.creds
+            return build_from_document(
+                discovery_document(), http=self.credentials_manager.http_pool
             )
         except HttpError as err:
             raise Exception(f"Cannot connect to the service: {err}")
 
+    @property
+    def calendar_service(self):
+        """
+        The Google Calendar API service, built on first use and shared by all threads.
+        """
+        if self.shared_service is None:
+            with self.service_lock:
+                if self.shared_service is None:
+                    self.shared_service = self.build_service()
+        return self.shared_service
+
     def fetch_calendar_events(
         self,
         count_events: int,
         after_date_time: str,
         before_start_time: str,
         calendar: str = PRIMARY_CALENDAR,
+        limit: int = EVENT_LIMIT,
     ) -> List[Dict]:
         """
         Fetches input number of events from a specific calendar after a certain date time.
+        At most `limit` events are returned.
         """
-        orderByField = "startTime"
-        if after_date_time is None:
-            orderByField = "endTime"
+        count_events = min(count_events, limit)
+        if self.event_store is not None:
+            try:
+                if self.event_store.refresh(
+                    self.calendar_service, calendar, requests=self.requests
+                ):
+                    self.notify_change(calendar)
+                events = self.event_store.query(
+                    calendar,
+                    after_date_time,
+                    before_start_time,
+                    count_events,
+                )
+                if events is not None:
+                    return events
+                log_with_context(
+                    logging.DEBUG,
+                    "Range reaches outside the event store window, querying the API directly.",
+                )
+            except (HttpError, CircuitOpenError) as err:
+                log_with_context(
+                    logging.ERROR,
+                    f"Cannot sync event store: {err}. Querying the API directly.",
+                )
+
         try:
             log_with_context(
                 logging.DEBUG,
                 f"fetch_calendar_events({count_events}, {after_date_time}, {before_start_time})",
             )
-            events_result = (
-                self.calendar_service.events()
-                .list(
-                    calendarId=calendar,
-                    timeMin=after_date_time,
-                    timeMax=before_start_time,
-                    maxResults=min(count_events, EVENT_LIMIT),
-                    singleEvents=True,
-                    orderBy=orderByField,
+            return list(
+                islice(
+                    self.iter_calendar_events(
+                        after_date_time=after_date_time,
+                        before_start_time=before_start_time,
+                        calendar=calendar,
+                        page_size=min(count_events, EVENT_SYNC_PAGE_SIZE),
+                    ),
+                    count_events,
                 )
-                .execute()
             )
-            events = events_result.get("items", [])
-            return events
-        except HttpError as err:
+        except (HttpError, CircuitOpenError) as err:
             log_with_context(
                 logging.ERROR,
                 f"Cannot fetch calendar entries: {err}. Please try again later!",
             )
+            return list()
+
+    def iter_calendar_events(
+        self,
+        after_date_time: str,
+        before_start_time: str,
+        calendar: str = PRIMARY_CALENDAR,
+        page_size: int = EVENT_SYNC_PAGE_SIZE,
+    ) -> Iterator[Dict]:
+        """
+        Lazily streams the events of a specific calendar between two date times, page by page.
+        The next page is prefetched while the current one is consumed, stop iterating to stop fetching.
+        """
+        orderByField = "startTime"
+        if after_date_time is None:
+            orderByField = "endTime"
+        return iter_items(
+            lambda page_token: self.calendar_service.events().list(
+                calendarId=calendar,
+                timeMin=after_date_time,
+                timeMax=before_start_time,
+                maxResults=page_size,
+                singleEvents=True,
+                orderBy=orderByField,
+                pageToken=page_token,
+            ),
+            self.requests,
+        )
+
+    def fetch_events_in_range(
+        self,
+        after_date_time: str,
+        before_start_time: str,
+        calendar: str = PRIMARY_CALENDAR,
+    ) -> List[Dict]:
+        """
+        Fetches all the events of a specific calendar between two date times, up to EVENT_INDEX_LIMIT.
+        Used to build interval indexes, so the result is not capped to EVENT_LIMIT.
+        """
+        return self.fetch_calendar_events(
+            count_events=EVENT_INDEX_LIMIT,
+            after_date_time=after_date_time,
+            before_start_time=before_start_time,
+            calendar=calendar,
+            limit=EVENT_INDEX_LIMIT,
+        )
+
+    def fetch_multi_calendar_events(
+        self,
+        count_events: int,
+        after_date_time: str,
+        before_start_time: str,
+        calendars: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """
+        Fetches input number of events across several calendars (all of the users calendars by default).
+        Calendars are queried concurrently and their events merged by start time.
+        Each event is tagged with the summary of its calendar under `calendar`.
+        """
+        calendar_names = self.calendar_names()
+        if calendars is None:
+            calendars = list(calendar_names)
+
+        futures = [
+            # the copied context carries the correlation id and span of the turn into the pool.
+            self.fanout_executor.submit(
+                copy_context().run,
+                self.fetch_calendar_events,
+                count_events=count_events,
+                after_date_time=after_date_time,
+                before_start_time=before_start_time,
+                calendar=calendar,
+            )
+            for calendar in calendars
+        ]
+        calendar_events = list()
+        for calendar, future in zip(calendars, futures):
+            events = future.result() or list()
+            for event in events:
+                event["calendar"] = calendar_names.get(calendar, calendar)
+            calendar_events.append(events)
+
+        # every calendar is already ordered by start time, k-way merge them.
+        merged = heapq.merge(
+            *calendar_events, key=lambda event: event_datetime(event, "start")
+        )
+        return list(islice(merged, count_events))
+
+    def calendar_names(self) -> Dict[str, str]:
+        """
+        Returns the summaries of the users calendars by id, fetched at most once every
+        CALENDAR_LIST_TTL seconds. A failed fetch is not reused.
+        """
+        expiry, calendar_names = self.calendar_names_cache
+        if time.monotonic() < expiry:
+            return calendar_names
+        calendar_names = {
+            calendar["id"]: calendar.get("summary", calendar["id"])
+            for calendar in self.get_calendar_list()
+        }
+        if calendar_names:
+            self.calendar_names_cache = (
+                time.monotonic() + CALENDAR_LIST_TTL,
+                calendar_names,
+            )
+        return calendar_names
 
     def fetch_upcoming_calendar_events(
         self, count_events: int, calendar: str = PRIMARY_CALENDAR
@@ -111,27 +288,29 @@ class GoogleCalendarClient:
 
     def get_calendar_list(self) -> List[Dict]:
         """
-        Retrieves and prints the list of calendars.
+        Retrieves the list of calendars, empty if it cannot be fetched.
         """
         try:
-            calendar_list = self.calendar_service.calendarList().list().execute()
+            calendar_list = self.requests.execute(
+                self.calendar_service.calendarList().list()
+            )
             calendars = calendar_list.get("items", [])
             return calendars
-        except HttpError as error:
+        except (HttpError, CircuitOpenError) as error:
             log_with_context(logging.ERROR, f"An error occurred: {error}")
+            return list()
 
-    def create_event(
-        self,
+    @staticmethod
+    def build_event(
         start_datetime: str,
         end_datetime: str,
         attendees: List[str] = list(),
         summary: str = "",
         description: str = "",
-        calendar_id: str = PRIMARY_CALENDAR,
         event_type: str = "default",
-    ) -> List[Dict]:
+    ) -> Dict:
         """
-        Create calendar event.
+        Builds the request body of a calendar event.
         """
         event = dict()
         event["start"] = {"dateTime": start_datetime}
@@ -142,17 +321,99 @@ class GoogleCalendarClient:
         event["attendees"] = list()
         for attendee in attendees:
             event["attendees"].append({"email": attendee})
+        return event
+
+    def create_event(
+        self,
+        start_datetime: str,
+        end_datetime: str,
+        attendees: List[str] = list(),
+        summary: str = "",
+        description: str = "",
+        calendar_id: str = PRIMARY_CALENDAR,
+        event_type: str = "default",
+    ) -> List[Dict]:
+        """
+        Create calendar event.
+        """
+        event = self.build_event(
+            start_datetime=start_datetime,
+            end_datetime=end_datetime,
+            attendees=attendees,
+            summary=summary,
+            description=description,
+            event_type=event_type,
+        )
         log_with_context(logging.INFO, f"Event: {event}")
         try:
-            event = (
-                self.calendar_service.events()
-                .insert(calendarId=calendar_id, body=event)
-                .execute()
+            event = self.requests.execute(
+                self.calendar_service.events().insert(
+                    calendarId=calendar_id, body=event
+                )
             )
+            if self.event_store is not None:
+                self.event_store.upsert(calendar_id, [event])
+            self.notify_change(calendar_id)
             return event
-        except HttpError as err:
+        except (HttpError, CircuitOpenError) as err:
             log_with_context(
                 logging.ERROR,
                 f"Cannot create calendar entry: {err}. Please try again later!",
             )
             raise Exception(err)
+
+    def create_events(
+        self, events: List[Dict], calendar_id: str = PRIMARY_CALENDAR
+    ) -> List[Dict]:
+        """
+        Create many calendar events from their request bodies (see `build_event`).
+        Inserts are grouped into batch HTTP requests of up to CALENDAR_BATCH_SIZE events,
+        and no more than the rate limiter burst since every insert uses quota.
+        Returns one result per input event, in order, holding either the created
+        `event` or the `error` it failed with.
+        """
+        results = [None] * len(events)
+        batch_size = max(
+            min(CALENDAR_BATCH_SIZE, int(self.requests.limiter.capacity)), 1
+        )
+
+        def on_response(request_id: str, response: Dict, exception: Exception):
+            if exception is not None:
+                results[int(request_id)] = {"error": str(exception)}
+            else:
+                results[int(request_id)] = {"event": response}
+
+        for offset in range(0, len(events), batch_size):
+            chunk = range(offset, min(offset + batch_size, len(events)))
+            batch = self.calendar_service.new_batch_http_request(callback=on_response)
+            for position in chunk:
+                batch.add(
+                    self.calendar_service.events().insert(
+                        calendarId=calendar_id, body=events[position]
+                    ),
+                    request_id=str(position),
+                )
+            try:
+                self.requests.execute(batch, cost=len(chunk))
+            except Exception as err:
+                # a failed batch fails the events it did not get a response for, not the whole call.
+                log_with_context(
+                    logging.ERROR,
+                    f"Cannot create calendar entries: {err}. Please try again later!",
+                )
+                for position in chunk:
+                    results[position] = results[position] or {"error": str(err)}
+
+        results = [
+            result or {"error": "No response from the Calendar API."}
+            for result in results
+        ]
+        created = [result["event"] for result in results if "event" in result]
+        log_with_context(
+            logging.INFO, f"Created {len(created)} of {len(events)} events in batch."
+        )
+        if self.event_store is not None:
+            self.event_store.upsert(calendar_id, created)
+        if created:
+            self.notify_change(calendar_id)
+        return results
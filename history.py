@@ -0,0 +1,177 @@
+"""Agent history compaction: a sliding window of recent entries plus a rolling summary"""
+
+import threading
+from itertools import takewhile
+from typing import Callable, Dict, List, Sequence
+from langchain_core.messages import AIMessage, BaseMessage, RemoveMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import PromptTemplate
+from constants import (
+    CHARS_PER_TOKEN,
+    HISTORY_MAX_ENTRIES,
+    HISTORY_SUMMARY_BATCH,
+    HISTORY_SUMMARY_PROMPT,
+    HISTORY_WINDOW,
+)
+from logger import log_with_context, logging
+
+SUMMARY_NAME = "Summary"
+
+
+def estimate_tokens(value) -> int:
+    """
+    Rough token count of a value, from the length of its string form.
+    """
+    return len(str(value)) // CHARS_PER_TOKEN
+
+
+def strip_message(message: BaseMessage) -> AIMessage:
+    """
+    Returns a copy of an agent history entry without its raw intermediate steps.
+    """
+    return AIMessage(content=message.content, name=message.name)
+
+
+def keep_last(limit: int) -> Callable:
+    """
+    Returns a state channel reducer appending new messages and keeping the last `limit`.
+    """
+
+    def reducer(
+        messages: Sequence[BaseMessage], new_messages: Sequence[BaseMessage]
+    ) -> List[BaseMessage]:
+        return (list(messages) + list(new_messages))[-limit:]
+
+    return reducer
+
+
+def render_history(messages: Sequence[BaseMessage]) -> str:
+    """
+    Renders history entries as `<agent>: <response>` lines for string prompts.
+    """
+    return "\n".join(
+        f"{message.name or message.type}: {message.content}" for message in messages
+    )
+
+
+class HistoryCompactor:
+    """
+    Builds the agent history view sent downstream: a rolling summary of older
+    entries followed by the last `window` entries, stripped of intermediate steps.
+    The summary and the number of entries folded into it live in the graph state
+    (`history_summary`, `summarized_upto`). Folded entries are kept in `agent_history`
+    up to `max_entries`, older ones are removed from it when the summary is updated.
+    """
+
+    def __init__(
+        self,
+        llm,
+        window: int = HISTORY_WINDOW,
+        summary_batch: int = HISTORY_SUMMARY_BATCH,
+        max_entries: int = HISTORY_MAX_ENTRIES,
+    ) -> None:
+        """
+        Sets up the summarization chain on `llm`.
+        """
+        self.window = window
+        self.summary_batch = summary_batch
+        self.max_entries = max_entries
+        self.summary_chain = (
+            PromptTemplate(
+                template=HISTORY_SUMMARY_PROMPT,
+                input_variables=["summary", "history"],
+            )
+            | llm
+            | StrOutputParser()
+        )
+        self.lock = threading.Lock()
+        self.stats = {"full_tokens": 0, "sent_tokens": 0, "summaries": 0}
+
+    def pending(self, state: Dict) -> List[BaseMessage]:
+        """
+        Returns the entries due to be folded into the summary, empty until a full batch has left the window.
+        """
+        history = state.get("agent_history") or list()
+        summarized_upto = state.get("summarized_upto") or 0
+        pending = history[summarized_upto : max(len(history) - self.window, 0)]
+        return pending if len(pending) >= self.summary_batch else list()
+
+    def summary_input(self, state: Dict, pending: List[BaseMessage]) -> Dict:
+        """
+        Input of the summarization chain.
+        """
+        return {
+            "summary": state.get("history_summary") or "None yet.",
+            "history": render_history(pending),
+        }
+
+    def summary_update(self, state: Dict, pending: List[BaseMessage], summary: str):
+        """
+        State update recording a new summary, and removing the oldest folded entries
+        beyond `max_entries`.
+        """
+        with self.lock:
+            self.stats["summaries"] += 1
+        log_with_context(
+            logging.DEBUG, f"Folded {len(pending)} agent history entries into summary."
+        )
+        history = state.get("agent_history") or list()
+        summarized_upto = (state.get("summarized_upto") or 0) + len(pending)
+        excess = min(summarized_upto, len(history) - self.max_entries)
+        # entries of checkpoints written before the channel assigned ids cannot be removed.
+        dropped = list(takewhile(lambda message: message.id, history[: max(excess, 0)]))
+        update = {
+            "history_summary": summary,
+            "summarized_upto": summarized_upto - len(dropped),
+        }
+        if dropped:
+            update["agent_history"] = [
+                RemoveMessage(id=message.id) for message in dropped
+            ]
+        return update
+
+    def compact(self, state: Dict) -> Dict:
+        """
+        Folds the entries that left the window into the rolling summary.
+        Returns the state update, empty when no summary is due.
+        """
+        pending = self.pending(state)
+        if not pending:
+            return dict()
+        summary = self.summary_chain.invoke(self.summary_input(state, pending))
+        return self.summary_update(state, pending, summary)
+
+    async def acompact(self, state: Dict) -> Dict:
+        """
+        Asyncio variant of `compact`.
+        """
+        pending = self.pending(state)
+        if not pending:
+            return dict()
+        summary = await self.summary_chain.ainvoke(self.summary_input(state, pending))
+        return self.summary_update(state, pending, summary)
+
+    def view(self, state: Dict) -> List[BaseMessage]:
+        """
+        Returns the compacted agent history to send downstream, recording its size against the full history.
+        """
+        history = state.get("agent_history") or list()
+        summarized_upto = state.get("summarized_upto") or 0
+        view = [strip_message(message) for message in history[summarized_upto:]]
+        if state.get("history_summary"):
+            view.insert(
+                0, AIMessage(content=state["history_summary"], name=SUMMARY_NAME)
+            )
+        with self.lock:
+            self.stats["full_tokens"] += estimate_tokens(history)
+            self.stats["sent_tokens"] += estimate_tokens(render_history(view))
+        return view
+
+    def pop_stats(self) -> Dict[str, int]:
+        """
+        Returns the token counters gathered since the last call and resets them.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            self.stats = dict.fromkeys(self.stats, 0)
+        return stats
@@ -0,0 +1,132 @@
+"""In-memory interval index over calendar events for overlap, conflict and free slot queries"""
+
+import heapq
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Tuple
+from parser import event_datetime
+
+
+class IntervalIndex:
+    """
+    Static augmented interval tree.
+    Intervals are kept sorted by start in flat lists, the implicit balanced tree over
+    those lists stores the maximum end of every subtree so overlap queries can prune
+    whole subtrees and run in O(log n + k).
+    Intervals are half open: [start, end).
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime, Any]]) -> None:
+        """
+        Builds the index from (start, end, item) tuples.
+        """
+        ordered = sorted(intervals, key=lambda interval: (interval[0], interval[1]))
+        self.starts = [interval[0] for interval in ordered]
+        self.ends = [interval[1] for interval in ordered]
+        self.items = [interval[2] for interval in ordered]
+        self.max_end = list(self.ends)
+        self.build(0, len(ordered))
+
+    @classmethod
+    def from_events(cls, events: List[Dict]) -> "IntervalIndex":
+        """
+        Builds the index over calendar events, each item being the event itself.
+        """
+        return cls(
+            (event_datetime(event, "start"), event_datetime(event, "end"), event)
+            for event in events
+        )
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def build(self, lo: int, hi: int):
+        """
+        Fills `max_end` for the subtree rooted at the middle of [lo, hi).
+        """
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        for child in (self.build(lo, mid), self.build(mid + 1, hi)):
+            if child is not None and child > self.max_end[mid]:
+                self.max_end[mid] = child
+        return self.max_end[mid]
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Any]:
+        """
+        Returns the items overlapping [start, end), ordered by start.
+        """
+        return [self.items[position] for position in self.positions(start, end)]
+
+    def positions(self, start: datetime, end: datetime) -> List[int]:
+        """
+        Returns the positions of the intervals overlapping [start, end), ordered by start.
+        """
+        result = list()
+        self.search(0, len(self.items), start, end, result)
+        return result
+
+    def search(self, lo: int, hi: int, start: datetime, end: datetime, result: List):
+        """
+        In order walk of the subtree over [lo, hi), skipping subtrees that cannot overlap.
+        """
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            # every interval in this subtree ends before the window.
+            return
+        self.search(lo, mid, start, end, result)
+        if self.starts[mid] >= end:
+            # this interval and the right subtree start after the window.
+            return
+        if self.ends[mid] > start:
+            result.append(mid)
+        self.search(mid + 1, hi, start, end, result)
+
+    def busy_intervals(
+        self, start: datetime, end: datetime
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        Returns the merged busy intervals inside [start, end).
+        """
+        merged = list()
+        for position in self.positions(start, end):
+            item_start = max(self.starts[position], start)
+            item_end = min(self.ends[position], end)
+            if merged and item_start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], item_end))
+            else:
+                merged.append((item_start, item_end))
+        return merged
+
+    def free_slots(
+        self,
+        start: datetime,
+        end: datetime,
+        min_duration: timedelta = timedelta(0),
+    ) -> List[Tuple[datetime, datetime]]:
+        """
+        Returns the gaps inside [start, end) not covered by any interval and at least `min_duration` long.
+        """
+        slots = list()
+        cursor = start
+        for busy_start, busy_end in self.busy_intervals(start, end) + [(end, end)]:
+            if busy_start - cursor >= min_duration and busy_start > cursor:
+                slots.append((cursor, busy_start))
+            cursor = max(cursor, busy_end)
+        return slots
+
+    def conflicts(self, start: datetime, end: datetime) -> List[Tuple[Any, Any]]:
+        """
+        Returns every pair of items overlapping each other inside [start, end).
+        Sweeps over the items in start order keeping a heap of the ones still running.
+        """
+        pairs = list()
+        running = list()
+        for position in self.positions(start, end):
+            while running and running[0][0] <= self.starts[position]:
+                heapq.heappop(running)
+            for _, other in running:
+                pairs.append((self.items[other], self.items[position]))
+            heapq.heappush(running, (self.ends[position], position))
+        return pairs
@@ -1,12 +1,23 @@
 """Single Agent Architecture for Jarvis"""
 
+import argparse
+import asyncio
 import os
+from typing import Optional
 from constants import *
-from tools import tools
+from tools import tools, calendar_client
+from llm_cache import ResponseCache, create_response_cache
+from clock import current_datetime_context
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
 from dotenv import load_dotenv
 from langgraph.prebuilt import create_react_agent
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langgraph.checkpoint.memory import MemorySaver
+from checkpointer import SqliteCheckpointer
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from streaming import STREAM_MODES, TurnPrinter
+from tracing import trace_callbacks, tracer
+from logger import correlation_scope
 
 
 class Jarvis:
@@ -15,28 +26,52 @@ class Jarvis:
     This class initializes the AI model, sets up the prompt, and creates the agent executor.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        model: Optional[BaseChatModel] = None,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+    ) -> None:
         """
         Initializes the Jarvis instance.
         Sets up the AI model, prompt, and agent executor.
+        A `model` and `checkpointer` (e.g. the benchmark fakes) replace Gemini and
+        the on disk checkpoints, an injected model brings its own response cache.
         """
-        self.model = ChatGoogleGenerativeAI(
-            api_key=os.getenv("GEMINI_API_KEY"), model=MODEL
-        )
+        if model is None:
+            self.llm_cache = create_response_cache(calendar_client())
+            model = ChatGoogleGenerativeAI(
+                api_key=os.getenv("GEMINI_API_KEY"), model=MODEL, cache=self.llm_cache
+            )
+        else:
+            self.llm_cache = (
+                model.cache if isinstance(model.cache, ResponseCache) else None
+            )
+        self.model = model
+        self.checkpointer = checkpointer
 
         self.setup_prompt()
         self.create_agent()
 
-        print(GREET)
-
     def setup_prompt(self) -> None:
         """
         Sets up the initial prompt and memory for the agent.
-        Initializes the memory saver and sets the system prompt.
+        Initializes the persistent checkpointer and sets the system prompt.
         """
-        self.memory = MemorySaver()
+        self.memory = self.checkpointer or SqliteCheckpointer()
         self.system_prompt = SYSTEM_PROMPT
 
+    def state_modifier(self, state) -> list:
+        """
+        Prepends the system prompt, with the current date and time when INJECT_CLOCK is set,
+        to the conversation so the agent does not need a tool call to learn the time.
+        """
+        system_prompt = self.system_prompt
+        if INJECT_CLOCK:
+            system_prompt += CLOCK_PROMPT.format(
+                current_datetime=current_datetime_context()
+            )
+        return [SystemMessage(content=system_prompt)] + state["messages"]
+
     def create_agent(self) -> None:
         """
         Creates the agent executor with the specified model,
@@ -46,28 +81,81 @@ class Jarvis:
         self.agent_executor = create_react_agent(
             self.model,
             tools,
-            state_modifier=self.system_prompt,
+            state_modifier=self.state_modifier,
             checkpointer=self.memory,
         )
-        self.config = {"configurable": {"thread_id": "test-thread"}}
+        self.config = {
+            "configurable": {"thread_id": "test-thread"},
+            "callbacks": trace_callbacks(),
+        }
 
-    def run(self) -> None:
+    def run(self, query: Optional[str] = None, profile: bool = False) -> None:
         """
         Runs the agent in an infinite loop, taking user input and invoking the agent executor.
-        Prints the input and output messages.
+        Streams the answer token by token, tool calls show up as progress lines.
+        `query` is the first user query when it was already read (see main.py).
+        With `profile` set, a latency and token summary of every turn is printed after its answer.
         """
+        if query is None:
+            print(GREET)
         while True:
-            query = input("> ")
-            messages = self.agent_executor.invoke(
-                {"messages": [("human", query)]}, config=self.config
-            )
-            print(messages["messages"][-1].content)
+            if query is None:
+                query = input("> ")
+            with correlation_scope() as turn_id:
+                TurnPrinter(["agent"]).print_turn(
+                    self.agent_executor.stream(
+                        {"messages": [("human", query)]},
+                        config=self.config,
+                        stream_mode=STREAM_MODES,
+                    )
+                )
+                if profile:
+                    print(tracer.profile(turn_id))
+            query = None
+
+    async def arun(self, query: Optional[str] = None, profile: bool = False) -> None:
+        """
+        Asyncio variant of `run`, the agent and its tools execute without blocking the event loop.
+        """
+        if query is None:
+            print(GREET)
+        while True:
+            if query is None:
+                query = await asyncio.to_thread(input, "> ")
+            with correlation_scope() as turn_id:
+                await TurnPrinter(["agent"]).aprint_turn(
+                    self.agent_executor.astream(
+                        {"messages": [("human", query)]},
+                        config=self.config,
+                        stream_mode=STREAM_MODES,
+                    )
+                )
+                if profile:
+                    print(tracer.profile(turn_id))
+            query = None
 
 
 def main():
+    arg_parser = argparse.ArgumentParser(description="Jarvis.")
+    arg_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run the agent on the asyncio execution path",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a latency and token summary after every answer",
+    )
+    args = arg_parser.parse_args()
+
     load_dotenv()
     assistant = Jarvis()
-    assistant.run()
+    if args.use_async:
+        asyncio.run(assistant.arun(profile=args.profile))
+    else:
+        assistant.run(profile=args.profile)
 
 
 if __name__ == "__main__":
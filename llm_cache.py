@@ -0,0 +1,309 @@
+"""Response cache for the chat models, with exact and semantic lookup tiers"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from constants import (
+    CLOCK_PROMPT,
+    USE_LLM_CACHE,
+    LLM_CACHE_SIZE,
+    LLM_CACHE_TTL,
+    LLM_CACHE_EMBEDDING_MODEL,
+    LLM_CACHE_SIMILARITY_THRESHOLD,
+)
+from logger import log_with_context, logging
+
+# Run, message and tool call ids, and the cache hit flag of answers served from
+# this cache, differ between otherwise identical prompts. The langchain class path
+# arrays are the same for every prompt, the message type is kept in "type".
+VOLATILE_FIELDS_PATTERN = (
+    r'"(?:id|tool_call_id|run_id)":\s*"[^"]*"|"id":\s*\[[^\]]*\]|"cache_hit":\s*true'
+)
+# The clock injected into the prompts, up to its date. The time of day would change
+# the key every minute, answers are only kept for LLM_CACHE_TTL anyway.
+CLOCK_PATTERN = (
+    re.escape(" ".join(CLOCK_PROMPT.split("{current_datetime}")[0].split()))
+    + r"\s*(\d{4}-\d{2}-\d{2})T[\d:.]+(?:[+-]\d{2}:\d{2}|Z)?"
+)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a serialized prompt so equivalent prompts share a cache key.
+    Drops volatile ids and the time of day of the injected clock, and collapses whitespace.
+    """
+    prompt = re.sub(VOLATILE_FIELDS_PATTERN, "", prompt)
+    prompt = " ".join(prompt.split())
+    return re.sub(CLOCK_PATTERN, r"\1", prompt)
+
+
+def split_prompt(prompt: str) -> Tuple[str, str]:
+    """
+    Splits a serialized prompt into its context, the prompt with the content of
+    the last human message blanked, and that content, the users query.
+    A prompt which is not a serialized message list is all context.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt, ""
+    if not isinstance(messages, list):
+        return prompt, ""
+    for message in reversed(messages):
+        kwargs = message.get("kwargs") if isinstance(message, dict) else None
+        if isinstance(kwargs, dict) and kwargs.get("type") == "human":
+            content = kwargs.get("content")
+            kwargs["content"] = ""
+            query = content if isinstance(content, str) else json.dumps(content)
+            return json.dumps(messages), query
+    return prompt, ""
+
+
+class SemanticIndex:
+    """
+    Unit length query vectors of the cached entries sharing one model and prompt
+    context, stacked in a matrix so a lookup is a single matrix-vector product.
+    """
+
+    def __init__(self) -> None:
+        """
+        Sets up an empty index.
+        """
+        self.vectors: Dict[Tuple[str, str], np.ndarray] = dict()
+        self.keys: List[Tuple[str, str]] = list()
+        self.matrix: Optional[np.ndarray] = None
+
+    def add(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        """
+        Indexes the query vector of an entry.
+        """
+        self.vectors[key] = vector
+        self.matrix = None
+
+    def remove(self, key: Tuple[str, str]) -> None:
+        """
+        Drops an entry from the index.
+        """
+        if self.vectors.pop(key, None) is not None:
+            self.matrix = None
+
+    def best(self, vector: np.ndarray, threshold: float) -> Optional[Tuple[str, str]]:
+        """
+        Returns the key of the most similar entry at or above `threshold`, None if there is none.
+        """
+        if not self.vectors:
+            return None
+        if self.matrix is None:
+            self.keys = list(self.vectors)
+            self.matrix = np.stack([self.vectors[key] for key in self.keys])
+        similarities = self.matrix @ vector
+        position = int(np.argmax(similarities))
+        if similarities[position] < threshold:
+            return None
+        return self.keys[position]
+
+
+def load_embeddings(model_name: Optional[str]):
+    """
+    Loads a local sentence embedding model for the semantic tier.
+    Returns None, disabling the tier, when no model is configured or the optional
+    `langchain_huggingface` dependency is missing.
+    """
+    if not model_name:
+        return None
+    try:
+        from langchain_huggingface import HuggingFaceEmbeddings
+    except ImportError:
+        log_with_context(
+            logging.WARNING,
+            "langchain_huggingface is not installed, semantic LLM cache disabled.",
+        )
+        return None
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+
+def mark_cache_hit(generations: RETURN_VAL_TYPE) -> RETURN_VAL_TYPE:
+    """
+    Returns copies of cached chat generations flagged with `cache_hit` in their
+    response metadata, so tracing does not count their tokens again.
+    """
+    return [
+        (
+            generation.model_copy(
+                update={
+                    "message": generation.message.model_copy(
+                        update={
+                            "response_metadata": dict(
+                                generation.message.response_metadata, cache_hit=True
+                            )
+                        }
+                    )
+                }
+            )
+            if hasattr(generation, "message")
+            else generation
+        )
+        for generation in generations
+    ]
+
+
+class ResponseCache(BaseCache):
+    """
+    LRU cache of chat model responses with a per entry TTL.
+    The exact tier is keyed on the normalized prompt and the model parameters
+    (which include bound tools). When `embeddings` are given, an exact miss falls
+    back to the cached prompt whose users query is most similar, above `threshold`,
+    among those of the same model with an identical rest of the prompt (system
+    prompt, history and tools). Only the query is embedded: the long shared
+    system prompts would otherwise fill the embedding model's input window.
+    """
+
+    def __init__(
+        self,
+        max_size: int = LLM_CACHE_SIZE,
+        ttl: float = LLM_CACHE_TTL,
+        embeddings=None,
+        threshold: float = LLM_CACHE_SIMILARITY_THRESHOLD,
+    ) -> None:
+        """
+        Sets up an empty cache.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.entries = OrderedDict()
+        # semantic indexes by (model parameters, digest of the prompt context).
+        self.indexes: Dict[Tuple[str, str], SemanticIndex] = dict()
+        self.lock = threading.RLock()
+        self.stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(prompt: str, llm_string: str) -> Tuple[str, str]:
+        """
+        Returns the exact tier key of a prompt for a model.
+        """
+        digest = hashlib.sha256(normalize_prompt(prompt).encode()).hexdigest()
+        return llm_string, digest
+
+    @staticmethod
+    def semantic_key(prompt: str, llm_string: str) -> Tuple[Tuple[str, str], str]:
+        """
+        Returns the semantic index a prompt belongs to, and its users query.
+        """
+        context, query = split_prompt(prompt)
+        digest = hashlib.sha256(normalize_prompt(context).encode()).hexdigest()
+        return (llm_string, digest), " ".join(query.split())
+
+    def embed(self, query: str) -> Optional[np.ndarray]:
+        """
+        Returns the unit length embedding of a query, None for an empty one.
+        """
+        if not query:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        """
+        Returns the cached response for a prompt, None on a miss.
+        """
+        key = self.key(prompt, llm_string)
+        now = time.monotonic()
+        with self.lock:
+            self.evict_expired(now)
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return mark_cache_hit(self.entries[key][1])
+            if self.embeddings is None:
+                self.stats["misses"] += 1
+                return None
+
+        index_key, query = self.semantic_key(prompt, llm_string)
+        vector = self.embed(query)
+        with self.lock:
+            index = self.indexes.get(index_key)
+            best_key = None
+            if vector is not None and index is not None:
+                best_key = index.best(vector, self.threshold)
+            if best_key is None:
+                self.stats["misses"] += 1
+                return None
+            self.entries.move_to_end(best_key)
+            self.stats["semantic_hits"] += 1
+            return mark_cache_hit(self.entries[best_key][1])
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """
+        Caches the response for a prompt, evicting the least recently used entries beyond `max_size`.
+        """
+        index_key, vector = None, None
+        if self.embeddings is not None:
+            index_key, query = self.semantic_key(prompt, llm_string)
+            vector = self.embed(query)
+        key = self.key(prompt, llm_string)
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (time.monotonic() + self.ttl, return_val, index_key)
+            if vector is not None:
+                self.indexes.setdefault(index_key, SemanticIndex()).add(key, vector)
+            while len(self.entries) > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def clear(self, **kwargs: Any) -> None:
+        """
+        Drops every cached response, e.g. when the users calendar changed.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.indexes.clear()
+        log_with_context(logging.DEBUG, "LLM response cache cleared.")
+
+    def evict_expired(self, now: float) -> None:
+        """
+        Drops the entries whose TTL passed.
+        """
+        expired = [key for key, entry in self.entries.items() if entry[0] <= now]
+        for key in expired:
+            self.remove(key)
+
+    def remove(self, key: Tuple[str, str]) -> None:
+        """
+        Drops an entry, and its query vector from its semantic index.
+        """
+        entry = self.entries.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        index = self.indexes.get(entry[2])
+        if index is None:
+            return
+        index.remove(key)
+        if not index.vectors:
+            del self.indexes[entry[2]]
+
+    def report(self) -> dict:
+        """
+        Returns the hit / miss counters.
+        """
+        with self.lock:
+            return dict(self.stats, size=len(self.entries))
+
+
+def create_response_cache(calendar_client) -> Optional[ResponseCache]:
+    """
+    Returns the response cache shared by the chat models, None when USE_LLM_CACHE is off.
+    The cache is cleared whenever `calendar_client` sees calendar data change.
+    """
+    if not USE_LLM_CACHE:
+        return None
+    cache = ResponseCache(embeddings=load_embeddings(LLM_CACHE_EMBEDDING_MODEL))
+    calendar_client.add_change_listener(lambda calendar: cache.clear())
+    return cache
@@ -1,6 +1,102 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
 import sys
-import inspect
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from constants import LOG_FORMAT, LOG_LEVEL, LOGGER_NAME
+
+# Correlates the log lines of one user turn across threads and tasks.
+correlation_id = ContextVar("correlation_id", default="-")
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(funcName)s:%(lineno)d - [%(correlation_id)s] %(message)s"
+
+
+class CorrelationFilter(logging.Filter):
+    """
+    Stamps records with the correlation id of the context logging them.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, with the traceback of a logged
+    exception in its own field.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "correlation_id": getattr(record, "correlation_id", "-"),
+            "message": record.getMessage(),
+        }
+        # like logging.Formatter, the formatted exception is cached on the record.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+
+def configure_logging() -> logging.Logger:
+    """
+    Sets up the application logger once.
+    Records are handed to a queue so logging never blocks the caller on I/O,
+    a listener thread writes them to stderr.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return logger
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    if LOG_FORMAT == "json":
+        # the queue handler flattens records, exceptions included, into their message
+        # before queueing them, so JSON lines are formatted before that.
+        queue_handler.setFormatter(JsonFormatter())
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+    else:
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    queue_handler.addFilter(CorrelationFilter())
+    logger.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    # flush the queued records on exit.
+    atexit.register(listener.stop)
+    return logger
+
+
+app_logger = configure_logging()
+
+
+@contextmanager
+def correlation_scope(scope_id: Optional[str] = None) -> Iterator[str]:
+    """
+    Tags every log line written inside the scope with `scope_id`, a new id by default.
+    """
+    scope_id = scope_id or uuid.uuid4().hex[:12]
+    token = correlation_id.set(scope_id)
+    try:
+        yield scope_id
+    finally:
+        correlation_id.reset(token)
 
 
 def log_with_context(level, message):
@@ -11,18 +107,5 @@ def log_with_context(level, message):
     level: The logging level (e.g., logging.DEBUG, logging.INFO).
     message: The message to log.
     """
-    logger = logging.getLogger(__name__)
-    logger.setLevel(level)
-
-    # Create a custom formatter to include function context
-    formatter = logging.Formatter(
-        f"%(asctime)s - %(levelname)s - {inspect.stack()[1][3]}:{inspect.stack()[1][2]} - %(message)s"
-    )
-
-    # Create a handler to log to stderr
-    handler = logging.StreamHandler(sys.stderr)
-    handler.setFormatter(formatter)
-
-    logger.addHandler(handler)
-
-    logger.log(level, message)
+    # stacklevel attributes the record to the caller of this function.
+    app_logger.log(level, message, stacklevel=2)
@@ -0,0 +1,115 @@
+"""Fast starting command line entry point for Jarvis and the multi agent system"""
+
+import argparse
+import asyncio
+import threading
+from typing import Any, Callable
+from constants import GRAPH_MODE, GRAPH_MODES, GREET
+from dotenv import load_dotenv
+from logger import log_with_context, logging
+
+
+class BackgroundLoader:
+    """
+    Runs a factory on a background thread, so slow imports and setup overlap with
+    the user typing their first query.
+    """
+
+    def __init__(self, factory: Callable[[], Any]) -> None:
+        """
+        Starts running the factory.
+        """
+        self.factory = factory
+        self.value = None
+        self.error = None
+        self.thread = threading.Thread(target=self.load, name="loader", daemon=True)
+        self.thread.start()
+
+    def load(self) -> None:
+        """
+        Runs the factory, keeping its value or error for `result`.
+        """
+        try:
+            self.value = self.factory()
+        except BaseException as err:
+            self.error = err
+
+    def result(self) -> Any:
+        """
+        Waits for the factory and returns its value, re-raising its error.
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+def load_agent(use_multi_agent: bool, graph_mode: str):
+    """
+    Imports and builds the agent, then warms up the calendar client.
+    The agent modules pull in langchain / langgraph, which take seconds to import,
+    so they are only imported here, on the loader thread.
+    `graph_mode` picks the multi agent graph.
+    """
+    if use_multi_agent:
+        from multi_agent import MultiAgent
+
+        agent = MultiAgent(graph_mode=graph_mode)
+    else:
+        from jarvis import Jarvis
+
+        agent = Jarvis()
+
+    from tools import calendar_client
+
+    try:
+        calendar_client().warm_up()
+    except Exception as err:
+        # the first tool call sets the client up again and reports the error.
+        log_with_context(logging.WARNING, f"Cannot warm up calendar client: {err}")
+    return agent
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Jarvis.")
+    arg_parser.add_argument(
+        "--multi-agent",
+        dest="use_multi_agent",
+        action="store_true",
+        help="run the multi agent system instead of the single agent",
+    )
+    arg_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run the agent on the asyncio execution path",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a latency and token summary after every answer",
+    )
+    arg_parser.add_argument(
+        "--graph",
+        choices=GRAPH_MODES,
+        default=GRAPH_MODE,
+        help="multi agent graph: supervisor routed, or plan-and-execute",
+    )
+    args = arg_parser.parse_args()
+
+    load_dotenv()
+    loader = BackgroundLoader(lambda: load_agent(args.use_multi_agent, args.graph))
+    print(GREET)
+    try:
+        query = input("> ")
+    except EOFError:
+        return
+    agent = loader.result()
+    if args.use_async:
+        asyncio.run(agent.arun(query, profile=args.profile))
+    else:
+        agent.run(query, profile=args.profile)
+
+
+if __name__ == "__main__":
+    main()
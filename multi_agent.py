@@ -1,5 +1,7 @@
 """ Multi Agent Proof of concept - WIP."""
 
+import argparse
+import asyncio
 import os
 from constants import (
     MODEL,
@@ -8,19 +10,40 @@ from constants import (
     COMMUNICATOR_SYSTEM_PROMPT,
     HUMAN_AGENT_PROMPT,
     SUPERVISOR_PROMPT,
+    SUPERVISOR_ROUTE_PROMPT,
+    SUPERVISOR_CLOCK_PROMPT,
+    STRUCTURED_SUPERVISOR,
+    GRAPH_MODE,
+    GRAPH_MODES,
+    CLOCK_PROMPT,
+    INJECT_CLOCK,
     GREET,
+    HISTORY_MAX_MESSAGES,
 )
+from clock import current_datetime_context
 from dotenv import load_dotenv
-import operator
+from logger import correlation_scope, log_with_context, logging
 from agent_creator import create_tool_agent
-from typing import TypedDict, Sequence, Annotated
+from router import FastPathRouter
+from route_guard import RouteGuard
+from plan_execute import PlanExecutor, PlanState
+from history import HistoryCompactor, keep_last, render_history
+from streaming import STREAM_MODES, TurnPrinter
+from tracing import trace_callbacks, tracer
+from typing import TypedDict, Sequence, Annotated, List, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
-from tools import datetime_agent_tools, calendar_agent_tools
+from tools import datetime_agent_tools, calendar_agent_tools, calendar_client
+from llm_cache import ResponseCache, create_response_cache
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from checkpointer import SqliteCheckpointer
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langchain_core.language_models import BaseChatModel
 from pydantic import BaseModel
+from langchain_core.exceptions import OutputParserException
 from langchain_core.output_parsers import JsonOutputParser
-from langgraph.graph import StateGraph, END
+from langchain_core.output_parsers.openai_tools import JsonOutputKeyToolsParser
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import StateGraph, END, add_messages
 from langchain_core.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder,
@@ -34,6 +57,25 @@ import functools
 
 
 members = ["DateTime", "Calendar", "Communicate", "HumanClarification"]
+# nodes answering the user, their tokens are streamed to the terminal.
+answer_nodes = ["Communicate", "HumanClarification"]
+# function the structured output supervisor calls with its decision.
+SUPERVISOR_ROUTE_TOOL = "route"
+
+
+def supervisor_route_tool(options: List[str]) -> dict:
+    """
+    Returns the declaration of the function the supervisor calls to pick the next worker among `options`.
+    """
+    return {
+        "name": SUPERVISOR_ROUTE_TOOL,
+        "description": "Routes the conversation to the worker to act next.",
+        "parameters": {
+            "type": "object",
+            "properties": {"next": {"type": "string", "enum": options}},
+            "required": ["next"],
+        },
+    }
 
 
 class MultiAgent:
@@ -42,20 +84,73 @@ class MultiAgent:
     This class initializes various agents and sets up the supervisor agent.
     """
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        model: Optional[BaseChatModel] = None,
+        checkpointer: Optional[BaseCheckpointSaver] = None,
+        structured_supervisor: bool = STRUCTURED_SUPERVISOR,
+        graph_mode: str = GRAPH_MODE,
+    ) -> None:
         """
         Initializes the MultiAgent instance.
         Sets up the agents, supervisor agent, and graph.
+        A `model` and `checkpointer` (e.g. the benchmark fakes) replace Gemini and
+        the on disk checkpoints, an injected model brings its own response cache.
+        `structured_supervisor` picks how the supervisor decides (see STRUCTURED_SUPERVISOR).
+        `graph_mode` picks the supervisor graph or the plan-and-execute one (see GRAPH_MODE).
         """
         load_dotenv()
-        self.model = ChatGoogleGenerativeAI(
-            api_key=os.getenv("GEMINI_API_KEY"), model=MODEL
+        if model is None:
+            # routing decisions and agent answers repeat often, so responses are cached
+            # until the calendar changes.
+            self.llm_cache = create_response_cache(calendar_client())
+            model = ChatGoogleGenerativeAI(
+                api_key=os.getenv("GEMINI_API_KEY"), model=MODEL, cache=self.llm_cache
+            )
+        else:
+            self.llm_cache = (
+                model.cache if isinstance(model.cache, ResponseCache) else None
+            )
+        self.model = model
+        self.checkpointer = checkpointer or SqliteCheckpointer()
+        self.structured_supervisor = structured_supervisor
+        if graph_mode not in GRAPH_MODES:
+            raise ValueError(
+                f"Unknown graph mode {graph_mode}, expected one of {GRAPH_MODES}."
+            )
+        self.graph_mode = graph_mode
+        # the planner answers requests needing no tool itself.
+        self.answer_nodes = (
+            ["Planner"] + answer_nodes if graph_mode == "plan" else answer_nodes
         )
 
-        self.config = {"configurable": {"thread_id": "test-thread"}}
+        self.config = self.thread_config("test-thread")
+        self.router = FastPathRouter()
+        self.guard = RouteGuard(members)
+        self.history = HistoryCompactor(self.model)
         self.setup_agents()
         self.setup_supervisor_agent()
-        self.setup_graph()
+        if graph_mode == "plan":
+            self.setup_plan_graph()
+        else:
+            self.setup_graph()
+
+    @staticmethod
+    def thread_config(thread_id: str) -> dict:
+        """
+        Returns the graph config for a conversation thread, each thread has its own checkpoints.
+        """
+        return {
+            "configurable": {"thread_id": thread_id},
+            "callbacks": trace_callbacks(),
+        }
+
+    @staticmethod
+    def turn_input(query: str) -> dict:
+        """
+        Returns the graph input for a new user turn.
+        """
+        return {"messages": [HumanMessage(content=query)], "route_trail": list()}
 
     def setup_agents(self) -> None:
         """
@@ -77,10 +172,18 @@ class MultiAgent:
         )
 
         # Communicator Agent
-        self.communicator_agent_prompt = PromptTemplate(
-            template=COMMUNICATOR_SYSTEM_PROMPT,
-            input_variables=["agent_history"],
-        )
+        if INJECT_CLOCK:
+            # knowing the time lets the communicator answer date / time queries directly.
+            self.communicator_agent_prompt = PromptTemplate(
+                template=COMMUNICATOR_SYSTEM_PROMPT + CLOCK_PROMPT,
+                input_variables=["agent_history"],
+                partial_variables={"current_datetime": current_datetime_context},
+            )
+        else:
+            self.communicator_agent_prompt = PromptTemplate(
+                template=COMMUNICATOR_SYSTEM_PROMPT,
+                input_variables=["agent_history"],
+            )
 
         system_message_prompt = SystemMessagePromptTemplate(
             prompt=self.communicator_agent_prompt
@@ -117,14 +220,29 @@ class MultiAgent:
         # return a dictionary specifying the next agent to call
         # under key next.
         class SupervisorOutput(BaseModel):
-            # defaults to calendar agent
-            next: MemberEnum = MemberEnum.Calendar
+            # no default, an unparsable decision is handled by the route guard.
+            next: MemberEnum
 
-        system_prompt = SUPERVISOR_PROMPT
         # Supervisor is an LLM node. It just picks the next agent to process
         # and decides when the work is completed
-
-        supervisor_parser = JsonOutputParser(pydantic_object=SupervisorOutput)
+        if self.structured_supervisor:
+            # a forced function call with the workers as an enum: no format instructions
+            # in the prompt, and the decision comes back as the call's arguments.
+            system_prompt = SUPERVISOR_ROUTE_PROMPT
+            supervisor_model = self.model.bind_tools(
+                [supervisor_route_tool(members)], tool_choice=SUPERVISOR_ROUTE_TOOL
+            )
+            supervisor_parser = JsonOutputKeyToolsParser(
+                key_name=SUPERVISOR_ROUTE_TOOL, first_tool_only=True
+            )
+            format_instructions = ""
+        else:
+            system_prompt = SUPERVISOR_PROMPT
+            supervisor_model = self.model
+            supervisor_parser = JsonOutputParser(pydantic_object=SupervisorOutput)
+            format_instructions = supervisor_parser.get_format_instructions()
+        if INJECT_CLOCK:
+            system_prompt += SUPERVISOR_CLOCK_PROMPT
 
         prompt = ChatPromptTemplate.from_messages(
             [
@@ -135,24 +253,27 @@ class MultiAgent:
         ).partial(
             options=str(members),
             members=", ".join(members),
-            format_instructions=supervisor_parser.get_format_instructions(),
+            format_instructions=format_instructions,
         )
 
-        self.supervisor_chain = prompt | self.model | supervisor_parser
+        self.supervisor_chain = prompt | supervisor_model | supervisor_parser
 
     def setup_graph(self) -> None:
         """
         Sets up the graph for the multi-agent system.
         """
 
-        # For agents in the crew
-        def crew_nodes(state, crew_member, name):
-            # read the last message in the message history.
-            input = {
+        def node_input(state):
+            # read the last message in the message history, along with the compacted agent history.
+            return {
                 "messages": [state["messages"][-1]],
-                "agent_history": state["agent_history"],
+                "agent_history": render_history(self.history.view(state)),
             }
-            result = crew_member.invoke(input)
+
+        def supervisor_input(state):
+            return dict(state, agent_history=self.history.view(state))
+
+        def crew_output(result, name):
             # add response to the agent history.
             return {
                 "agent_history": [
@@ -166,53 +287,132 @@ class MultiAgent:
                 ]
             }
 
+        # For agents in the crew
+        def crew_nodes(state, crew_member, name):
+            return crew_output(crew_member.invoke(node_input(state)), name)
+
+        async def acrew_nodes(state, crew_member, name):
+            return crew_output(await crew_member.ainvoke(node_input(state)), name)
+
         def comms_node(state):
-            # read the last message in the message history.
-            input = {
-                "messages": [state["messages"][-1]],
-                "agent_history": state["agent_history"],
-            }
-            result = self.comms_agent.invoke(input)
+            result = self.comms_agent.invoke(node_input(state))
             # respond back to the user.
             return {"messages": [result]}
 
+        async def acomms_node(state):
+            result = await self.comms_agent.ainvoke(node_input(state))
+            return {"messages": [result]}
+
         def human_node(state):
-            # read the last message message in the message history.
-            input = {
-                "messages": [state["messages"][-1]],
-                "agent_history": state["agent_history"],
-            }
-            result = self.human_agent.invoke(input)
+            result = self.human_agent.invoke(node_input(state))
             # respond back to the user.
             return {"messages": [result]}
 
+        async def ahuman_node(state):
+            result = await self.human_agent.ainvoke(node_input(state))
+            return {"messages": [result]}
+
+        def fast_route(state):
+            # budget exhaustion and obvious intents are routed without calling the supervisor model.
+            route_trail = state.get("route_trail") or list()
+            reason = self.guard.exhausted(state)
+            if reason is not None:
+                return self.guard.stop(reason, route_trail)
+            next_node = self.router.route(state["messages"][-1].content, route_trail)
+            if next_node is None:
+                return None
+            return {"next": next_node, "route_trail": route_trail + [next_node]}
+
+        def follow(decision, state):
+            route_trail = state.get("route_trail") or list()
+            reason = self.guard.vet(decision, route_trail)
+            if reason is not None:
+                return self.guard.stop(reason, route_trail)
+            return {
+                "next": decision["next"],
+                "route_trail": route_trail + [decision["next"]],
+            }
+
+        def supervisor_node(state):
+            # every hop goes through the supervisor, so the history is compacted here.
+            update = dict(self.history.compact(state), **self.guard.begin(state))
+            state = dict(state, **update)
+            route = fast_route(state)
+            if route is None:
+                try:
+                    decision = self.supervisor_chain.invoke(supervisor_input(state))
+                except OutputParserException:
+                    decision = None
+                route = follow(decision, state)
+            return dict(update, **route)
+
+        async def asupervisor_node(state):
+            update = dict(await self.history.acompact(state), **self.guard.begin(state))
+            state = dict(state, **update)
+            route = fast_route(state)
+            if route is None:
+                try:
+                    decision = await self.supervisor_chain.ainvoke(
+                        supervisor_input(state)
+                    )
+                except OutputParserException:
+                    decision = None
+                route = follow(decision, state)
+            return dict(update, **route)
+
         # The agent state is the input to each node in the graph
         class AgentState(TypedDict):
             # The annotation tells the graph that new messages will always
-            # be added to the current states
-            messages: Annotated[Sequence[BaseMessage], operator.add]
+            # be added to the current states, keeping the recent turns
+            messages: Annotated[Sequence[BaseMessage], keep_last(HISTORY_MAX_MESSAGES)]
             # The 'next' field indicates where to route to next
             next: str
 
-            agent_history: Annotated[Sequence[BaseMessage], operator.add]
+            # entries get ids, so the compactor can remove the ones folded into the summary.
+            agent_history: Annotated[Sequence[BaseMessage], add_messages]
+            # nodes visited in the current turn, reset by every new user query.
+            route_trail: List[str]
+            # rolling summary of the agent history entries that left the window.
+            history_summary: str
+            summarized_upto: int
+            # LLM tokens used before the current turn started, for its token budget.
+            token_baseline: int
 
         self.workflow = StateGraph(AgentState)
 
-        self.datetime_node = functools.partial(
-            crew_nodes, crew_member=self.datetime_agent, name="DateTime"
+        # every node has a blocking and an asyncio implementation,
+        # picked by graph.stream / graph.astream respectively.
+        self.datetime_node = RunnableLambda(
+            functools.partial(
+                crew_nodes, crew_member=self.datetime_agent, name="DateTime"
+            ),
+            afunc=functools.partial(
+                acrew_nodes, crew_member=self.datetime_agent, name="DateTime"
+            ),
         )
 
-        self.calendar_node = functools.partial(
-            crew_nodes, crew_member=self.calendar_agent, name="Calendar"
+        self.calendar_node = RunnableLambda(
+            functools.partial(
+                crew_nodes, crew_member=self.calendar_agent, name="Calendar"
+            ),
+            afunc=functools.partial(
+                acrew_nodes, crew_member=self.calendar_agent, name="Calendar"
+            ),
         )
 
         self.workflow.add_node("DateTime", self.datetime_node)
         self.workflow.add_node("Calendar", self.calendar_node)
 
-        self.workflow.add_node("Communicate", comms_node)
-        self.workflow.add_node("HumanClarification", human_node)
+        self.workflow.add_node(
+            "Communicate", RunnableLambda(comms_node, afunc=acomms_node)
+        )
+        self.workflow.add_node(
+            "HumanClarification", RunnableLambda(human_node, afunc=ahuman_node)
+        )
 
-        self.workflow.add_node("Supervisor", self.supervisor_chain)
+        self.workflow.add_node(
+            "Supervisor", RunnableLambda(supervisor_node, afunc=asupervisor_node)
+        )
 
         # set Supervisor as entrypoint to the graph.
         self.workflow.set_entry_point("Supervisor")
@@ -233,27 +433,169 @@ class MultiAgent:
         )
 
         self.graph = self.workflow.compile(
-            checkpointer=MemorySaver(), interrupt_after=["HumanClarification"]
+            checkpointer=self.checkpointer, interrupt_after=["HumanClarification"]
+        )
+
+    def setup_plan_graph(self) -> None:
+        """
+        Sets up the plan-and-execute graph: the planner requests every tool call of a
+        turn at once, the executor runs them in parallel and Communicate answers.
+        Two model calls per turn needing tools, one per turn needing none.
+        """
+        self.planner = PlanExecutor(
+            self.model, datetime_agent_tools + calendar_agent_tools
+        )
+
+        def node_input(state):
+            return {
+                "messages": [state["messages"][-1]],
+                "agent_history": render_history(self.history.view(state)),
+            }
+
+        def planner_node(state):
+            update = self.history.compact(state)
+            update.update(self.planner.plan(node_input(dict(state, **update))))
+            return dict(update, route_trail=["Planner"])
+
+        async def aplanner_node(state):
+            update = await self.history.acompact(state)
+            update.update(await self.planner.aplan(node_input(dict(state, **update))))
+            return dict(update, route_trail=["Planner"])
+
+        def executor_node(state):
+            update = self.planner.execute(state["plan"])
+            return dict(update, route_trail=state["route_trail"] + ["Executor"])
+
+        async def aexecutor_node(state):
+            update = await self.planner.aexecute(state["plan"])
+            return dict(update, route_trail=state["route_trail"] + ["Executor"])
+
+        def comms_node(state):
+            return {"messages": [self.comms_agent.invoke(node_input(state))]}
+
+        async def acomms_node(state):
+            return {"messages": [await self.comms_agent.ainvoke(node_input(state))]}
+
+        self.workflow = StateGraph(PlanState)
+        self.workflow.add_node(
+            "Planner", RunnableLambda(planner_node, afunc=aplanner_node)
         )
+        self.workflow.add_node(
+            "Executor", RunnableLambda(executor_node, afunc=aexecutor_node)
+        )
+        self.workflow.add_node(
+            "Communicate", RunnableLambda(comms_node, afunc=acomms_node)
+        )
+        self.workflow.set_entry_point("Planner")
+        # a plan without tool calls means the planner already answered.
+        self.workflow.add_conditional_edges(
+            "Planner", lambda x: "Executor" if x["plan"] else END
+        )
+        self.workflow.add_edge("Executor", "Communicate")
+        self.workflow.add_edge("Communicate", END)
 
-    def run(self) -> None:
+        self.graph = self.workflow.compile(checkpointer=self.checkpointer)
+
+    def run(self, query: Optional[str] = None, profile: bool = False) -> None:
         """
         Runs the multi-agent system in an infinite loop, taking user input and invoking the supervisor agent.
+        The answer is streamed token by token, the other agents show up as progress lines.
+        `query` is the first user query when it was already read (see main.py).
+        With `profile` set, a latency and token summary of every turn is printed after its answer,
+        and the turn statistics are logged at INFO.
+        """
+        if query is None:
+            print(GREET)
+        while True:
+            if query is None:
+                query = input("> ")
+            with correlation_scope() as turn_id:
+                TurnPrinter(self.answer_nodes).print_turn(
+                    self.graph.stream(
+                        self.turn_input(query),
+                        config=self.config,
+                        stream_mode=STREAM_MODES,
+                    )
+                )
+                self.log_turn_stats(logging.INFO if profile else logging.DEBUG)
+                if profile:
+                    print(tracer.profile(turn_id))
+            query = None
+
+    async def arun(self, query: Optional[str] = None, profile: bool = False) -> None:
+        """
+        Asyncio variant of `run`, the graph, agents and tools execute without blocking the event loop.
         """
-        print(GREET)
+        if query is None:
+            print(GREET)
         while True:
-            query = input("> ")
-            for s in self.graph.stream(
-                {"messages": [HumanMessage(content=query)]}, config=self.config
-            ):
-                if "__end__" not in s:
-                    print(s)
-                    print("----")
+            if query is None:
+                query = await asyncio.to_thread(input, "> ")
+            with correlation_scope() as turn_id:
+                await TurnPrinter(self.answer_nodes).aprint_turn(
+                    self.graph.astream(
+                        self.turn_input(query),
+                        config=self.config,
+                        stream_mode=STREAM_MODES,
+                    )
+                )
+                self.log_turn_stats(logging.INFO if profile else logging.DEBUG)
+                if profile:
+                    print(tracer.profile(turn_id))
+            query = None
+
+    def log_turn_stats(self, level: int = logging.DEBUG) -> None:
+        """
+        Logs how many supervisor model calls the fast-path router and the response cache saved so far,
+        the turns stopped early by the route guard, the calendar API request metrics,
+        and the agent history tokens saved by compaction in the last turn.
+        Logged at DEBUG by default, so they do not interleave with the streamed answer.
+        """
+        stats = self.router.report()
+        log_with_context(
+            level,
+            f"Supervisor calls skipped: {stats['fast_path']}, made: {stats['supervisor']}.",
+        )
+        if self.llm_cache is not None:
+            log_with_context(level, f"LLM response cache: {self.llm_cache.report()}.")
+        log_with_context(level, f"Turns stopped early: {self.guard.report()}.")
+        log_with_context(
+            level, f"Calendar API requests: {calendar_client().requests.report()}."
+        )
+        history_stats = self.history.pop_stats()
+        log_with_context(
+            level,
+            f"Agent history tokens this turn: ~{history_stats['sent_tokens']} sent, "
+            f"~{history_stats['full_tokens'] - history_stats['sent_tokens']} saved by compaction.",
+        )
 
 
 def main() -> None:
-    agent = MultiAgent()
-    agent.run()
+    arg_parser = argparse.ArgumentParser(description="Multi agent Jarvis.")
+    arg_parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="run the graph on the asyncio execution path",
+    )
+    arg_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print a latency and token summary after every answer",
+    )
+    arg_parser.add_argument(
+        "--graph",
+        choices=GRAPH_MODES,
+        default=GRAPH_MODE,
+        help="supervisor routed graph, or plan-and-execute graph",
+    )
+    args = arg_parser.parse_args()
+
+    agent = MultiAgent(graph_mode=args.graph)
+    if args.use_async:
+        asyncio.run(agent.arun(profile=args.profile))
+    else:
+        agent.run(profile=args.profile)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,57 @@
+"""Lazy page streaming for google api list requests"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Any, Callable, Dict, Iterator, Optional
+from constants import PREFETCH_WORKERS
+from resilience import RequestExecutor, calendar_requests
+
+# Shared by every page stream, each stream has at most one page in flight.
+prefetch_executor = ThreadPoolExecutor(
+    max_workers=PREFETCH_WORKERS, thread_name_prefix="page-prefetch"
+)
+
+
+def iter_pages(
+    list_page: Callable[[Optional[str]], Any],
+    requests: RequestExecutor = calendar_requests,
+) -> Iterator[Dict]:
+    """
+    Lazily yields the responses of a paginated list request.
+    `list_page` builds the request for a page token (None for the first page),
+    the pages are requested through `requests`.
+    The first page is fetched on the calling thread, so concurrent streams are not capped
+    by the prefetch pool. Every next page is fetched in the background while the caller
+    consumes the current one, closing the generator early cancels the pending fetch.
+    """
+    # pages are fetched in the context of the caller, e.g. its log correlation id and span.
+    context = copy_context()
+    result = requests.execute(list_page(None))
+    future = None
+    try:
+        while True:
+            page_token = result.get("nextPageToken")
+            if page_token:
+                future = prefetch_executor.submit(
+                    context.copy().run,
+                    lambda token=page_token: requests.execute(list_page(token)),
+                )
+            yield result
+            if future is None:
+                return
+            result = future.result()
+            future = None
+    finally:
+        if future is not None:
+            future.cancel()
+
+
+def iter_items(
+    list_page: Callable[[Optional[str]], Any],
+    requests: RequestExecutor = calendar_requests,
+) -> Iterator[Dict]:
+    """
+    Lazily yields the items across all pages of a paginated list request.
+    """
+    for page in iter_pages(list_page, requests):
+        yield from page.get("items", [])
@@ -0,0 +1,121 @@
+"""Plan-and-execute graph: one planner call, the planned tool calls run in parallel, one answer call"""
+
+from typing import Annotated, Dict, List, Sequence, TypedDict
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langgraph.graph import add_messages
+from langgraph.prebuilt import ToolNode
+from agent_creator import arun_tools, run_tools
+from clock import current_datetime_context
+from constants import (
+    CLOCK_PROMPT,
+    HISTORY_MAX_MESSAGES,
+    MAX_PLAN_STEPS,
+    PLANNER_SYSTEM_PROMPT,
+)
+from history import keep_last
+from logger import log_with_context, logging
+
+
+class PlanState(TypedDict):
+    """
+    State of the plan-and-execute graph, the history keys match the supervisor graph's.
+    """
+
+    messages: Annotated[Sequence[BaseMessage], keep_last(HISTORY_MAX_MESSAGES)]
+    agent_history: Annotated[Sequence[BaseMessage], add_messages]
+    # nodes visited in the current turn, reset by every new user query.
+    route_trail: List[str]
+    history_summary: str
+    summarized_upto: int
+    # tool calls the planner made for the current turn.
+    plan: List[Dict]
+
+
+class PlanExecutor:
+    """
+    Plans a turn with a single model call bound to every tool: the model requests
+    all the tool calls the answer needs at once, or answers directly when none is
+    needed. The planned calls do not depend on each other, so they all run in
+    parallel, and their results go to the agent history for the answer node.
+    Plans are capped at `max_steps` calls.
+    """
+
+    def __init__(self, llm, tools: list, max_steps: int = MAX_PLAN_STEPS) -> None:
+        """
+        Sets up the planner chain on `llm` with `tools`, tools listed twice are bound once.
+        """
+        self.tools = {tool.name: tool for tool in tools}
+        self.tool_node = ToolNode(list(self.tools.values()))
+        self.max_steps = max_steps
+        # there is no DateTime agent to ask, relative dates are resolved from the clock.
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", PLANNER_SYSTEM_PROMPT + CLOCK_PROMPT),
+                MessagesPlaceholder(variable_name="messages"),
+            ]
+        ).partial(current_datetime=current_datetime_context)
+        self.planner_chain = prompt | llm.bind_tools(list(self.tools.values()))
+
+    def plan_update(self, result: AIMessage) -> Dict:
+        """
+        Returns the planner state update: the capped plan, or the answer when no tool is needed.
+        """
+        if not result.tool_calls:
+            return {"plan": list(), "messages": [result]}
+        plan = result.tool_calls
+        if len(plan) > self.max_steps:
+            log_with_context(
+                logging.WARNING,
+                f"Plan of {len(plan)} tool calls capped at {self.max_steps}.",
+            )
+            plan = plan[: self.max_steps]
+        log_with_context(
+            logging.INFO, f"Planned: {', '.join(call['name'] for call in plan)}."
+        )
+        return {"plan": plan}
+
+    def plan(self, planner_input: Dict) -> Dict:
+        """
+        Plans the turn, see `plan_update`.
+        """
+        return self.plan_update(self.planner_chain.invoke(planner_input))
+
+    async def aplan(self, planner_input: Dict) -> Dict:
+        """
+        Asyncio variant of `plan`.
+        """
+        return self.plan_update(await self.planner_chain.ainvoke(planner_input))
+
+    @staticmethod
+    def history_update(plan: List[Dict], observations: List[BaseMessage]) -> Dict:
+        """
+        Returns the agent history update of the planned calls and their observations, one entry
+        named after the tool per call, in plan order.
+        """
+        return {
+            "agent_history": [
+                AIMessage(
+                    content=f"{tool_call['args']} -> {observation.content}",
+                    name=tool_call["name"],
+                )
+                for tool_call, observation in zip(plan, observations)
+            ]
+        }
+
+    def execute(self, plan: List[Dict]) -> Dict:
+        """
+        Runs the planned calls concurrently, failing and unknown tools become error observations.
+        """
+        return self.history_update(
+            plan, run_tools(self.tool_node, AIMessage(content="", tool_calls=plan))
+        )
+
+    async def aexecute(self, plan: List[Dict]) -> Dict:
+        """
+        Asyncio variant of `execute`.
+        """
+        return self.history_update(
+            plan,
+            await arun_tools(self.tool_node, AIMessage(content="", tool_calls=plan)),
+        )
@@ -0,0 +1,290 @@
+"""Resilient execution of google api requests: retries, rate limiting, coalescing and circuit breaking"""
+
+import copy
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, Optional
+from googleapiclient.errors import HttpError
+from constants import (
+    CALENDAR_BURST,
+    CALENDAR_QPS,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    RETRY_BASE_DELAY,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
+)
+from logger import log_with_context, logging
+from tracing import tracer
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403 responses carrying these reasons are quota errors rather than permission errors.
+RATE_LIMIT_REASONS = [b"rateLimitExceeded", b"userRateLimitExceeded"]
+IDEMPOTENT_METHODS = {"GET", "HEAD"}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+def is_rate_limited(err: Exception) -> bool:
+    """
+    True if the API rejected the request for exceeding a quota, it was not executed.
+    """
+    if not isinstance(err, HttpError):
+        return False
+    if err.resp.status == 429:
+        return True
+    return err.resp.status == 403 and any(
+        reason in (err.content or b"") for reason in RATE_LIMIT_REASONS
+    )
+
+
+def is_transient(err: Exception) -> bool:
+    """
+    True for errors a later attempt may not hit: quota, server and network errors.
+    """
+    if isinstance(err, HttpError):
+        return err.resp.status in RETRYABLE_STATUSES or is_rate_limited(err)
+    return isinstance(err, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """
+    Client side rate limiter allowing `rate` requests per second in bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """
+        Starts with a full bucket.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost: float = 1) -> float:
+        """
+        Takes `cost` tokens, waiting for them to be refilled if needed.
+        Returns the seconds waited.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # reserve the tokens now, later callers queue up behind this one.
+            self.tokens -= cost
+            wait = max(-self.tokens / self.rate, 0)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Stops calling the API after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds a single trial request is let through, its
+    success closes the circuit again and its failure keeps it open.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        """
+        Starts closed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        closed, open or half_open.
+        """
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """
+        True if a request may be sent now.
+        """
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        """
+        Closes the circuit.
+        """
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self) -> bool:
+        """
+        Counts a failure, returns True if it opened the circuit.
+        """
+        with self.lock:
+            self.failures += 1
+            reopened = self.trial_running
+            self.trial_running = False
+            if reopened or (
+                self.opened_at is None and self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+class RequestExecutor:
+    """
+    Executes google api requests through a token bucket, a circuit breaker and
+    retries with exponential backoff and full jitter.
+    Transient errors are retried for idempotent requests, writes are only retried
+    when rejected for quota since they may have been applied otherwise. Identical
+    reads in flight at the same time are coalesced into one API call.
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[TokenBucket] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+    ) -> None:
+        """
+        Sets up the executor with the calendar quota defaults.
+        """
+        self.limiter = limiter or TokenBucket(CALENDAR_QPS, CALENDAR_BURST)
+        self.breaker = breaker or CircuitBreaker(
+            CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT
+        )
+        self.max_attempts = max_attempts
+        self.in_flight = dict()
+        self.lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "api_calls": 0,
+            "retries": 0,
+            "failures": 0,
+            "coalesced": 0,
+            "throttled_seconds": 0.0,
+            "circuit_opened": 0,
+            "circuit_rejected": 0,
+        }
+
+    def count(self, metric: str, value: float = 1) -> None:
+        """
+        Increments a metric.
+        """
+        with self.lock:
+            self.metrics[metric] += value
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """
+        Seconds to wait before retry number `attempt`, with full jitter.
+        """
+        return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt))
+
+    def execute(self, request, cost: int = 1) -> Any:
+        """
+        Executes a request (or batch request standing for `cost` API calls) and returns its response.
+        """
+        self.count("requests")
+        method = getattr(request, "method", None)
+        if method not in IDEMPOTENT_METHODS:
+            return self.execute_with_retries(request, cost, idempotent=False)
+
+        key = (request.method, request.uri, request.body)
+        with self.lock:
+            leader = key not in self.in_flight
+            if leader:
+                self.in_flight[key] = Future()
+            future = self.in_flight[key]
+        if not leader:
+            self.count("coalesced")
+            # every caller gets its own copy, callers annotate the events they get.
+            return copy.deepcopy(future.result())
+
+        try:
+            response = self.execute_with_retries(request, cost, idempotent=True)
+            future.set_result(response)
+            return response
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+    def execute_with_retries(self, request, cost: int, idempotent: bool) -> Any:
+        """
+        Executes a request, retrying the errors that are safe to retry.
+        """
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.count("circuit_rejected")
+                raise CircuitOpenError("Calendar API unavailable, circuit open.")
+            self.count("throttled_seconds", self.limiter.acquire(cost))
+            self.count("api_calls")
+            try:
+                with tracer.span(
+                    getattr(request, "methodId", None) or "batch",
+                    "api",
+                    attempt=attempt,
+                    cost=cost,
+                ):
+                    response = request.execute()
+            except Exception as err:
+                transient = is_transient(err)
+                if not transient:
+                    # the API answered, client errors say nothing about its health.
+                    self.breaker.record_success()
+                elif self.breaker.record_failure():
+                    self.count("circuit_opened")
+                    log_with_context(
+                        logging.WARNING, f"Calendar API circuit opened after: {err}"
+                    )
+                retryable = is_rate_limited(err) or (transient and idempotent)
+                attempt += 1
+                if not retryable or attempt >= self.max_attempts:
+                    self.count("failures")
+                    raise
+                delay = self.backoff(attempt)
+                self.count("retries")
+                log_with_context(
+                    logging.INFO,
+                    f"Retrying calendar request in {delay:.2f}s (attempt {attempt}): {err}",
+                )
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return response
+
+    def report(self) -> Dict:
+        """
+        Returns the metrics along with the circuit state.
+        """
+        with self.lock:
+            return dict(self.metrics, circuit=self.breaker.state)
+
+
+# Shared by every calendar request, so the quota is enforced across the process.
+calendar_requests = RequestExecutor()
@@ -0,0 +1,109 @@
+"""Per turn hop and token budgets, and routing loop detection, for the supervisor"""
+
+from typing import Dict, List, Optional
+from langchain_core.messages import AIMessage
+from constants import (
+    EARLY_STOP_NOTE,
+    MAX_HOPS_PER_TURN,
+    MAX_TOKENS_PER_TURN,
+    ROUTE_REPEAT_LIMIT,
+)
+from logger import correlation_id, log_with_context, logging
+from tracing import tracer
+
+# Node answering the user, where turns are sent when stopped early.
+FINAL_NODE = "Communicate"
+
+
+class RouteGuard:
+    """
+    Keeps a turn from burning model calls: once the turn used up `max_hops`
+    supervisor decisions or `max_tokens` LLM tokens, the supervisor decided to
+    route to the worker which just answered, a worker was already visited
+    `repeat_limit` times, or its decision cannot be parsed, the turn is handed
+    to Communicate to answer with what was gathered so far.
+    Every early stop is counted, by reason.
+    """
+
+    def __init__(
+        self,
+        members: List[str],
+        max_hops: int = MAX_HOPS_PER_TURN,
+        max_tokens: int = MAX_TOKENS_PER_TURN,
+        repeat_limit: int = ROUTE_REPEAT_LIMIT,
+    ) -> None:
+        """
+        Sets up the guard for a graph routing to `members`.
+        """
+        self.members = members
+        self.max_hops = max_hops
+        self.max_tokens = max_tokens
+        self.repeat_limit = repeat_limit
+        self.stats = {
+            "hop_budget": 0,
+            "token_budget": 0,
+            "repeated_route": 0,
+            "parse_failure": 0,
+        }
+
+    @staticmethod
+    def begin(state: Dict) -> Dict:
+        """
+        Returns the state update starting the token count of a new turn, empty mid turn.
+        """
+        if state.get("route_trail"):
+            return dict()
+        return {"token_baseline": tracer.tokens(correlation_id.get())}
+
+    def exhausted(self, state: Dict) -> Optional[str]:
+        """
+        Returns the reason the turn has to stop, None while it is within its budgets.
+        """
+        if len(state.get("route_trail") or list()) >= self.max_hops:
+            return "hop_budget"
+        used = tracer.tokens(correlation_id.get()) - (state.get("token_baseline") or 0)
+        if used >= self.max_tokens:
+            return "token_budget"
+        return None
+
+    def vet(self, decision: Optional[Dict], route_trail: List[str]) -> Optional[str]:
+        """
+        Returns the reason a supervisor decision must not be followed, None if it can be.
+        """
+        next_node = (decision or dict()).get("next")
+        if next_node not in self.members:
+            return "parse_failure"
+        if next_node == FINAL_NODE:
+            return None
+        if (route_trail and route_trail[-1] == next_node) or route_trail.count(
+            next_node
+        ) >= self.repeat_limit:
+            return "repeated_route"
+        return None
+
+    def stop(self, reason: str, route_trail: List[str]) -> Dict:
+        """
+        Records an early stop and returns the supervisor update handing the turn to Communicate.
+        """
+        self.stats[reason] += 1
+        tracer.increment("early_stops", reason=reason)
+        log_with_context(
+            logging.WARNING,
+            f"Turn stopped early ({reason}) after {' -> '.join(route_trail) or 'no hops'}.",
+        )
+        return {
+            "next": FINAL_NODE,
+            "route_trail": route_trail + [FINAL_NODE],
+            "agent_history": [
+                AIMessage(
+                    content=EARLY_STOP_NOTE.format(reason=reason.replace("_", " ")),
+                    name="Supervisor",
+                )
+            ],
+        }
+
+    def report(self) -> Dict[str, int]:
+        """
+        Returns the early stop counters.
+        """
+        return dict(self.stats)
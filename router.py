@@ -0,0 +1,113 @@
+"""Deterministic fast-path router resolving obvious intents without the LLM supervisor"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional
+from constants import INJECT_CLOCK, ROUTER_CONFIDENCE_THRESHOLD
+from logger import log_with_context, logging
+
+
+class RouteRule(NamedTuple):
+    """
+    An intent recognised by a regex, with the sequence of nodes answering it.
+    """
+
+    intent: str
+    pattern: str
+    plan: List[str]
+    confidence: float
+
+
+DEFAULT_RULES = [
+    RouteRule(
+        intent="current_datetime",
+        pattern=r"\b(what(?:'s| is) the (?:time|date|day)|what time is it|today'?s (?:date|day)|(?:which|what) day is (?:it|today))\b",
+        # with the clock injected the communicator answers on its own.
+        plan=["Communicate"] if INJECT_CLOCK else ["DateTime", "Communicate"],
+        confidence=0.95,
+    ),
+    RouteRule(
+        intent="upcoming_events",
+        pattern=r"\b(upcoming (?:events?|meetings?)|next (?:\d+ |few )?(?:events?|meetings?)|what'?s next on my calendar)\b",
+        plan=["Calendar", "Communicate"],
+        confidence=0.9,
+    ),
+    RouteRule(
+        intent="calendar_list",
+        pattern=r"\b(?:which|what|list|show)\b.*\bcalendars\b",
+        plan=["Calendar", "Communicate"],
+        confidence=0.9,
+    ),
+]
+
+# Words hinting at multi step or write requests, which are left to the supervisor.
+COMPLEX_QUERY_PATTERN = (
+    r"\b(and|then|also|schedule|create|add|book|move|cancel|delete|free|conflicts?)\b"
+)
+
+
+class FastPathRouter:
+    """
+    Matches the users query against intent rules and, while the turn follows the
+    rule's plan, picks the next node without calling the supervisor model.
+    Returns None whenever confidence is low so the LLM supervisor decides.
+    """
+
+    def __init__(
+        self,
+        rules: List[RouteRule] = DEFAULT_RULES,
+        threshold: float = ROUTER_CONFIDENCE_THRESHOLD,
+    ) -> None:
+        """
+        Compiles the intent rules.
+        """
+        self.rules = [(rule, re.compile(rule.pattern, re.IGNORECASE)) for rule in rules]
+        self.complex_query = re.compile(COMPLEX_QUERY_PATTERN, re.IGNORECASE)
+        self.threshold = threshold
+        self.stats = {"fast_path": 0, "supervisor": 0}
+
+    def classify(self, query: str) -> Optional[RouteRule]:
+        """
+        Returns the rule matching the query if the match is confident enough.
+        """
+        matches = [rule for rule, pattern in self.rules if pattern.search(query)]
+        if len({tuple(rule.plan) for rule in matches}) != 1:
+            # no match, or matches disagreeing on the plan.
+            return None
+        rule = max(matches, key=lambda rule: rule.confidence)
+        confidence = rule.confidence
+        if self.complex_query.search(query):
+            confidence /= 2
+        return rule if confidence >= self.threshold else None
+
+    def route(self, query: str, route_trail: List[str]) -> Optional[str]:
+        """
+        Returns the next node for the turn, given the nodes already visited in it,
+        or None to defer to the supervisor.
+        """
+        rule = self.classify(query)
+        if (
+            rule is None
+            or len(route_trail) >= len(rule.plan)
+            or rule.plan[: len(route_trail)] != route_trail
+        ):
+            self.stats["supervisor"] += 1
+            return None
+        self.stats["fast_path"] += 1
+        next_node = rule.plan[len(route_trail)]
+        log_with_context(
+            logging.DEBUG, f"Fast path routed '{rule.intent}' to {next_node}."
+        )
+        return next_node
+
+    @property
+    def skipped(self) -> int:
+        """
+        Number of supervisor calls avoided so far.
+        """
+        return self.stats["fast_path"]
+
+    def report(self) -> Dict[str, int]:
+        """
+        Returns the routing counters.
+        """
+        return dict(self.stats)
@@ -0,0 +1,315 @@
+"""HTTP / WebSocket server front-end serving Jarvis to many users from one process"""
+
+import argparse
+import asyncio
+import contextlib
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict
+from aiohttp import web, WSMsgType
+from dotenv import load_dotenv
+from langchain_core.messages import RemoveMessage
+from constants import (
+    SERVER_HOST,
+    SERVER_PORT,
+    SERVER_MAX_CONCURRENT_TURNS,
+    SERVER_QUEUE_TIMEOUT,
+    SERVER_MAX_SESSIONS,
+    SESSION_IDLE_TTL,
+    SESSION_MAX_CONCURRENT_TURNS,
+    WS_SEND_QUEUE_SIZE,
+)
+from logger import correlation_scope, log_with_context, logging
+from multi_agent import MultiAgent
+from resilience import calendar_requests
+from tracing import tracer
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class SessionBusy(Exception):
+    """Raised when a session already has the maximum number of turns in flight."""
+
+
+class ServerOverloaded(Exception):
+    """Raised when no turn slot frees up within SERVER_QUEUE_TIMEOUT."""
+
+
+class ClientGone(Exception):
+    """Raised when a websocket client went away while events were sent to it."""
+
+
+class Session:
+    """
+    Turn limiter of a session, with its turns in flight and last activity for idle eviction.
+    """
+
+    def __init__(self) -> None:
+        """
+        Sets up an idle session.
+        """
+        self.slots = asyncio.Semaphore(SESSION_MAX_CONCURRENT_TURNS)
+        self.turns = 0
+        self.last_used = time.monotonic()
+
+
+def describe_update(node: str, update: Dict) -> Dict:
+    """
+    Converts a graph update into a JSON friendly event.
+    """
+    event = {"type": "event", "node": node}
+    if not update:
+        return event
+    if "next" in update:
+        event["next"] = str(update["next"])
+    for key in ["messages", "agent_history"]:
+        # history compaction updates only remove entries.
+        messages = [
+            message
+            for message in update.get(key) or list()
+            if not isinstance(message, RemoveMessage)
+        ]
+        if messages:
+            event["content"] = messages[-1].content
+    return event
+
+
+class JarvisServer:
+    """
+    Serves the multi agent graph over HTTP and WebSocket.
+    Every session id maps to its own checkpoint thread, turns are limited per
+    session and across the server, and websocket clients apply backpressure on
+    the graph through a bounded send queue. Idle sessions are dropped after
+    `idle_ttl` seconds, or least recently used first beyond `max_sessions`.
+    """
+
+    def __init__(
+        self,
+        agent: MultiAgent,
+        max_sessions: int = SERVER_MAX_SESSIONS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+    ) -> None:
+        """
+        Sets up the routes and concurrency limits around a MultiAgent.
+        """
+        self.agent = agent
+        self.turn_slots = asyncio.Semaphore(SERVER_MAX_CONCURRENT_TURNS)
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        # least recently used first.
+        self.sessions = OrderedDict()
+        self.app = web.Application()
+        self.app.add_routes(
+            [
+                web.get("/health", self.health),
+                web.get("/metrics", self.metrics),
+                web.get("/traces", self.traces),
+                web.post("/sessions/{session_id}/messages", self.post_message),
+                web.get("/sessions/{session_id}/ws", self.websocket),
+            ]
+        )
+
+    def session(self, session_id: str) -> Session:
+        """
+        Returns a session, creating it on first use, and drops the idle sessions due for eviction.
+        """
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session()
+        session.last_used = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        self.evict_idle(session.last_used)
+        return session
+
+    def evict_idle(self, now: float) -> None:
+        """
+        Drops idle sessions past `idle_ttl`, and the least recently used idle ones beyond `max_sessions`.
+        Sessions with a turn in flight are kept.
+        """
+        for session_id, session in list(self.sessions.items()):
+            expired = now - session.last_used >= self.idle_ttl
+            if not expired and len(self.sessions) <= self.max_sessions:
+                break
+            if session.turns == 0:
+                del self.sessions[session_id]
+
+    async def stream_turn(self, session_id: str, query: str) -> AsyncIterator[Dict]:
+        """
+        Runs one user turn on the sessions thread, yielding graph events as they are produced.
+        """
+        session = self.session(session_id)
+        if session.slots.locked():
+            raise SessionBusy(session_id)
+        session.turns += 1
+        try:
+            async with session.slots:
+                try:
+                    await asyncio.wait_for(
+                        self.turn_slots.acquire(), timeout=SERVER_QUEUE_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    raise ServerOverloaded(session_id)
+                try:
+                    with correlation_scope():
+                        log_with_context(
+                            logging.INFO, f"Turn started for session {session_id}."
+                        )
+                        # closed right away when the consumer stops early, which cancels the graph.
+                        async with contextlib.aclosing(
+                            self.agent.graph.astream(
+                                self.agent.turn_input(query),
+                                config=self.agent.thread_config(session_id),
+                            )
+                        ) as updates:
+                            async for update in updates:
+                                for node, node_update in update.items():
+                                    if node != "__end__":
+                                        yield describe_update(node, node_update)
+                finally:
+                    self.turn_slots.release()
+        finally:
+            session.turns -= 1
+            session.last_used = time.monotonic()
+
+    async def health(self, request: web.Request) -> web.Response:
+        """
+        Liveness probe reporting the number of known sessions and the calendar API request metrics.
+        """
+        return web.json_response(
+            {
+                "status": "ok",
+                "sessions": len(self.sessions),
+                "calendar_requests": calendar_requests.report(),
+            }
+        )
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """
+        Prometheus scrape endpoint: node, LLM, tool and calendar API latencies, LLM tokens and cache hits.
+        """
+        return web.Response(
+            text=tracer.export_prometheus(),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
+
+    async def traces(self, request: web.Request) -> web.Response:
+        """
+        The recorded spans as OpenTelemetry JSON, only those of one turn given `?correlation_id=`.
+        """
+        return web.json_response(
+            tracer.export_otlp(request.query.get("correlation_id"))
+        )
+
+    async def post_message(self, request: web.Request) -> web.Response:
+        """
+        Runs a turn to completion and returns the reply along with the node events.
+        Body: {"message": "<user query>"}
+        """
+        session_id = request.match_info["session_id"]
+        try:
+            body = await request.json()
+            query = body["message"]
+        except (ValueError, TypeError, KeyError):
+            raise web.HTTPBadRequest(
+                text='Body must be JSON: {"message": "<user query>"}.'
+            )
+        if not isinstance(query, str):
+            raise web.HTTPBadRequest(text="message must be a string.")
+        events = list()
+        try:
+            async for event in self.stream_turn(session_id, query):
+                events.append(event)
+        except SessionBusy:
+            raise web.HTTPTooManyRequests(text="Session already has a turn in flight.")
+        except ServerOverloaded:
+            raise web.HTTPServiceUnavailable(text="Server overloaded, retry later.")
+
+        replies = [
+            event["content"]
+            for event in events
+            if event["node"] in self.agent.answer_nodes
+        ]
+        return web.json_response(
+            {"reply": replies[-1] if replies else None, "events": events}
+        )
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        """
+        Bidirectional session: each text frame is a user turn, graph events are streamed back as JSON frames.
+        """
+        session_id = request.match_info["session_id"]
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        # bounded, so a slow reader pauses the graph instead of buffering without limit.
+        outbox = asyncio.Queue(maxsize=WS_SEND_QUEUE_SIZE)
+
+        async def sender():
+            while True:
+                event = await outbox.get()
+                if event is None:
+                    return
+                await ws.send_json(event)
+
+        sender_task = asyncio.create_task(sender())
+
+        async def send(event):
+            # the sender dies with the connection, waiting on a full outbox alone would then block forever.
+            if ws.closed or sender_task.done():
+                raise ClientGone(session_id)
+            put = asyncio.ensure_future(outbox.put(event))
+            await asyncio.wait([put, sender_task], return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+                raise ClientGone(session_id)
+
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    # closing the turn early cancels the graph and frees its slots.
+                    async with contextlib.aclosing(
+                        self.stream_turn(session_id, message.data)
+                    ) as events:
+                        async for event in events:
+                            await send(event)
+                    await send({"type": "done"})
+                except SessionBusy:
+                    await send(
+                        {
+                            "type": "error",
+                            "error": "Session already has a turn in flight.",
+                        }
+                    )
+                except ServerOverloaded:
+                    await send(
+                        {"type": "error", "error": "Server overloaded, retry later."}
+                    )
+        except ClientGone:
+            log_with_context(
+                logging.INFO,
+                f"Client of session {session_id} went away, its turn was cancelled.",
+            )
+        finally:
+            with contextlib.suppress(ClientGone):
+                await send(None)
+            await asyncio.gather(sender_task, return_exceptions=True)
+        return ws
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(
+        description="Serve Jarvis over HTTP and WebSocket."
+    )
+    arg_parser.add_argument("--host", default=SERVER_HOST)
+    arg_parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = arg_parser.parse_args()
+
+    load_dotenv()
+    server = JarvisServer(MultiAgent())
+    web.run_app(server.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Terminal rendering of graph turns, streaming answer tokens as they are generated"""
+
+from typing import Any, AsyncIterator, Iterator, List, Tuple
+from langchain_core.messages import AIMessage, AIMessageChunk
+from constants import PROGRESS_PREFIX
+
+# stream modes a turn has to be run with for TurnPrinter.
+STREAM_MODES = ["messages", "updates"]
+
+
+class TurnPrinter:
+    """
+    Prints a graph turn streamed with STREAM_MODES.
+    Tokens generated by the `answer_nodes` are printed as they arrive, the other
+    nodes only show up as one line progress indicators.
+    """
+
+    def __init__(self, answer_nodes: List[str], show_progress: bool = True) -> None:
+        """
+        Sets up the printer for a new turn.
+        """
+        self.answer_nodes = answer_nodes
+        self.show_progress = show_progress
+        self.streamed = set()
+        self.mid_line = False
+
+    def write(self, text: str) -> None:
+        """
+        Prints answer text without a line break.
+        """
+        print(text, end="", flush=True)
+        self.mid_line = not text.endswith("\n")
+
+    def end_line(self) -> None:
+        """
+        Terminates the answer line being printed, if any.
+        """
+        if self.mid_line:
+            print(flush=True)
+            self.mid_line = False
+
+    def on_message(self, message: Any, metadata: dict) -> None:
+        """
+        Prints a token chunk, or a whole message that was not streamed, of an answer node.
+        """
+        if metadata.get("langgraph_node") not in self.answer_nodes:
+            return
+        if not isinstance(message, AIMessage) or not isinstance(message.content, str):
+            # tool messages, and multi part contents which do not stream as text.
+            return
+        if isinstance(message, AIMessageChunk):
+            self.streamed.add(message.id)
+        elif message.id in self.streamed:
+            return
+        if message.content:
+            self.write(message.content)
+
+    def on_update(self, update: dict) -> None:
+        """
+        Shows a progress indicator for every node, other than the answer nodes, finishing.
+        """
+        if not self.show_progress:
+            return
+        for node, node_update in update.items():
+            if node in self.answer_nodes or node.startswith("__"):
+                continue
+            self.end_line()
+            progress = f"{PROGRESS_PREFIX}{node}"
+            if isinstance(node_update, dict) and "next" in node_update:
+                progress += f" -> {node_update['next']}"
+            print(progress, flush=True)
+
+    def handle(self, chunk: Tuple[str, Any]) -> None:
+        """
+        Renders one (stream mode, payload) chunk.
+        """
+        mode, payload = chunk
+        if mode == "messages":
+            self.on_message(*payload)
+        elif mode == "updates":
+            self.on_update(payload)
+
+    def print_turn(self, stream: Iterator[Tuple[str, Any]]) -> None:
+        """
+        Renders a whole turn.
+        """
+        for chunk in stream:
+            self.handle(chunk)
+        self.end_line()
+
+    async def aprint_turn(self, stream: AsyncIterator[Tuple[str, Any]]) -> None:
+        """
+        Asyncio variant of `print_turn`.
+        """
+        async for chunk in stream:
+            self.handle(chunk)
+        self.end_line()
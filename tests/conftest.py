@@ -0,0 +1,70 @@
+"""
+Shared fixtures: the offline Google Calendar service of the benchmarks, with an
+event store and calendar clients on top of it.
+"""
+
+import os
+import sys
+from datetime import datetime
+import pytest
+import pytz
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+
+from constants import USER_TIMEZONE
+from event_store import EventStore
+from fakes import FakeCalendarService, generate_events
+from google_calendar_client import GoogleCalendarClient
+from resilience import CircuitBreaker, RequestExecutor, TokenBucket
+
+
+def request_executor() -> RequestExecutor:
+    """
+    A request executor of its own, so tests do not share quota, breaker or metrics.
+    """
+    return RequestExecutor(
+        limiter=TokenBucket(rate=1000, capacity=1000),
+        breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60),
+    )
+
+
+@pytest.fixture
+def now() -> datetime:
+    return datetime.now(pytz.timezone(USER_TIMEZONE))
+
+
+@pytest.fixture
+def service(now) -> FakeCalendarService:
+    # a year of meetings around now, reaching past the event store window on both sides.
+    return FakeCalendarService(generate_events(days=360, now=now))
+
+
+@pytest.fixture
+def store() -> EventStore:
+    return EventStore(":memory:")
+
+
+@pytest.fixture
+def client(service, store) -> GoogleCalendarClient:
+    """
+    Client answering range queries from the event store.
+    """
+    return GoogleCalendarClient(
+        service=service, event_store=store, request_executor=request_executor()
+    )
+
+
+@pytest.fixture
+def direct_client(service) -> GoogleCalendarClient:
+    """
+    Client sending every query to the API.
+    """
+    direct = GoogleCalendarClient(
+        service=service,
+        event_store=EventStore(":memory:"),
+        request_executor=request_executor(),
+    )
+    direct.event_store = None
+    return direct
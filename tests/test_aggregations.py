@@ -0,0 +1,314 @@
+"""Aggregations and the tools built on them: busy hours, meeting load, attendees and free slots"""
+
+import json
+from datetime import datetime, timedelta
+import pytest
+import pytz
+from constants import PRIMARY_CALENDAR, USER_TIMEZONE
+from aggregations import (
+    busy_hours_per_day,
+    events_with_attendee,
+    meeting_index,
+    meeting_load_per_week,
+    next_free_slot,
+)
+from fakes import FakeCalendarService
+from google_calendar_client import GoogleCalendarClient
+from conftest import request_executor
+import tools
+
+TIMEZONE = pytz.timezone(USER_TIMEZONE)
+# a Monday.
+MONDAY = "2025-01-13"
+
+
+def at(day: str, time: str) -> datetime:
+    return TIMEZONE.localize(datetime.fromisoformat(f"{day}T{time}"))
+
+
+def meeting(start: str, end: str, summary: str = "Meeting", attendees=()) -> dict:
+    """
+    Timed event between two `<date>T<time>` strings in the users timezone.
+    """
+    return {
+        "id": f"{summary}-{start}",
+        "summary": summary,
+        "start": {
+            "dateTime": TIMEZONE.localize(datetime.fromisoformat(start)).isoformat()
+        },
+        "end": {"dateTime": TIMEZONE.localize(datetime.fromisoformat(end)).isoformat()},
+        "attendees": list(attendees),
+    }
+
+
+def all_day(day: str, summary: str = "Holiday") -> dict:
+    next_day = (datetime.fromisoformat(day) + timedelta(days=1)).date().isoformat()
+    return {
+        "id": f"{summary}-{day}",
+        "summary": summary,
+        "start": {"date": day},
+        "end": {"date": next_day},
+    }
+
+
+@pytest.mark.parametrize(
+    "events, expected",
+    [
+        ([], {"2025-01-13": 0.0, "2025-01-14": 0.0}),
+        (
+            [meeting("2025-01-13T09:00", "2025-01-13T10:30")],
+            {"2025-01-13": 1.5, "2025-01-14": 0.0},
+        ),
+        # overlapping meetings are counted once.
+        (
+            [
+                meeting("2025-01-13T09:00", "2025-01-13T11:00"),
+                meeting("2025-01-13T10:00", "2025-01-13T12:00"),
+                meeting("2025-01-14T15:00", "2025-01-14T15:15"),
+            ],
+            {"2025-01-13": 3.0, "2025-01-14": 0.25},
+        ),
+        # all day events are not meetings.
+        ([all_day("2025-01-13")], {"2025-01-13": 0.0, "2025-01-14": 0.0}),
+        # meetings crossing midnight count on both days.
+        (
+            [meeting("2025-01-13T23:00", "2025-01-14T01:30")],
+            {"2025-01-13": 1.0, "2025-01-14": 1.5},
+        ),
+    ],
+)
+def test_busy_hours_per_day(events, expected):
+    start, end = at(MONDAY, "00:00"), at("2025-01-15", "00:00")
+    assert busy_hours_per_day(meeting_index(events), start, end, TIMEZONE) == expected
+
+
+def test_busy_hours_are_clipped_to_the_range():
+    events = [meeting("2025-01-13T08:00", "2025-01-13T12:00")]
+    start, end = at(MONDAY, "10:00"), at(MONDAY, "11:00")
+    assert busy_hours_per_day(meeting_index(events), start, end, TIMEZONE) == {
+        "2025-01-13": 1.0
+    }
+
+
+@pytest.mark.parametrize(
+    "events, expected",
+    [
+        ([], list()),
+        (
+            [
+                meeting("2025-01-13T09:00", "2025-01-13T10:00"),
+                meeting("2025-01-13T09:30", "2025-01-13T10:30"),
+                meeting("2025-01-21T14:00", "2025-01-21T16:00"),
+                all_day("2025-01-15"),
+            ],
+            [
+                {"week_of": "2025-01-13", "meetings": 2, "hours": 1.5},
+                {"week_of": "2025-01-20", "meetings": 1, "hours": 2.0},
+            ],
+        ),
+        # a meeting crossing into the next week counts in the week it starts, its hours in both.
+        (
+            [meeting("2025-01-19T23:00", "2025-01-20T01:00")],
+            [
+                {"week_of": "2025-01-13", "meetings": 1, "hours": 1.0},
+                {"week_of": "2025-01-20", "meetings": 0, "hours": 1.0},
+            ],
+        ),
+    ],
+)
+def test_meeting_load_per_week(events, expected):
+    start, end = at(MONDAY, "00:00"), at("2025-01-27", "00:00")
+    assert (
+        meeting_load_per_week(meeting_index(events), start, end, TIMEZONE) == expected
+    )
+
+
+@pytest.mark.parametrize(
+    "attendee, expected",
+    [
+        ("alice", ["Sync", "Review"]),
+        ("ALICE@EXAMPLE.COM", ["Sync", "Review"]),
+        ("Bob Builder", ["Review"]),
+        ("carol", list()),
+    ],
+)
+def test_events_with_attendee(attendee, expected):
+    events = [
+        meeting(
+            "2025-01-13T09:00",
+            "2025-01-13T10:00",
+            "Sync",
+            [{"email": "alice@example.com"}, {"email": "me@example.com", "self": True}],
+        ),
+        meeting(
+            "2025-01-13T11:00",
+            "2025-01-13T12:00",
+            "Review",
+            [
+                {"email": "alice@example.com"},
+                {"email": "bob@example.com", "displayName": "Bob Builder"},
+            ],
+        ),
+        all_day(MONDAY),
+    ]
+    matches = events_with_attendee(events, attendee)
+    assert [event["summary"] for event in matches] == expected
+
+
+@pytest.mark.parametrize(
+    "events, start, work_hours, expected",
+    [
+        ([], "08:00", None, ("08:00", "09:00")),
+        ([], "08:00", (9, 18), ("09:00", "10:00")),
+        (
+            [
+                meeting("2025-01-13T09:00", "2025-01-13T10:00"),
+                meeting("2025-01-13T10:30", "2025-01-13T12:00"),
+            ],
+            "09:00",
+            (9, 18),
+            ("12:00", "13:00"),
+        ),
+        # all day events do not block slots.
+        ([all_day(MONDAY)], "09:00", (9, 18), ("09:00", "10:00")),
+    ],
+)
+def test_next_free_slot(events, start, work_hours, expected):
+    slot = next_free_slot(
+        meeting_index(events),
+        at(MONDAY, start),
+        at("2025-01-14", "00:00"),
+        timedelta(hours=1),
+        TIMEZONE,
+        work_hours,
+    )
+    assert slot == (at(MONDAY, expected[0]), at(MONDAY, expected[1]))
+
+
+def test_next_free_slot_is_none_when_the_range_is_full():
+    events = [meeting("2025-01-13T09:00", "2025-01-13T18:00")]
+    slot = next_free_slot(
+        meeting_index(events),
+        at(MONDAY, "09:00"),
+        at("2025-01-14", "00:00"),
+        timedelta(minutes=30),
+        TIMEZONE,
+        (9, 18),
+    )
+    assert slot is None
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """
+    Points the tools at a fake calendar holding a few meetings on Monday and Tuesday.
+    """
+    events = [
+        meeting(
+            "2025-01-13T09:00",
+            "2025-01-13T10:00",
+            "Standup",
+            [{"email": "alice@example.com"}],
+        ),
+        meeting("2025-01-13T09:30", "2025-01-13T11:00", "Design review"),
+        meeting("2025-01-13T23:00", "2025-01-14T01:00", "Release"),
+        all_day("2025-01-14"),
+    ]
+    client = GoogleCalendarClient(
+        service=FakeCalendarService({PRIMARY_CALENDAR: events}),
+        request_executor=request_executor(),
+    )
+    client.event_store = None
+    monkeypatch.setattr(tools, "calendar_client", lambda: client)
+
+
+def test_busy_hours_tool(calendar):
+    result = json.loads(
+        tools.get_busy_hours_per_day.invoke(
+            {
+                "start_datetime": "2025-01-13T00:00:00",
+                "end_datetime": "2025-01-15T00:00:00",
+            }
+        )
+    )
+    assert result == {
+        "timezone": USER_TIMEZONE,
+        "busy_hours": {"2025-01-13": 3.0, "2025-01-14": 1.0},
+        "total_hours": 4.0,
+    }
+
+
+def test_meeting_load_tool(calendar):
+    result = json.loads(
+        tools.get_meeting_load_per_week.invoke(
+            {
+                "start_datetime": "2025-01-13T00:00:00",
+                "end_datetime": "2025-01-20T00:00:00",
+            }
+        )
+    )
+    assert result["weeks"] == [{"week_of": "2025-01-13", "meetings": 3, "hours": 4.0}]
+
+
+def test_attendee_tool(calendar):
+    result = json.loads(
+        tools.find_events_with_attendee.invoke(
+            {
+                "attendee": "Alice",
+                "start_datetime": "2025-01-13T00:00:00",
+                "end_datetime": "2025-01-15T00:00:00",
+            }
+        )
+    )
+    assert result == {
+        "attendee": "Alice",
+        "count": 1,
+        "events": [
+            {
+                "summary": "Standup",
+                "start": "2025-01-13T09:00+05:30",
+                "end": "2025-01-13T10:00+05:30",
+            }
+        ],
+    }
+
+
+def test_next_free_slot_tool(calendar):
+    result = json.loads(
+        tools.get_next_free_slot.invoke(
+            {"duration_minutes": 60, "start_datetime": "2025-01-13T09:00:00"}
+        )
+    )
+    assert result == {
+        "free_slot": {
+            "start": "2025-01-13T11:00+05:30",
+            "end": "2025-01-13T12:00+05:30",
+        }
+    }
+
+
+def test_aggregation_tools_on_an_empty_calendar(monkeypatch):
+    client = GoogleCalendarClient(
+        service=FakeCalendarService(), request_executor=request_executor()
+    )
+    client.event_store = None
+    monkeypatch.setattr(tools, "calendar_client", lambda: client)
+    busy = json.loads(
+        tools.get_busy_hours_per_day.invoke(
+            {
+                "start_datetime": "2025-01-13T00:00:00",
+                "end_datetime": "2025-01-14T00:00:00",
+            }
+        )
+    )
+    assert busy["busy_hours"] == {"2025-01-13": 0.0} and busy["total_hours"] == 0
+    attendees = json.loads(
+        tools.find_events_with_attendee.invoke(
+            {
+                "attendee": "alice",
+                "start_datetime": "2025-01-13T00:00:00",
+                "end_datetime": "2025-01-14T00:00:00",
+            }
+        )
+    )
+    assert attendees["count"] == 0
@@ -0,0 +1,167 @@
+"""SQLite checkpointer: round trips, listing, pending writes, retention and restarts"""
+
+import operator
+from typing import Annotated, List, TypedDict
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.serde.types import ERROR
+from langgraph.graph import END, StateGraph
+import pytest
+from checkpointer import SqliteCheckpointer
+from history import keep_last
+
+
+def thread(thread_id: str = "thread") -> dict:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+
+
+def put_steps(saver: SqliteCheckpointer, count: int, thread_id: str = "thread"):
+    """
+    Puts `count` chained checkpoints on a thread, returns their configs oldest first.
+    """
+    configs = list()
+    config = thread(thread_id)
+    for step in range(count):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = {"step": step}
+        config = saver.put(
+            config, checkpoint, {"source": "loop", "step": step, "parents": {}}, {}
+        )
+        configs.append(config)
+    return configs
+
+
+@pytest.fixture
+def saver() -> SqliteCheckpointer:
+    return SqliteCheckpointer(":memory:", retention=100, compact_every=1000)
+
+
+def test_put_get_round_trip(saver):
+    first, second = put_steps(saver, 2)
+    latest = saver.get_tuple(thread())
+    assert latest.config == second
+    assert latest.checkpoint["channel_values"] == {"step": 1}
+    assert latest.metadata == {"source": "loop", "step": 1, "parents": {}}
+    assert latest.parent_config == first
+    assert saver.get_tuple(first).checkpoint["channel_values"] == {"step": 0}
+    assert saver.get_tuple(thread("other")) is None
+
+
+def test_list_newest_first_with_limit_before_and_filter(saver):
+    configs = put_steps(saver, 5)
+    put_steps(saver, 2, "other")
+    ids = [config["configurable"]["checkpoint_id"] for config in configs]
+
+    listed = [
+        item.config["configurable"]["checkpoint_id"] for item in saver.list(thread())
+    ]
+    assert listed == ids[::-1]
+    assert [
+        item.config["configurable"]["checkpoint_id"]
+        for item in saver.list(thread(), limit=2)
+    ] == ids[:2:-1]
+    assert [
+        item.config["configurable"]["checkpoint_id"]
+        for item in saver.list(thread(), before=configs[2])
+    ] == ids[1::-1]
+    assert [
+        item.metadata["step"] for item in saver.list(thread(), filter={"step": 3})
+    ] == [3]
+    assert len(list(saver.list(None))) == 7
+
+
+def test_put_writes_show_up_as_pending_writes(saver):
+    (config,) = put_steps(saver, 1)
+    saver.get_tuple(thread())
+    saver.put_writes(config, [("messages", "hello"), ("next", "Calendar")], "task")
+    saver.put_writes(config, [("messages", "ignored")], "task")
+    saver.put_writes(config, [(ERROR, "first")], "failing")
+    saver.put_writes(config, [(ERROR, "second")], "failing")
+
+    pending = saver.get_tuple(thread()).pending_writes
+    assert sorted(pending) == [
+        ("failing", ERROR, "second"),
+        ("task", "messages", "hello"),
+        ("task", "next", "Calendar"),
+    ]
+
+
+def test_old_checkpoints_are_pruned_to_the_retention():
+    saver = SqliteCheckpointer(":memory:", retention=3, compact_every=4)
+    configs = put_steps(saver, 3)
+    saver.put_writes(configs[0], [("messages", "old")], "task")
+    configs += put_steps(saver, 1)
+    # compaction runs every fourth write.
+    assert len(list(saver.list(thread()))) == 3
+    configs += put_steps(saver, 6)
+    assert len(list(saver.list(thread()))) == 5
+    configs += put_steps(saver, 2)
+    kept = [item.config for item in saver.list(thread())]
+    assert kept == configs[:-4:-1]
+    writes = saver.connection.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+    assert writes == 0
+
+
+def test_latest_checkpoints_are_cached_per_thread():
+    saver = SqliteCheckpointer(":memory:", cache_size=2)
+    for thread_id in ["a", "b", "c"]:
+        put_steps(saver, 1, thread_id)
+        saver.get_tuple(thread(thread_id))
+    assert [key[0] for key in saver.cache] == ["b", "c"]
+    put_steps(saver, 1, "c")
+    assert ("c", "") not in saver.cache
+    assert saver.get_tuple(thread("c")).metadata["step"] == 0
+
+
+def chat_graph(checkpointer, reducer=operator.add):
+    """
+    Graph answering every message with the number of turns so far.
+    """
+
+    class State(TypedDict):
+        messages: Annotated[List[BaseMessage], reducer]
+        turns: int
+
+    def reply(state):
+        turns = (state.get("turns") or 0) + 1
+        return {"messages": [AIMessage(content=f"turn {turns}")], "turns": turns}
+
+    workflow = StateGraph(State)
+    workflow.add_node("reply", reply)
+    workflow.set_entry_point("reply")
+    workflow.add_edge("reply", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+
+def test_conversations_survive_a_restart(tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    config = thread()
+    chat_graph(SqliteCheckpointer(path)).invoke(
+        {"messages": [HumanMessage(content="hi")]}, config
+    )
+
+    graph = chat_graph(SqliteCheckpointer(path))
+    assert graph.get_state(config).values["turns"] == 1
+    result = graph.invoke({"messages": [HumanMessage(content="again")]}, config)
+    assert result["turns"] == 2
+    assert [message.content for message in result["messages"]] == [
+        "hi",
+        "turn 1",
+        "again",
+        "turn 2",
+    ]
+
+
+def test_bounded_channels_keep_the_stored_state_flat():
+    saver = SqliteCheckpointer(":memory:")
+    graph = chat_graph(saver, keep_last(4))
+    config = thread()
+    for turn in range(10):
+        graph.invoke({"messages": [HumanMessage(content=f"message {turn}")]}, config)
+    messages = saver.get_tuple(config).checkpoint["channel_values"]["messages"]
+    assert [message.content for message in messages] == [
+        "message 8",
+        "turn 9",
+        "message 9",
+        "turn 10",
+    ]
@@ -0,0 +1,100 @@
+"""Pooled authorized HTTP sessions: checkout, reuse, the size bound and use as a service's http"""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+from google.oauth2.credentials import Credentials
+import httplib2
+import pytest
+import credentials_manager
+from credentials_manager import CredentialsManager, HttpSessionPool
+from google_calendar_client import GoogleCalendarClient
+
+
+class FakeHttp:
+    """
+    Connection answering every request with an empty event list, a little later.
+    """
+
+    def __init__(self) -> None:
+        self.headers = list()
+        self.closed = False
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        self.headers.append(headers)
+        time.sleep(0.02)
+        return httplib2.Response({"status": 200}), json.dumps({"items": []}).encode()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path) -> CredentialsManager:
+    """
+    Manager holding a valid token, its sessions open fake connections.
+    """
+    opened = list()
+
+    def open_http(timeout):
+        opened.append(FakeHttp())
+        return opened[-1]
+
+    monkeypatch.setattr(
+        credentials_manager, "httplib2", SimpleNamespace(Http=open_http)
+    )
+    manager = CredentialsManager(token_file=str(tmp_path / "token.json"))
+    manager.creds = Credentials(token="token")
+    manager.opened = opened
+    return manager
+
+
+def test_sessions_are_reused(manager):
+    pool = manager.http_pool
+    with pool.session() as first:
+        pass
+    with pool.session() as second:
+        assert second is first
+        with pool.session() as third:
+            assert third is not first
+    assert pool.opened == 2 and len(manager.opened) == 2
+
+
+def test_checkouts_wait_for_a_session_beyond_the_pool_size(manager):
+    pool = HttpSessionPool(manager, size=1)
+    got = list()
+    with pool.session() as http:
+        waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+        waiter.start()
+        time.sleep(0.05)
+        assert got == list()
+    waiter.join(1)
+    assert got == [http] and pool.opened == 1
+
+
+def test_requests_from_many_threads_share_the_pooled_sessions(manager):
+    client = GoogleCalendarClient(credentials_manager=manager)
+    client.event_store = None
+    service = client.calendar_service
+    requests = [service.events().list(calendarId="primary") for _ in range(8)]
+    threads = [threading.Thread(target=request.execute) for request in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert client.calendar_service is service
+    assert 1 < manager.http_pool.opened <= manager.http_pool.size
+    sent = [headers for http in manager.opened for headers in http.headers]
+    assert len(sent) == 8
+    assert all(headers["authorization"] == "Bearer token" for headers in sent)
+
+
+def test_close_drops_the_idle_sessions(manager):
+    pool = manager.http_pool
+    with pool.session():
+        pass
+    pool.close()
+    assert pool.opened == 0 and pool.idle.empty()
+    assert manager.opened[0].closed
@@ -0,0 +1,160 @@
+"""Event store: local answers match the API, deletions, expired sync tokens and the seeded window"""
+
+import threading
+from datetime import timedelta
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from constants import PRIMARY_CALENDAR
+from event_store import SYNC_TOKEN_EXPIRED
+
+UNLIMITED = 10000
+
+
+def fetch_ids(client, after, before, count=UNLIMITED):
+    """
+    Ids of the events the client returns for a range, in order.
+    """
+    return [
+        event["id"]
+        for event in client.fetch_calendar_events(
+            count_events=count,
+            after_date_time=after.isoformat() if after else None,
+            before_start_time=before.isoformat() if before else None,
+            limit=UNLIMITED,
+        )
+    ]
+
+
+def list_calls(service):
+    """
+    Records the parameters of every events list call the service gets.
+    """
+    calls = list()
+    list_events = service.list_events
+
+    def recording(calendar, page_token=None, **params):
+        calls.append(dict(params, pageToken=page_token))
+        return list_events(calendar, page_token, **params)
+
+    service.list_events = recording
+    return calls
+
+
+@pytest.mark.parametrize(
+    "start_days, end_days",
+    [(0, 1), (0, 7), (-10, 10), (-29, 0), (100, 170)],
+)
+def test_store_answers_match_the_api(client, direct_client, now, start_days, end_days):
+    after = now + timedelta(days=start_days)
+    before = now + timedelta(days=end_days)
+    expected = fetch_ids(direct_client, after, before)
+    assert expected
+    assert sorted(fetch_ids(client, after, before)) == sorted(expected)
+
+
+def test_store_answers_without_api_calls_once_synced(client, service, now):
+    client.fetch_calendar_events(5, now.isoformat(), None)
+    calls = list_calls(service)
+    fetch_ids(client, now, now + timedelta(days=7))
+    fetch_ids(client, now - timedelta(days=20), now)
+    assert calls == list()
+
+
+def test_first_sync_is_bounded_to_the_window(client, store, service, now):
+    calls = list_calls(service)
+    fetch_ids(client, now, now + timedelta(days=1))
+    assert calls and all("timeMin" in call and "timeMax" in call for call in calls)
+    stored = store.connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    total = sum(len(events) for events in service.store.values())
+    assert 0 < stored < total
+
+
+@pytest.mark.parametrize(
+    "start_days, end_days",
+    [(-60, 0), (150, 250), (-100, 300)],
+)
+def test_ranges_outside_the_window_go_to_the_api(
+    client, direct_client, store, now, start_days, end_days
+):
+    after = now + timedelta(days=start_days)
+    before = now + timedelta(days=end_days)
+    fetch_ids(client, now, now + timedelta(days=1))
+    assert (
+        store.query(PRIMARY_CALENDAR, after.isoformat(), before.isoformat(), 10000)
+        is None
+    )
+    assert sorted(fetch_ids(client, after, before)) == sorted(
+        fetch_ids(direct_client, after, before)
+    )
+
+
+def test_open_ended_query_filled_by_the_window_is_answered_locally(
+    client, direct_client, store, now
+):
+    fetch_ids(client, now, now + timedelta(days=1))
+    local = store.query(PRIMARY_CALENDAR, now.isoformat(), None, 5)
+    assert local is not None and len(local) == 5
+    assert store.query(PRIMARY_CALENDAR, now.isoformat(), None, UNLIMITED) is None
+    assert fetch_ids(client, now, None, 5) == fetch_ids(direct_client, now, None, 5)
+
+
+def test_deleted_and_moved_events_are_applied(client, store, service, now):
+    after, before = now, now + timedelta(days=7)
+    deleted, moved = fetch_ids(client, after, before)[:2]
+    events = service.store[PRIMARY_CALENDAR]
+    service.put(PRIMARY_CALENDAR, dict(events[deleted], status="cancelled"))
+    later = now + timedelta(days=20)
+    service.put(
+        PRIMARY_CALENDAR,
+        dict(
+            events[moved],
+            start={"dateTime": later.isoformat()},
+            end={"dateTime": (later + timedelta(hours=1)).isoformat()},
+        ),
+    )
+
+    assert store.refresh(service, PRIMARY_CALENDAR, force=True) == 2
+    ids = fetch_ids(client, after, before)
+    assert deleted not in ids and moved not in ids
+    assert moved in fetch_ids(
+        client, later - timedelta(hours=1), later + timedelta(hours=2)
+    )
+
+
+def test_expired_sync_token_runs_a_full_sync(client, store, service, now):
+    fetch_ids(client, now, now + timedelta(days=1))
+    list_events = service.list_events
+
+    def expiring(calendar, page_token=None, **params):
+        if params.get("syncToken"):
+            raise HttpError(httplib2.Response({"status": SYNC_TOKEN_EXPIRED}), b"gone")
+        return list_events(calendar, page_token, **params)
+
+    service.list_events = expiring
+    start = now + timedelta(days=2)
+    created = service.insert_event(
+        PRIMARY_CALENDAR,
+        {
+            "summary": "Added elsewhere",
+            "start": {"dateTime": start.isoformat()},
+            "end": {"dateTime": (start + timedelta(hours=1)).isoformat()},
+        },
+    )
+
+    store.refresh(service, PRIMARY_CALENDAR, force=True)
+    assert created["id"] in fetch_ids(client, now, now + timedelta(days=3))
+    assert store.get_sync_state(PRIMARY_CALENDAR)[0] == str(service.version)
+
+
+def test_concurrent_refreshes_sync_once(store, service):
+    calls = list_calls(service)
+    threads = [
+        threading.Thread(target=store.refresh, args=(service, PRIMARY_CALENDAR))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len([call for call in calls if call["pageToken"] is None]) == 1
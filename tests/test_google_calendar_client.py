@@ -0,0 +1,158 @@
+"""Calendar client: multi calendar fan out and batched inserts"""
+
+from datetime import timedelta
+import httplib2
+from googleapiclient.errors import HttpError
+from constants import PRIMARY_CALENDAR
+from parser import event_datetime
+from fakes import FakeBatchRequest, FakeCalendarService
+from google_calendar_client import GoogleCalendarClient
+from resilience import CircuitBreaker, RequestExecutor, TokenBucket
+
+
+def test_multi_calendar_events_are_merged_and_tagged(direct_client, service, now):
+    after, before = now, now + timedelta(days=7)
+    events = direct_client.fetch_multi_calendar_events(
+        20, after.isoformat(), before.isoformat()
+    )
+    starts = [event_datetime(event, "start") for event in events]
+    assert len(events) == 20 and starts == sorted(starts)
+    assert {event["calendar"] for event in events} <= {"Personal", "Team"}
+
+
+def test_calendar_list_is_fetched_once_for_multi_calendar_queries(
+    direct_client, service, now
+):
+    calendar_list = service.calendarList
+    calls = list()
+
+    def recording():
+        calls.append(1)
+        return calendar_list()
+
+    service.calendarList = recording
+
+    for calendars in [None, ["team"], None]:
+        events = direct_client.fetch_multi_calendar_events(
+            5, now.isoformat(), None, calendars
+        )
+        assert events
+    assert {event["calendar"] for event in events} <= {"Personal", "Team"}
+    assert len(calls) == 1
+
+
+class MixedBatchRequest(FakeBatchRequest):
+    """
+    Batch answering some inserts with an error and others not at all, or failing as a whole.
+    """
+
+    def __init__(self, callback, service: "MixedBatchService") -> None:
+        super().__init__(callback, latency=0)
+        self.service = service
+
+    def execute(self, http=None) -> None:
+        self.service.batch_sizes.append(len(self.requests))
+        if len(self.service.batch_sizes) in self.service.failing_batches:
+            raise HttpError(httplib2.Response({"status": 400}), b"batch rejected")
+        for request, request_id in self.requests:
+            if request_id in self.service.rejected:
+                error = HttpError(httplib2.Response({"status": 409}), b"duplicate")
+                self.callback(request_id, None, error)
+            elif request_id not in self.service.lost:
+                self.callback(request_id, request.run(), None)
+
+
+class MixedBatchService(FakeCalendarService):
+    def __init__(self, rejected=(), lost=(), failing_batches=()) -> None:
+        super().__init__()
+        self.rejected = {str(position) for position in rejected}
+        self.lost = {str(position) for position in lost}
+        self.failing_batches = set(failing_batches)
+        self.batch_sizes = list()
+
+    def new_batch_http_request(self, callback) -> MixedBatchRequest:
+        return MixedBatchRequest(callback, self)
+
+
+def batch_client(service: FakeCalendarService, burst: int = 1000):
+    client = GoogleCalendarClient(
+        service=service,
+        request_executor=RequestExecutor(
+            limiter=TokenBucket(rate=1000, capacity=burst),
+            breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60),
+        ),
+    )
+    changes = list()
+    client.add_change_listener(changes.append)
+    return client, changes
+
+
+def bodies(count: int) -> list:
+    return [
+        {
+            "summary": f"Event {position}",
+            "start": {"dateTime": "2025-01-13T09:00:00+05:30"},
+            "end": {"dateTime": "2025-01-13T10:00:00+05:30"},
+        }
+        for position in range(count)
+    ]
+
+
+def outcome(result: dict) -> str:
+    return result["event"]["summary"] if "event" in result else result["error"]
+
+
+def test_create_events_returns_one_result_per_event(store):
+    service = MixedBatchService(rejected=[1], lost=[3])
+    client, changes = batch_client(service)
+    client.event_store = store
+    results = client.create_events(bodies(5))
+
+    assert [outcome(result) for result in results[::2]] == [
+        "Event 0",
+        "Event 2",
+        "Event 4",
+    ]
+    assert "duplicate" in results[1]["error"]
+    assert results[3] == {"error": "No response from the Calendar API."}
+    assert len(service.store[PRIMARY_CALENDAR]) == 3
+    assert changes == [PRIMARY_CALENDAR]
+
+
+def test_a_failed_batch_fails_its_events_only():
+    service = MixedBatchService(failing_batches=[2])
+    client, changes = batch_client(service, burst=2)
+    results = client.create_events(bodies(5))
+
+    assert service.batch_sizes == [2, 2, 1]
+    assert [outcome(result) for result in results[:1] + results[4:]] == [
+        "Event 0",
+        "Event 4",
+    ]
+    assert all("batch rejected" in result["error"] for result in results[2:4])
+    assert "event" in results[1]
+    assert changes == [PRIMARY_CALENDAR]
+
+
+def test_nothing_created_notifies_nobody():
+    service = MixedBatchService(failing_batches=[1])
+    client, changes = batch_client(service)
+    results = client.create_events(bodies(2))
+    assert all("error" in result for result in results)
+    assert changes == list()
+
+
+def test_batches_are_no_larger_than_the_rate_limiter_burst():
+    service = MixedBatchService()
+    client, _ = batch_client(service, burst=20)
+    results = client.create_events(bodies(45))
+    assert service.batch_sizes == [20, 20, 5]
+    assert [outcome(result) for result in results] == [
+        f"Event {position}" for position in range(45)
+    ]
+    assert client.requests.report()["api_calls"] == 3
+
+    service = MixedBatchService()
+    client, _ = batch_client(service)
+    client.create_events(bodies(60))
+    assert service.batch_sizes == [50, 10]
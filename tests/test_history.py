@@ -0,0 +1,194 @@
+"""Agent history compaction: summary thresholds, the folded entry count, the view and trimming"""
+
+import asyncio
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from langgraph.graph import add_messages
+import pytest
+from history import SUMMARY_NAME, HistoryCompactor, keep_last
+
+
+class StubSummarizer:
+    """
+    Stands in for the summarization model, answering with the number of calls so far.
+    """
+
+    def __init__(self) -> None:
+        self.prompts = list()
+
+    def __call__(self, prompt) -> str:
+        self.prompts.append(prompt.to_string())
+        return f"summary {len(self.prompts)}"
+
+
+def entries(count: int, start: int = 0) -> list:
+    return [
+        AIMessage(
+            content=f"entry {number}",
+            name="Calendar",
+            id=f"entry-{number}",
+            additional_kwargs={"intermediate_steps": ["raw"] * 10},
+        )
+        for number in range(start, start + count)
+    ]
+
+
+@pytest.fixture
+def summarizer() -> StubSummarizer:
+    return StubSummarizer()
+
+
+@pytest.fixture
+def compactor(summarizer) -> HistoryCompactor:
+    return HistoryCompactor(
+        RunnableLambda(summarizer), window=3, summary_batch=2, max_entries=8
+    )
+
+
+def apply(state: dict, update: dict) -> dict:
+    """
+    Applies a state update the way the graph channels do.
+    """
+    state = dict(
+        state, **{key: update[key] for key in update if key != "agent_history"}
+    )
+    if "agent_history" in update:
+        state["agent_history"] = add_messages(
+            state["agent_history"], update["agent_history"]
+        )
+    return state
+
+
+@pytest.mark.parametrize(
+    "history_size, summarized_upto, due",
+    [
+        (0, 0, 0),
+        (3, 0, 0),
+        # one entry out of the window is not a full batch yet.
+        (4, 0, 0),
+        (5, 0, 2),
+        (7, 0, 4),
+        (7, 2, 2),
+        (7, 3, 0),
+    ],
+)
+def test_summary_is_due_once_a_batch_left_the_window(
+    compactor, history_size, summarized_upto, due
+):
+    state = {"agent_history": entries(history_size), "summarized_upto": summarized_upto}
+    pending = compactor.pending(state)
+    assert [entry.content for entry in pending] == [
+        f"entry {number}" for number in range(summarized_upto, summarized_upto + due)
+    ]
+    update = compactor.compact(state)
+    assert update.get("summarized_upto", summarized_upto) == summarized_upto + due
+
+
+def test_compact_folds_the_pending_entries(compactor, summarizer):
+    state = {"agent_history": entries(5)}
+    assert compactor.compact(state) == {
+        "history_summary": "summary 1",
+        "summarized_upto": 2,
+    }
+    assert "None yet." in summarizer.prompts[0]
+    assert "Calendar: entry 0\nCalendar: entry 1" in summarizer.prompts[0]
+
+    state = dict(state, history_summary="summary 1", summarized_upto=2)
+    assert compactor.compact(state) == dict()
+    state["agent_history"] = state["agent_history"] + entries(2, start=5)
+    state = apply(state, compactor.compact(state))
+    assert state["history_summary"] == "summary 2"
+    assert state["summarized_upto"] == 4
+    # the previous summary is carried into the next one.
+    assert "summary 1" in summarizer.prompts[-1]
+    assert "entry 2\nCalendar: entry 3" in summarizer.prompts[-1]
+
+
+def test_acompact_matches_compact(compactor):
+    state = {"agent_history": entries(5)}
+    assert asyncio.run(compactor.acompact(state)) == {
+        "history_summary": "summary 1",
+        "summarized_upto": 2,
+    }
+    assert asyncio.run(compactor.acompact({"agent_history": entries(4)})) == dict()
+
+
+def test_view_is_the_summary_and_the_unsummarized_tail(compactor):
+    state = {
+        "agent_history": entries(6),
+        "history_summary": "earlier work",
+        "summarized_upto": 2,
+    }
+    view = compactor.view(state)
+    assert [(entry.name, entry.content) for entry in view] == [
+        (SUMMARY_NAME, "earlier work"),
+        ("Calendar", "entry 2"),
+        ("Calendar", "entry 3"),
+        ("Calendar", "entry 4"),
+        ("Calendar", "entry 5"),
+    ]
+    # intermediate steps are stripped.
+    assert all(not entry.additional_kwargs for entry in view)
+    stats = compactor.pop_stats()
+    assert 0 < stats["sent_tokens"] < stats["full_tokens"]
+    assert compactor.pop_stats()["sent_tokens"] == 0
+
+
+def test_view_without_a_summary(compactor):
+    view = compactor.view({"agent_history": entries(2)})
+    assert [entry.content for entry in view] == ["entry 0", "entry 1"]
+
+
+def test_folded_entries_beyond_max_entries_are_removed(compactor):
+    state = {
+        "agent_history": entries(10),
+        "history_summary": "earlier work",
+        "summarized_upto": 5,
+    }
+    update = compactor.compact(state)
+    # 7 entries are folded, 2 of them exceed the 8 kept.
+    assert [message.id for message in update["agent_history"]] == [
+        "entry-0",
+        "entry-1",
+    ]
+    state = apply(state, update)
+    assert state["summarized_upto"] == 5
+    assert [entry.content for entry in state["agent_history"]][:1] == ["entry 2"]
+    assert [entry.content for entry in compactor.view(state)] == [
+        "summary 1",
+        "entry 7",
+        "entry 8",
+        "entry 9",
+    ]
+
+
+def test_unsummarized_entries_are_never_removed():
+    compactor = HistoryCompactor(
+        RunnableLambda(StubSummarizer()), window=3, summary_batch=2, max_entries=2
+    )
+    state = {"agent_history": entries(10)}
+    update = compactor.compact(state)
+    assert len(update["agent_history"]) == 7
+    state = apply(state, update)
+    assert state["summarized_upto"] == 0
+    assert [entry.content for entry in state["agent_history"]] == [
+        "entry 7",
+        "entry 8",
+        "entry 9",
+    ]
+
+
+def test_entries_without_ids_are_kept():
+    compactor = HistoryCompactor(
+        RunnableLambda(StubSummarizer()), window=1, summary_batch=1, max_entries=1
+    )
+    history = [AIMessage(content="legacy")] + entries(2)
+    update = compactor.compact({"agent_history": history})
+    assert "agent_history" not in update
+    assert update["summarized_upto"] == 2
+
+
+def test_keep_last():
+    reducer = keep_last(3)
+    assert reducer(entries(2), entries(1, start=2)) == entries(3)
+    assert reducer(entries(3), entries(2, start=3)) == entries(3, start=2)
@@ -0,0 +1,108 @@
+"""Interval index: overlap queries against a brute force scan, busy intervals, free slots and conflicts"""
+
+import random
+from datetime import datetime, timedelta
+import pytest
+from interval_index import IntervalIndex
+
+DAY = datetime(2025, 1, 13)
+
+
+def at(hour: float) -> datetime:
+    """
+    Time of day on the test day, hours may be fractional.
+    """
+    return DAY + timedelta(hours=hour)
+
+
+def random_intervals(count: int, seed: int):
+    """
+    Intervals over a week with durations from zero to a day, items are their positions.
+    """
+    generator = random.Random(seed)
+    intervals = list()
+    for item in range(count):
+        start = DAY + timedelta(minutes=generator.randrange(0, 7 * 24 * 60, 15))
+        end = start + timedelta(minutes=generator.randrange(0, 24 * 60, 15))
+        intervals.append((start, end, item))
+    return intervals
+
+
+@pytest.mark.parametrize("count, seed", [(0, 0), (1, 1), (2, 2), (50, 3), (500, 4)])
+def test_overlapping_matches_a_brute_force_scan(count, seed):
+    intervals = random_intervals(count, seed)
+    index = IntervalIndex(intervals)
+    generator = random.Random(seed)
+    for _ in range(200):
+        start = DAY + timedelta(minutes=generator.randrange(-24 * 60, 8 * 24 * 60, 15))
+        end = start + timedelta(minutes=generator.randrange(0, 3 * 24 * 60, 15))
+        expected = sorted(
+            (
+                interval
+                for interval in intervals
+                if interval[0] < end and interval[1] > start
+            ),
+            key=lambda interval: (interval[0], interval[1]),
+        )
+        found = index.overlapping(start, end)
+        assert sorted(found) == sorted(interval[2] for interval in expected)
+        assert [intervals[item][0] for item in found] == [
+            interval[0] for interval in expected
+        ]
+
+
+def test_touching_intervals_do_not_overlap():
+    index = IntervalIndex([(at(9), at(10), "a"), (at(10), at(11), "b")])
+    assert index.overlapping(at(10), at(10.5)) == ["b"]
+    assert index.overlapping(at(8), at(9)) == list()
+    assert index.overlapping(at(11), at(12)) == list()
+    assert index.overlapping(at(9.5), at(10.5)) == ["a", "b"]
+    assert index.conflicts(at(0), at(24)) == list()
+
+
+def test_busy_intervals_are_merged_and_clipped():
+    index = IntervalIndex(
+        [
+            (at(8), at(10), "a"),
+            (at(9), at(9.5), "b"),
+            (at(10), at(11), "c"),
+            (at(13), at(14), "d"),
+            (at(13.5), at(15), "e"),
+        ]
+    )
+    assert index.busy_intervals(at(9), at(14.5)) == [
+        (at(9), at(11)),
+        (at(13), at(14.5)),
+    ]
+
+
+def test_free_slots_skip_gaps_shorter_than_the_minimum():
+    index = IntervalIndex(
+        [(at(9), at(10), "a"), (at(10.25), at(12), "b"), (at(13), at(17), "c")]
+    )
+    assert index.free_slots(at(8), at(18)) == [
+        (at(8), at(9)),
+        (at(10), at(10.25)),
+        (at(12), at(13)),
+        (at(17), at(18)),
+    ]
+    assert index.free_slots(at(8), at(18), timedelta(hours=1)) == [
+        (at(8), at(9)),
+        (at(12), at(13)),
+        (at(17), at(18)),
+    ]
+    assert index.free_slots(at(9), at(10)) == list()
+    assert IntervalIndex([]).free_slots(at(8), at(9)) == [(at(8), at(9))]
+
+
+def test_conflicts_pair_every_overlapping_event():
+    index = IntervalIndex(
+        [
+            (at(9), at(12), "a"),
+            (at(10), at(11), "b"),
+            (at(10.5), at(13), "c"),
+            (at(13), at(14), "d"),
+        ]
+    )
+    assert set(index.conflicts(at(0), at(24))) == {("a", "b"), ("a", "c"), ("b", "c")}
+    assert index.conflicts(at(12), at(24)) == list()
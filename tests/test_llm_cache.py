@@ -0,0 +1,167 @@
+"""LLM response cache: exact and semantic hits, misses, TTL, eviction and invalidation"""
+
+from datetime import datetime
+import pytest
+import pytz
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration
+from constants import CLOCK_PROMPT, USER_TIMEZONE
+import llm_cache
+from llm_cache import ResponseCache, create_response_cache
+from fakes import FakeCalendarService
+from google_calendar_client import GoogleCalendarClient
+from conftest import request_executor
+
+MODEL = "chat-model"
+TIMEZONE = pytz.timezone(USER_TIMEZONE)
+
+
+def prompt(query: str, system: str = "You are a calendar assistant.", at=None) -> str:
+    """
+    Serializes a system and human message the way the chat models do, with the
+    clock of `at` (a `<date>T<time>` string) in the system prompt.
+    """
+    now = TIMEZONE.localize(datetime.fromisoformat(at or "2025-01-13T09:00"))
+    clock = CLOCK_PROMPT.format(
+        current_datetime=f"{now.isoformat(timespec='minutes')} ({now.strftime('%A')})"
+    )
+    return dumps([SystemMessage(content=system + clock), HumanMessage(content=query)])
+
+
+def answer(content: str) -> list:
+    return [ChatGeneration(message=AIMessage(content=content))]
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class WordEmbeddings:
+    """
+    Bag of words embeddings over a fixed vocabulary.
+    """
+
+    VOCABULARY = ["meetings", "today", "tomorrow", "my", "show", "what", "are"]
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def embed_query(self, text: str) -> list:
+        self.calls += 1
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(word)) for word in self.VOCABULARY]
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache, "time", clock)
+    return clock
+
+
+def test_exact_hits_and_misses():
+    cache = ResponseCache()
+    cache.update(prompt("what are my meetings today?"), MODEL, answer("Two."))
+
+    (hit,) = cache.lookup(prompt("what are my meetings today?"), MODEL)
+    assert hit.message.content == "Two."
+    assert hit.message.response_metadata["cache_hit"] is True
+    assert cache.lookup(prompt("what are my meetings tomorrow?"), MODEL) is None
+    assert cache.lookup(prompt("what are my meetings today?"), "other-model") is None
+    assert cache.report() == {"hits": 1, "semantic_hits": 0, "misses": 2, "size": 1}
+
+
+def test_message_ids_and_whitespace_do_not_change_the_key():
+    cache = ResponseCache()
+    cache.update(
+        dumps([SystemMessage(content="Be brief."), HumanMessage(content="hi", id="1")]),
+        MODEL,
+        answer("Hello."),
+    )
+    assert cache.lookup(
+        dumps(
+            [SystemMessage(content="Be  brief."), HumanMessage(content="hi", id="2")]
+        ),
+        MODEL,
+    )
+
+
+def test_the_clock_only_counts_up_to_its_date():
+    cache = ResponseCache()
+    cache.update(prompt("show my meetings", at="2025-01-13T09:00"), MODEL, answer("A"))
+
+    assert cache.lookup(prompt("show my meetings", at="2025-01-13T09:47"), MODEL)
+    assert (
+        cache.lookup(prompt("show my meetings", at="2025-01-14T09:00"), MODEL) is None
+    )
+    # times outside the clock are still part of the key.
+    cache.update(prompt("meetings at 2025-01-13T09:00+05:30"), MODEL, answer("B"))
+    assert cache.lookup(prompt("meetings at 2025-01-13T10:00+05:30"), MODEL) is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.update(prompt("show my meetings"), MODEL, answer("A"))
+    clock.now += 59
+    assert cache.lookup(prompt("show my meetings"), MODEL)
+    clock.now += 1
+    assert cache.lookup(prompt("show my meetings"), MODEL) is None
+    assert cache.report()["size"] == 0
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_size=2)
+    for query in ["first", "second"]:
+        cache.update(prompt(query), MODEL, answer(query))
+    assert cache.lookup(prompt("first"), MODEL)
+    cache.update(prompt("third"), MODEL, answer("third"))
+
+    assert cache.lookup(prompt("second"), MODEL) is None
+    assert cache.lookup(prompt("first"), MODEL)
+    assert cache.lookup(prompt("third"), MODEL)
+
+
+def test_semantic_hits_need_the_same_context():
+    embeddings = WordEmbeddings()
+    cache = ResponseCache(embeddings=embeddings, threshold=0.9)
+    cache.update(prompt("what are my meetings today?"), MODEL, answer("Two."))
+
+    (hit,) = cache.lookup(prompt("What are my meetings today"), MODEL)
+    assert hit.message.content == "Two."
+    assert cache.lookup(prompt("what are my meetings tomorrow?"), MODEL) is None
+    assert (
+        cache.lookup(prompt("what are my meetings today?", system="Be brief."), MODEL)
+        is None
+    )
+    assert cache.report()["semantic_hits"] == 1
+
+
+def test_semantic_index_follows_eviction(clock):
+    cache = ResponseCache(ttl=60, embeddings=WordEmbeddings(), threshold=0.9)
+    cache.update(prompt("show my meetings"), MODEL, answer("A"))
+    clock.now += 60
+    assert cache.lookup(prompt("show my meetings today"), MODEL) is None
+    assert cache.indexes == dict()
+
+
+def test_calendar_changes_clear_the_cache(monkeypatch):
+    monkeypatch.setattr(llm_cache, "USE_LLM_CACHE", True)
+    client = GoogleCalendarClient(
+        service=FakeCalendarService(), request_executor=request_executor()
+    )
+    client.event_store = None
+    cache = create_response_cache(client)
+    cache.update(prompt("show my meetings"), MODEL, answer("None."))
+
+    client.create_event("2025-01-13T13:00:00", "2025-01-13T14:00:00", summary="Lunch")
+    assert cache.lookup(prompt("show my meetings"), MODEL) is None
+
+
+def test_disabled_cache(monkeypatch):
+    monkeypatch.setattr(llm_cache, "USE_LLM_CACHE", False)
+    assert create_response_cache(None) is None
@@ -0,0 +1,43 @@
+"""JSON log lines: fields, correlation ids and logged exceptions through the log queue"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from logger import CorrelationFilter, JsonFormatter, correlation_scope
+
+
+def failing_record() -> logging.LogRecord:
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger = logging.getLogger("test")
+        return logger.makeRecord(
+            "test", logging.ERROR, __file__, 1, "Cannot %s", ("sync",), sys.exc_info()
+        )
+
+
+def test_exceptions_get_their_own_field():
+    record = failing_record()
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "Cannot sync"
+    assert entry["level"] == "ERROR"
+    assert entry["exception"].startswith("Traceback")
+    assert entry["exception"].endswith("ValueError: boom")
+    # cached on the record like logging.Formatter does.
+    assert record.exc_text == entry["exception"]
+
+
+def test_json_lines_survive_the_log_queue():
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setFormatter(JsonFormatter())
+    queue_handler.addFilter(CorrelationFilter())
+    with correlation_scope("turn-1"):
+        queue_handler.handle(failing_record())
+
+    entry = json.loads(log_queue.get_nowait().getMessage())
+    assert entry["correlation_id"] == "turn-1"
+    assert entry["message"] == "Cannot sync"
+    assert "ValueError: boom" in entry["exception"]
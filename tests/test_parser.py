@@ -0,0 +1,114 @@
+"""Event serialization for the LLM: the compact table and the verbose listing"""
+
+from datetime import datetime
+import pytz
+from constants import USER_TIMEZONE
+from parser import format_event_table, parse_events
+
+TIMEZONE = pytz.timezone(USER_TIMEZONE)
+# Monday noon.
+NOW = TIMEZONE.localize(datetime(2025, 1, 13, 12, 0))
+
+
+def timed(start: str, end: str, **fields) -> dict:
+    return dict(
+        fields,
+        start={"dateTime": f"{start}+05:30"},
+        end={"dateTime": f"{end}+05:30"},
+    )
+
+
+EVENTS = [
+    timed(
+        "2025-01-13T09:30:00",
+        "2025-01-13T10:00:00",
+        summary="Standup",
+        attendees=[
+            {"email": "me@example.com", "self": True},
+            {"email": "alice@example.com"},
+            {"email": "bob@example.com"},
+        ],
+    ),
+    timed(
+        "2025-01-14T23:00:00",
+        "2025-01-15T01:00:00",
+        summary="Release | rollout",
+        attendees=[{"email": "alice@example.com"}],
+    ),
+    {
+        "summary": "Offsite",
+        "start": {"date": "2025-01-16"},
+        "end": {"date": "2025-01-18"},
+    },
+    {"start": {"date": "2025-03-01"}, "end": {"date": "2025-03-02"}},
+    timed("2026-02-02T15:00:00", "2026-02-02T16:00:00", summary="Review"),
+]
+
+
+def test_compact_table_layout():
+    assert format_event_table(EVENTS, NOW) == "\n".join(
+        [
+            "Calendar events, times in Asia/Kolkata, today is Mon 2025-01-13:",
+            "#|when|summary|attendees",
+            "1|today 09:30-10:00|Standup|P1,bob@example.com",
+            "2|tomorrow 23:00-Wed 01:00|Release / rollout|P1",
+            "3|Thu-Fri all day|Offsite|",
+            "4|Mar 01 all day||",
+            "5|2026-02-02 15:00-16:00|Review|",
+            "attendees: P1=alice@example.com",
+        ]
+    )
+
+
+def test_compact_table_optional_columns():
+    events = [
+        timed(
+            "2025-01-12T08:00:00",
+            "2025-01-12T09:00:00",
+            summary="Gym",
+            calendar="Personal",
+            description="Leg day,\n  bring   shoes",
+        ),
+        timed("2025-01-13T18:00:00", "2025-01-13T19:00:00", summary="Dinner"),
+    ]
+    assert format_event_table(events, NOW).splitlines()[1:] == [
+        "#|when|summary|calendar|description",
+        "1|yesterday 08:00-09:00|Gym|Personal|Leg day, bring shoes",
+        "2|today 18:00-19:00|Dinner||",
+    ]
+
+
+def test_compact_table_without_events():
+    assert format_event_table(list(), NOW).splitlines()[1:] == ["#|when|summary"]
+
+
+def test_descriptions_are_dropped_when_the_budget_runs_out():
+    events = [
+        timed(
+            "2025-01-13T09:00:00",
+            "2025-01-13T09:30:00",
+            summary=f"Interview {count}",
+            description="Candidate notes " * 10,
+        )
+        for count in range(100)
+    ]
+    assert format_event_table(events, NOW).splitlines()[1] == "#|when|summary"
+
+
+def test_verbose_listing():
+    assert parse_events(EVENTS[:1] + EVENTS[2:4], compact=False) == (
+        "Here are the calendar events for the users: \n"
+        "1. summary: Standup\n"
+        "attendees: alice@example.com,bob@example.com\n"
+        "start: 2025-01-13 09:30:00 UTC+05:30\n"
+        "end: 2025-01-13 10:00:00 UTC+05:30\n"
+        "2. summary: Offsite\n"
+        "start: 2025-01-16 00:00:00 IST\n"
+        "end: 2025-01-18 00:00:00 IST\n"
+        "3. start: 2025-03-01 00:00:00 IST\n"
+        "end: 2025-03-02 00:00:00 IST\n"
+    )
+
+
+def test_compact_is_the_default():
+    assert parse_events(EVENTS, now=NOW) == format_event_table(EVENTS, NOW)
@@ -0,0 +1,167 @@
+"""Request executor: which errors are retried for reads and writes, and the circuit breaker states"""
+
+import time
+from datetime import timedelta
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from google_calendar_client import GoogleCalendarClient
+from resilience import CircuitBreaker, CircuitOpenError, RequestExecutor, TokenBucket
+
+MAX_ATTEMPTS = 4
+RESET_TIMEOUT = 0.05
+
+
+def http_error(status: int, content: bytes = b"") -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), content)
+
+
+class ScriptedRequest:
+    """
+    Request raising the scripted errors in order, then returning `response`.
+    """
+
+    def __init__(self, method: str, errors=(), response=None) -> None:
+        self.method = method
+        self.uri = f"https://www.googleapis.com/calendar/v3/{id(self)}"
+        self.body = None
+        self.methodId = "calendar.events.test"
+        self.errors = list(errors)
+        self.response = response or {"items": list()}
+        self.calls = 0
+
+    def execute(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.response
+
+
+def executor(failure_threshold: int = 100) -> RequestExecutor:
+    return RequestExecutor(
+        limiter=TokenBucket(rate=1000, capacity=1000),
+        breaker=CircuitBreaker(failure_threshold, RESET_TIMEOUT),
+        max_attempts=MAX_ATTEMPTS,
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(RequestExecutor, "backoff", staticmethod(lambda attempt: 0))
+
+
+@pytest.mark.parametrize(
+    "method, error, calls",
+    [
+        ("GET", http_error(503), MAX_ATTEMPTS),
+        ("GET", http_error(500), MAX_ATTEMPTS),
+        ("GET", http_error(429), MAX_ATTEMPTS),
+        ("GET", ConnectionError("reset"), MAX_ATTEMPTS),
+        ("GET", TimeoutError("timed out"), MAX_ATTEMPTS),
+        ("GET", http_error(404), 1),
+        ("GET", http_error(400), 1),
+        ("GET", http_error(403, b"forbidden"), 1),
+        ("POST", http_error(503), 1),
+        ("POST", ConnectionError("reset"), 1),
+        ("POST", http_error(429), MAX_ATTEMPTS),
+        ("POST", http_error(403, b"rateLimitExceeded"), MAX_ATTEMPTS),
+        ("POST", http_error(403, b"userRateLimitExceeded"), MAX_ATTEMPTS),
+        ("POST", http_error(409), 1),
+    ],
+)
+def test_retried_errors(method, error, calls):
+    request = ScriptedRequest(method, [error] * MAX_ATTEMPTS)
+    with pytest.raises(type(error)):
+        executor().execute(request)
+    assert request.calls == calls
+
+
+@pytest.mark.parametrize("method", ["GET", "POST"])
+def test_success_after_a_transient_error(method):
+    request = ScriptedRequest(method, [http_error(429)], {"id": "event"})
+    requests = executor()
+    assert requests.execute(request) == {"id": "event"}
+    assert request.calls == 2
+    assert requests.metrics["retries"] == 1 and requests.metrics["failures"] == 0
+
+
+def test_breaker_opens_after_the_threshold_and_rejects():
+    requests = executor(failure_threshold=3)
+    for _ in range(2):
+        with pytest.raises(HttpError):
+            requests.execute(ScriptedRequest("POST", [http_error(503)]))
+        assert requests.breaker.state == "closed"
+    with pytest.raises(HttpError):
+        requests.execute(ScriptedRequest("POST", [http_error(503)]))
+    assert requests.breaker.state == "open"
+
+    request = ScriptedRequest("GET")
+    with pytest.raises(CircuitOpenError):
+        requests.execute(request)
+    assert request.calls == 0
+    assert requests.metrics["circuit_opened"] == 1
+    assert requests.metrics["circuit_rejected"] == 1
+
+
+def test_half_open_breaker_lets_a_single_trial_through():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=RESET_TIMEOUT)
+    assert breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(RESET_TIMEOUT)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_trial_success_closes_the_breaker():
+    requests = executor(failure_threshold=1)
+    with pytest.raises(HttpError):
+        requests.execute(ScriptedRequest("POST", [http_error(503)]))
+    time.sleep(RESET_TIMEOUT)
+    assert requests.execute(ScriptedRequest("GET")) == {"items": list()}
+    assert requests.breaker.state == "closed"
+
+
+def test_trial_failure_reopens_the_breaker():
+    requests = executor(failure_threshold=1)
+    with pytest.raises(HttpError):
+        requests.execute(ScriptedRequest("POST", [http_error(503)]))
+    time.sleep(RESET_TIMEOUT)
+    with pytest.raises(HttpError):
+        requests.execute(ScriptedRequest("POST", [http_error(503)]))
+    assert requests.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        requests.execute(ScriptedRequest("GET"))
+
+
+def test_client_errors_do_not_open_the_breaker():
+    requests = executor(failure_threshold=2)
+    for _ in range(5):
+        with pytest.raises(HttpError):
+            requests.execute(ScriptedRequest("GET", [http_error(404)]))
+    assert requests.breaker.state == "closed"
+    assert requests.execute(ScriptedRequest("GET")) == {"items": list()}
+
+
+@pytest.mark.parametrize("use_store", [True, False])
+def test_client_requests_go_through_the_injected_executor(
+    service, store, now, use_store
+):
+    requests = executor(failure_threshold=1)
+    requests.breaker.record_failure()
+    client = GoogleCalendarClient(
+        service=service, event_store=store, request_executor=requests
+    )
+    if not use_store:
+        client.event_store = None
+    list_events = service.list_events
+    calls = list()
+    service.list_events = lambda *args, **kwargs: calls.append(args) or list_events(
+        *args, **kwargs
+    )
+
+    events = client.fetch_calendar_events(
+        5, now.isoformat(), (now + timedelta(days=7)).isoformat()
+    )
+    assert events == list() and calls == list()
+    assert requests.metrics["circuit_rejected"] == (2 if use_store else 1)
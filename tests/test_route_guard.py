@@ -0,0 +1,84 @@
+"""Route guard: hop and token budgets, and supervisor decisions that are not followed"""
+
+import pytest
+from constants import EARLY_STOP_NOTE
+from logger import correlation_scope
+from route_guard import FINAL_NODE, RouteGuard
+from tracing import tracer
+
+MEMBERS = ["DateTime", "Calendar", "Communicate"]
+
+
+@pytest.fixture
+def guard() -> RouteGuard:
+    return RouteGuard(MEMBERS, max_hops=4, max_tokens=1000, repeat_limit=2)
+
+
+def use_tokens(count: int) -> None:
+    """
+    Records an LLM call of `count` tokens in the current turn.
+    """
+    span = tracer.start_span(
+        "llm", "llm", attributes={"gen_ai.usage.input_tokens": count}
+    )
+    tracer.end_span(span)
+
+
+@pytest.mark.parametrize(
+    "decision, route_trail, reason",
+    [
+        ({"next": "Calendar"}, list(), None),
+        ({"next": "Calendar"}, ["DateTime"], None),
+        ({"next": "Communicate"}, ["Calendar"], None),
+        # the final node is always allowed, even right after itself.
+        ({"next": "Communicate"}, ["Communicate"], None),
+        (None, list(), "parse_failure"),
+        (dict(), list(), "parse_failure"),
+        ({"next": "Weather"}, list(), "parse_failure"),
+        ({"next": "Calendar"}, ["Calendar"], "repeated_route"),
+        ({"next": "Calendar"}, ["Calendar", "DateTime"], None),
+        (
+            {"next": "Calendar"},
+            ["Calendar", "DateTime", "Calendar", "DateTime"],
+            "repeated_route",
+        ),
+    ],
+)
+def test_vet(guard, decision, route_trail, reason):
+    assert guard.vet(decision, route_trail) == reason
+
+
+def test_hop_budget(guard):
+    with correlation_scope():
+        assert (
+            guard.exhausted({"route_trail": ["DateTime", "Calendar", "DateTime"]})
+            is None
+        )
+        assert (
+            guard.exhausted(
+                {"route_trail": ["DateTime", "Calendar", "DateTime", "Calendar"]}
+            )
+            == "hop_budget"
+        )
+
+
+def test_token_budget_counts_the_turn_only(guard):
+    with correlation_scope():
+        use_tokens(600)
+        state = dict(route_trail=list(), **guard.begin({"route_trail": list()}))
+        assert state["token_baseline"] == 600
+        use_tokens(600)
+        assert guard.exhausted(state) is None
+        # mid turn the baseline is kept.
+        assert guard.begin({"route_trail": ["Calendar"]}) == dict()
+        use_tokens(400)
+        assert guard.exhausted(state) == "token_budget"
+
+
+def test_stop_hands_the_turn_to_communicate(guard):
+    update = guard.stop("repeated_route", ["Calendar"])
+    assert update["next"] == FINAL_NODE
+    assert update["route_trail"] == ["Calendar", FINAL_NODE]
+    (note,) = update["agent_history"]
+    assert note.content == EARLY_STOP_NOTE.format(reason="repeated route")
+    assert guard.report()["repeated_route"] == 1
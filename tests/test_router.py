@@ -0,0 +1,74 @@
+"""Fast path router: the intent table, plans followed hop by hop and the fallback to the supervisor"""
+
+import pytest
+from router import DEFAULT_RULES, FastPathRouter, RouteRule
+
+RULES = [
+    RouteRule("current_datetime", r"\bwhat time is it\b", ["Communicate"], 0.95),
+    RouteRule(
+        "upcoming_events", r"\bupcoming events\b", ["Calendar", "Communicate"], 0.9
+    ),
+    RouteRule("calendar_list", r"\bcalendars\b", ["Calendar", "Communicate"], 0.9),
+    RouteRule("unsure", r"\bmaybe\b", ["DateTime", "Communicate"], 0.5),
+]
+
+
+@pytest.fixture
+def router() -> FastPathRouter:
+    return FastPathRouter(RULES, threshold=0.85)
+
+
+@pytest.mark.parametrize(
+    "query, intent",
+    [
+        ("what time is it?", "current_datetime"),
+        ("Show my UPCOMING EVENTS", "upcoming_events"),
+        ("upcoming events across my calendars", "upcoming_events"),
+        ("maybe later", None),
+        # write requests and multi step queries are left to the supervisor.
+        ("what time is it and then create a meeting", None),
+        ("book a room", None),
+        ("tell me a joke", None),
+    ],
+)
+def test_classify(router, query, intent):
+    rule = router.classify(query)
+    assert (rule.intent if rule else None) == intent
+
+
+def test_rules_disagreeing_on_the_plan_defer_to_the_supervisor(router):
+    assert router.classify("what time is it, upcoming events?") is None
+
+
+def test_route_follows_the_plan_hop_by_hop(router):
+    query = "list my calendars"
+    assert router.route(query, list()) == "Calendar"
+    assert router.route(query, ["Calendar"]) == "Communicate"
+    # the plan is done, or the turn left it.
+    assert router.route(query, ["Calendar", "Communicate"]) is None
+    assert router.route(query, ["DateTime"]) is None
+    assert router.report() == {"fast_path": 2, "supervisor": 2}
+    assert router.skipped == 2
+
+
+def test_unknown_intents_fall_back_to_the_supervisor(router):
+    assert router.route("move my 1:1 with Alice to Friday", list()) is None
+    assert router.report() == {"fast_path": 0, "supervisor": 1}
+
+
+@pytest.mark.parametrize(
+    "query, intent",
+    [
+        ("What's the time?", "current_datetime"),
+        ("what day is today", "current_datetime"),
+        ("show me my next 3 meetings", "upcoming_events"),
+        ("what's next on my calendar", "upcoming_events"),
+        ("Which calendars do I have?", "calendar_list"),
+        ("what is the capital of France", None),
+    ],
+)
+def test_default_route_table(query, intent):
+    rule = FastPathRouter(DEFAULT_RULES).classify(query)
+    assert (rule.intent if rule else None) == intent
+    if rule is not None:
+        assert rule.plan[-1] == "Communicate"
@@ -0,0 +1,43 @@
+"""Tracing: calendar API spans nest in the span running them, across the I/O thread pools"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from uuid import uuid4
+from tracing import Tracer, TracingCallbackHandler
+
+
+def test_spans_in_pool_threads_nest_in_the_callers_span():
+    tracer = Tracer()
+
+    def api_call():
+        with tracer.span("calendar.events.list", "api") as span:
+            return span
+
+    with ThreadPoolExecutor(2) as pool:
+        with tracer.span("fetch_calendar_events", "tool") as tool:
+            futures = [pool.submit(copy_context().run, api_call) for _ in range(2)]
+            api_spans = [future.result() for future in futures]
+    assert [span.parent_id for span in api_spans] == [tool.span_id] * 2
+
+
+def test_api_spans_nest_in_callback_traced_tool_runs():
+    tracer = Tracer()
+    handler = TracingCallbackHandler(tracer)
+
+    async def tool_run():
+        run_id = uuid4()
+        handler.on_tool_start({"name": "fetch_calendar_list"}, "", run_id=run_id)
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(1) as pool:
+            await loop.run_in_executor(pool, copy_context().run, api_call)
+        handler.on_tool_end("", run_id=run_id)
+
+    def api_call():
+        with tracer.span("calendar.calendarList.list", "api"):
+            pass
+
+    asyncio.run(tool_run())
+    api, tool = tracer.spans()
+    assert (api.kind, tool.kind) == ("api", "tool")
+    assert api.parent_id == tool.span_id and tool.parent_id is None
@@ -1,14 +1,61 @@
+import asyncio
+import functools
+import json
 import pytz
 from parser import *
 from constants import *
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
 from datetime import datetime, timezone, timedelta, date
-from langchain_core.tools import tool
+from typing import List, Optional, Tuple
+from pydantic import BaseModel, Field
+from langchain_core.tools import BaseTool, tool
 from google_calendar_client import GoogleCalendarClient
+from interval_index import IntervalIndex
+from aggregations import (
+    busy_hours_per_day,
+    event_summary,
+    events_with_attendee,
+    meeting_index,
+    meeting_load_per_week,
+    next_free_slot,
+)
 from logger import log_with_context, logging
 
-client = GoogleCalendarClient()
 
+@functools.lru_cache(maxsize=None)
+def calendar_client() -> GoogleCalendarClient:
+    """
+    The calendar client shared by the tools, created on first use so importing the tools stays cheap.
+    """
+    return GoogleCalendarClient()
+
+
+# The google api client only ships a blocking transport, async agents run the calendar tools here.
+calendar_io_executor = ThreadPoolExecutor(
+    max_workers=CALENDAR_IO_WORKERS, thread_name_prefix="calendar-io"
+)
 
+
+def calendar_io(calendar_tool: BaseTool) -> BaseTool:
+    """
+    Gives a tool calling the calendar API a coroutine, so async agents run its
+    blocking calls on the calendar I/O pool instead of the event loop.
+    """
+
+    async def arun(**kwargs) -> str:
+        loop = asyncio.get_running_loop()
+        # the copied context carries the correlation id and span of the turn into the pool.
+        return await loop.run_in_executor(
+            calendar_io_executor,
+            functools.partial(copy_context().run, calendar_tool.func, **kwargs),
+        )
+
+    calendar_tool.coroutine = arun
+    return calendar_tool
+
+
+@calendar_io
 @tool
 def fetch_upcoming_events_for_calendar(num_events: int) -> str:
     """
@@ -23,12 +70,13 @@ def fetch_upcoming_events_for_calendar(num_events: int) -> str:
         logging.INFO,
         f"fetch_upcoming_events_for_calendar() called with num_events: {num_events}.",
     )
-    events = client.fetch_upcoming_calendar_events(count_events=num_events)
+    events = calendar_client().fetch_upcoming_calendar_events(count_events=num_events)
     if len(events) == 0:
         return "No upcoming events!"
     return parse_events(events)
 
 
+@calendar_io
 @tool
 def fetch_calendar_list() -> str:
     """
@@ -38,10 +86,11 @@ def fetch_calendar_list() -> str:
 
     print("Fetching your calendar list, Please wait...")
     log_with_context(logging.INFO, f"fetch_calendar_list() called.")
-    calendar_list = client.get_calendar_list()
+    calendar_list = calendar_client().get_calendar_list()
     return parse_calendar_list(calendar_list)
 
 
+@calendar_io
 @tool
 def fetch_events_after_time(minutes: int = 0, hours: int = 0, days: int = 0) -> str:
     """
@@ -71,7 +120,7 @@ def fetch_events_after_time(minutes: int = 0, hours: int = 0, days: int = 0) ->
     # Convert the result back to the same ISO 8601 format
     target_time = future_time.isoformat("T", "auto")[:-6] + "Z"
 
-    events = client.fetch_calendar_events(
+    events = calendar_client().fetch_calendar_events(
         count_events=EVENT_LIMIT, after_date_time=target_time, before_start_time=None
     )
 
@@ -139,6 +188,7 @@ def get_current_day_and_date() -> str:
     return f"Today's date: {current_date}\nToday's day: {current_day}"
 
 
+@calendar_io
 @tool
 def fetch_calendar_events(
     count_events: int = EVENT_LIMIT,
@@ -191,7 +241,7 @@ def fetch_calendar_events(
     else:
         start_datetime += "+05:30"
 
-    events = client.fetch_calendar_events(
+    events = calendar_client().fetch_calendar_events(
         count_events=count_events,
         after_date_time=start_datetime,
         before_start_time=end_datetime,
@@ -202,6 +252,7 @@ def fetch_calendar_events(
     return parse_events(events)
 
 
+@calendar_io
 @tool
 def create_event(
     start_datetime: str,
@@ -264,14 +315,17 @@ def create_event(
     )
 
     attendees = attendees.strip().split(",") if len(attendees) > 0 else list()
-    event = client.create_event(
-        start_datetime=start_datetime + "+05:30",
-        end_datetime=end_datetime + "+05:30",
-        attendees=attendees,
-        summary=summary,
-        description=description,
-        event_type=event_type,
-    )
+    try:
+        event = calendar_client().create_event(
+            start_datetime=start_datetime + "+05:30",
+            end_datetime=end_datetime + "+05:30",
+            attendees=attendees,
+            summary=summary,
+            description=description,
+            event_type=event_type,
+        )
+    except Exception as err:
+        return f"Failed to create event: {err}"
 
     if event:
         return "Event created successfully!"
@@ -279,6 +333,445 @@ def create_event(
         return "Failed to create event."
 
 
+class EventDetails(BaseModel):
+    """
+    Details of one event to create.
+    """
+
+    start_datetime: str = Field(
+        description="Start date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T08:00:00."
+    )
+    end_datetime: str = Field(
+        description="End date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T09:00:00."
+    )
+    attendees: str = Field(
+        default="", description="Comma separated string of attendee email addresses."
+    )
+    summary: str = Field(default="", description="Title of the event.")
+    description: str = Field(default="", description="Description of the event.")
+    event_type: str = Field(
+        default="default",
+        description="Event type among ['default', 'focusTime', 'outOfOffice'].",
+    )
+
+
+@calendar_io
+@tool
+def create_events_bulk(events: List[EventDetails]) -> str:
+    """
+    Create many events in users calendar in one step, use this instead of calling `create_event` repeatedly.
+
+    Args:
+        events (List[EventDetails]): Details of every event to create, same fields as `create_event`.
+        Examples:
+            <begin>
+                user: Block focus time from 9 am to 11 am every weekday next week (next week starts on 2025-01-13)
+                agent: call function with 5 events, `start_datetime` 2025-01-13T09:00:00 and `end_datetime` 2025-01-13T11:00:00 through 2025-01-17T09:00:00 and 2025-01-17T11:00:00, event_type as 'focusTime'
+            <end>
+            <begin>
+                user: Add sandra's birthday on 24th Jan and dave's birthday on 2nd Feb
+                agent: call function with 2 events, 2025-01-24T00:00:00 to 2025-01-24T23:59:59 summary "Sandra's Birthday" and 2025-02-02T00:00:00 to 2025-02-02T23:59:59 summary "Dave's Birthday"
+            <end>
+        End of examples
+    """
+    print(f"Creating {len(events)} new events, Please wait...")
+    log_with_context(
+        logging.INFO, f"create_events_bulk() called with {len(events)} events."
+    )
+
+    # invalid events are reported on their own, the valid ones are still created.
+    results = [None] * len(events)
+    bodies, positions = list(), list()
+    for position, event in enumerate(events):
+        try:
+            start, end = to_datetime(event.start_datetime), to_datetime(
+                event.end_datetime
+            )
+        except ValueError as err:
+            results[position] = {"error": f"Invalid date time: {err}"}
+            continue
+        if start is None or end is None:
+            results[position] = {"error": "Start and end date times are required."}
+            continue
+        if end < start:
+            results[position] = {"error": "The event ends before it starts."}
+            continue
+        bodies.append(
+            calendar_client().build_event(
+                start_datetime=start.isoformat(),
+                end_datetime=end.isoformat(),
+                attendees=[
+                    attendee.strip()
+                    for attendee in event.attendees.split(",")
+                    if attendee.strip()
+                ],
+                summary=event.summary,
+                description=event.description,
+                event_type=event.event_type,
+            )
+        )
+        positions.append(position)
+    if bodies:
+        for position, result in zip(positions, calendar_client().create_events(bodies)):
+            results[position] = result
+
+    failures = [
+        f"- {event.summary or event.start_datetime}: {result['error']}"
+        for event, result in zip(events, results)
+        if "error" in result
+    ]
+    content = (
+        f"Created {len(events) - len(failures)} of {len(events)} events successfully."
+    )
+    if len(failures) > 0:
+        content += "\nFailed to create:\n" + "\n".join(failures)
+    return content
+
+
+@calendar_io
+@tool
+def fetch_events_across_calendars(
+    count_events: int = EVENT_LIMIT,
+    start_datetime: str = None,
+    end_datetime: str = None,
+    calendars: str = "",
+) -> str:
+    """
+    Fetches `count_events` number of events between `start_datetime` and `end_datetime` across several of the users calendars at once.
+    Use this when the user asks about other calendars (shared, team, holidays, birthdays etc.) or about all calendars.
+
+    Args:
+        count_events (int, optional): Number of events to fetch. Defaults to 25.
+        start_datetime (str, optional): Start date time string in format %Y-%m-%dT%H:%M:%S. Defaults to now.
+        end_datetime (str, optional): End date time string in format %Y-%m-%dT%H:%M:%S. Defaults to None.
+        calendars (str, optional): Comma separated calendar ids from `fetch_calendar_list`. Defaults to '' meaning all calendars.
+        Examples:
+            <begin>
+                user: What is happening across all my calendars on 4th Jan 2025?
+                agent: call function with `start_datetime` as 2025-01-04T00:00:00 and `end_datetime` as 2025-01-04T23:59:59
+            <end>
+            <begin>
+                user: Any holidays or birthdays coming up?
+                agent: call `fetch_calendar_list` first, then call function with `calendars` as the comma separated ids of the holiday and birthday calendars
+            <end>
+        End of examples
+    Format the start and end time of events to human readable format like 25th Jan, 8pm - 10pm and mention the calendar of each event.
+    Do not list all the attendees.
+    """
+    print("Looking through your calendars, Please wait...")
+    log_with_context(
+        logging.INFO,
+        f"fetch_events_across_calendars() called with {count_events} events {start_datetime} start & {end_datetime} end, calendars: {calendars}.",
+    )
+    if start_datetime:
+        start_datetime = to_datetime(start_datetime).isoformat()
+    else:
+        start_datetime = datetime.now(pytz.timezone(USER_TIMEZONE)).isoformat()
+    if end_datetime:
+        end_datetime = to_datetime(end_datetime).isoformat()
+    calendar_ids = [
+        calendar.strip() for calendar in calendars.split(",") if calendar.strip()
+    ]
+
+    events = calendar_client().fetch_multi_calendar_events(
+        count_events=count_events,
+        after_date_time=start_datetime,
+        before_start_time=end_datetime,
+        calendars=calendar_ids or None,
+    )
+
+    if len(events) == 0:
+        return "No upcoming events!"
+    return parse_events(events)
+
+
+def build_interval_index(start: datetime, end: datetime) -> IntervalIndex:
+    """
+    Builds an interval index over the users events between `start` and `end`.
+    """
+    events = calendar_client().fetch_events_in_range(
+        after_date_time=start.isoformat(), before_start_time=end.isoformat()
+    )
+    return IntervalIndex.from_events(events or list())
+
+
+def build_meeting_index(start: datetime, end: datetime) -> IntervalIndex:
+    """
+    Builds an interval index over the users timed events between `start` and `end`.
+    """
+    events = calendar_client().fetch_events_in_range(
+        after_date_time=start.isoformat(), before_start_time=end.isoformat()
+    )
+    return meeting_index(events or list())
+
+
+def format_slot(start: datetime, end: datetime) -> str:
+    """
+    Formats a time slot in the users timezone.
+    """
+    user_timezone = pytz.timezone(USER_TIMEZONE)
+    start, end = start.astimezone(user_timezone), end.astimezone(user_timezone)
+    return f"{start.strftime('%Y-%m-%d %H:%M')} - {end.strftime('%Y-%m-%d %H:%M')}"
+
+
+@calendar_io
+@tool
+def check_conflicts(start_datetime: str, end_datetime: str) -> str:
+    """
+    Checks if the user is free between `start_datetime` and `end_datetime`.
+    Lists the events scheduled in this time and the events clashing with each other.
+
+    Args:
+        start_datetime (str): Start date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T20:00:00.
+        end_datetime (str): End date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T22:00:00.
+        Examples:
+            <begin>
+                user: Am I free between 8 pm and 10 pm on 12th Jan 2025?
+                agent: call function with `start_datetime` as 2025-01-12T20:00:00 and `end_datetime` as 2025-01-12T22:00:00
+            <end>
+            <begin>
+                user: Do I have any conflicts on 4th Jan 2025?
+                agent: call function with `start_datetime` as 2025-01-04T00:00:00 and `end_datetime` as 2025-01-04T23:59:59
+            <end>
+        End of examples
+    """
+    print("Checking your calendar for conflicts, Please wait...")
+    log_with_context(
+        logging.INFO,
+        f"check_conflicts() called with start: {start_datetime}, end: {end_datetime}.",
+    )
+    start, end = to_datetime(start_datetime), to_datetime(end_datetime)
+    index = build_interval_index(start, end)
+
+    busy = index.overlapping(start, end)
+    if len(busy) == 0:
+        return "The user is free during this time, no events are scheduled."
+
+    content = "The user is busy during this time. " + parse_events(busy)
+    clashes = index.conflicts(start, end)
+    if len(clashes) > 0:
+        content += "\nThese events conflict with each other:\n"
+        content += "\n".join(
+            f"- {first.get('summary', 'Untitled')} and {second.get('summary', 'Untitled')}"
+            for first, second in clashes
+        )
+    return content
+
+
+@calendar_io
+@tool
+def find_free_slots(
+    start_datetime: str, end_datetime: str, duration_minutes: int = 30
+) -> str:
+    """
+    Finds the free time slots of at least `duration_minutes` between `start_datetime` and `end_datetime`.
+
+    Args:
+        start_datetime (str): Start date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T09:00:00.
+        end_datetime (str): End date time string in format %Y-%m-%dT%H:%M:%S like 2025-01-12T18:00:00.
+        duration_minutes (int, optional): Minimum length of a free slot in minutes. Defaults to 30.
+        Examples:
+            <begin>
+                user: When am I free for an hour on 12th Jan 2025 between 9 am and 6 pm?
+                agent: call function with `start_datetime` as 2025-01-12T09:00:00, `end_datetime` as 2025-01-12T18:00:00 and `duration_minutes` as 60
+            <end>
+        End of examples
+    Format the slots to human readable format like 25th Jan, 8pm - 10pm.
+    """
+    print("Looking for free slots in your calendar, Please wait...")
+    log_with_context(
+        logging.INFO,
+        f"find_free_slots() called with start: {start_datetime}, end: {end_datetime}, duration: {duration_minutes} mins.",
+    )
+    start, end = to_datetime(start_datetime), to_datetime(end_datetime)
+    index = build_interval_index(start, end)
+
+    slots = index.free_slots(start, end, timedelta(minutes=duration_minutes))
+    if len(slots) == 0:
+        return "No free slots available in this time range."
+    return "Here are the free slots for the user: \n" + "\n".join(
+        f"{count}. {format_slot(slot_start, slot_end)}"
+        for count, (slot_start, slot_end) in enumerate(slots, start=1)
+    )
+
+
+def aggregation_range(
+    start_datetime: Optional[str], end_datetime: Optional[str], days: int
+) -> Tuple[datetime, datetime]:
+    """
+    Parses the range of an aggregation tool, defaulting to `days` days from now.
+    """
+    if start_datetime:
+        start = to_datetime(start_datetime)
+    else:
+        start = datetime.now(pytz.timezone(USER_TIMEZONE))
+    if end_datetime:
+        return start, to_datetime(end_datetime)
+    return start, start + timedelta(days=days)
+
+
+@calendar_io
+@tool
+def get_busy_hours_per_day(start_datetime: str = None, end_datetime: str = None) -> str:
+    """
+    Returns, as JSON, the hours the user spends in meetings on each day between `start_datetime` and `end_datetime`.
+    Overlapping meetings are counted once and all day events are ignored.
+
+    Args:
+        start_datetime (str, optional): Start date time string in format %Y-%m-%dT%H:%M:%S. Defaults to now.
+        end_datetime (str, optional): End date time string in format %Y-%m-%dT%H:%M:%S. Defaults to a week after start.
+        Examples:
+            <begin>
+                user: How busy am I each day next week?
+                agent: call function with `start_datetime` and `end_datetime` as the first and last moment of next week
+            <end>
+        End of examples
+    """
+    log_with_context(
+        logging.INFO,
+        f"get_busy_hours_per_day() called with start: {start_datetime}, end: {end_datetime}.",
+    )
+    start, end = aggregation_range(
+        start_datetime, end_datetime, AGGREGATION_DEFAULT_DAYS
+    )
+    user_timezone = pytz.timezone(USER_TIMEZONE)
+    busy = busy_hours_per_day(
+        build_meeting_index(start, end), start, end, user_timezone
+    )
+    return json.dumps(
+        {
+            "timezone": USER_TIMEZONE,
+            "busy_hours": busy,
+            "total_hours": round(sum(busy.values()), 2),
+        }
+    )
+
+
+@calendar_io
+@tool
+def get_next_free_slot(
+    duration_minutes: int = 30,
+    start_datetime: str = None,
+    working_hours_only: bool = True,
+) -> str:
+    """
+    Returns, as JSON, the first free slot of `duration_minutes` after `start_datetime` within the next two weeks.
+
+    Args:
+        duration_minutes (int, optional): Length of the slot in minutes. Defaults to 30.
+        start_datetime (str, optional): Date time string in format %Y-%m-%dT%H:%M:%S to search from. Defaults to now.
+        working_hours_only (bool, optional): Only consider slots during working hours. Defaults to True.
+        Examples:
+            <begin>
+                user: When is my next free hour?
+                agent: call function with `duration_minutes` as 60
+            <end>
+            <begin>
+                user: Find me 30 minutes tomorrow evening, even after work.
+                agent: call function with `start_datetime` as tomorrow 17:00:00 and `working_hours_only` as False
+            <end>
+        End of examples
+    """
+    log_with_context(
+        logging.INFO,
+        f"get_next_free_slot() called with duration: {duration_minutes} mins, start: {start_datetime}.",
+    )
+    start, end = aggregation_range(start_datetime, None, FREE_SLOT_SEARCH_DAYS)
+    user_timezone = pytz.timezone(USER_TIMEZONE)
+    slot = next_free_slot(
+        build_meeting_index(start, end),
+        start,
+        end,
+        timedelta(minutes=duration_minutes),
+        user_timezone,
+        work_hours=WORK_DAY_HOURS if working_hours_only else None,
+    )
+    if slot is None:
+        return json.dumps({"free_slot": None, "searched_until": end.isoformat()})
+    return json.dumps(
+        {
+            "free_slot": {
+                "start": slot[0]
+                .astimezone(user_timezone)
+                .isoformat(timespec="minutes"),
+                "end": slot[1].astimezone(user_timezone).isoformat(timespec="minutes"),
+            }
+        }
+    )
+
+
+@calendar_io
+@tool
+def find_events_with_attendee(
+    attendee: str, start_datetime: str = None, end_datetime: str = None
+) -> str:
+    """
+    Returns, as JSON, the events between `start_datetime` and `end_datetime` with an attendee matching `attendee`.
+
+    Args:
+        attendee (str): Part of the email or name of the attendee, like `alice` or `alice@example.com`.
+        start_datetime (str, optional): Start date time string in format %Y-%m-%dT%H:%M:%S. Defaults to now.
+        end_datetime (str, optional): End date time string in format %Y-%m-%dT%H:%M:%S. Defaults to a week after start.
+        Examples:
+            <begin>
+                user: How many meetings do I have with Alice this week?
+                agent: call function with `attendee` as alice and the range of this week
+            <end>
+        End of examples
+    """
+    log_with_context(
+        logging.INFO,
+        f"find_events_with_attendee() called with attendee: {attendee}, start: {start_datetime}, end: {end_datetime}.",
+    )
+    start, end = aggregation_range(
+        start_datetime, end_datetime, AGGREGATION_DEFAULT_DAYS
+    )
+    events = calendar_client().fetch_events_in_range(
+        after_date_time=start.isoformat(), before_start_time=end.isoformat()
+    )
+    user_timezone = pytz.timezone(USER_TIMEZONE)
+    matches = events_with_attendee(events or list(), attendee)
+    return json.dumps(
+        {
+            "attendee": attendee,
+            "count": len(matches),
+            "events": [event_summary(event, user_timezone) for event in matches],
+        }
+    )
+
+
+@calendar_io
+@tool
+def get_meeting_load_per_week(
+    start_datetime: str = None, end_datetime: str = None
+) -> str:
+    """
+    Returns, as JSON, the number of meetings and hours spent in them for every week between `start_datetime` and `end_datetime`.
+
+    Args:
+        start_datetime (str, optional): Start date time string in format %Y-%m-%dT%H:%M:%S. Defaults to now.
+        end_datetime (str, optional): End date time string in format %Y-%m-%dT%H:%M:%S. Defaults to four weeks after start.
+        Examples:
+            <begin>
+                user: How has my meeting load looked this month?
+                agent: call function with `start_datetime` and `end_datetime` as the first and last moment of this month
+            <end>
+        End of examples
+    """
+    log_with_context(
+        logging.INFO,
+        f"get_meeting_load_per_week() called with start: {start_datetime}, end: {end_datetime}.",
+    )
+    start, end = aggregation_range(
+        start_datetime, end_datetime, 4 * AGGREGATION_DEFAULT_DAYS
+    )
+    user_timezone = pytz.timezone(USER_TIMEZONE)
+    weeks = meeting_load_per_week(
+        build_meeting_index(start, end), start, end, user_timezone
+    )
+    return json.dumps({"timezone": USER_TIMEZONE, "weeks": weeks})
+
+
 @tool
 def end_chat() -> None:
     """
@@ -296,6 +789,14 @@ tools = [
     end_chat,
     fetch_calendar_events,
     create_event,
+    create_events_bulk,
+    check_conflicts,
+    find_free_slots,
+    fetch_events_across_calendars,
+    get_busy_hours_per_day,
+    get_next_free_slot,
+    find_events_with_attendee,
+    get_meeting_load_per_week,
 ]
 
 datetime_agent_tools = [
@@ -309,4 +810,12 @@ calendar_agent_tools = [
     fetch_events_after_time,
     fetch_calendar_events,
     create_event,
+    create_events_bulk,
+    check_conflicts,
+    find_free_slots,
+    fetch_events_across_calendars,
+    get_busy_hours_per_day,
+    get_next_free_slot,
+    find_events_with_attendee,
+    get_meeting_load_per_week,
 ]
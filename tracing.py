@@ -0,0 +1,500 @@
+"""Spans for graph nodes, LLM, tool and calendar API calls, exported as OpenTelemetry JSON or Prometheus text"""
+
+import bisect
+import hashlib
+import os
+import statistics
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from constants import LOGGER_NAME, TRACE_LATENCY_BUCKETS, TRACE_MAX_SPANS, TRACING
+from logger import correlation_id
+
+# OpenTelemetry span kinds.
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+# span kinds calling out of the process.
+CLIENT_KINDS = {"llm", "api"}
+
+
+class Span:
+    """
+    A timed operation of a user turn, the turn's correlation id is its trace.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        kind: str,
+        parent: Optional["Span"] = None,
+        attributes: Optional[Dict] = None,
+    ) -> None:
+        """
+        Starts the span now.
+        """
+        self.name = name
+        self.kind = kind
+        self.trace = parent.trace if parent is not None else correlation_id.get()
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes or dict())
+        self.error = None
+        # the LangChain run the span was recorded for, if any.
+        self.run_id = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    @property
+    def trace_id(self) -> str:
+        """
+        The OpenTelemetry trace id of the span, derived from its correlation id.
+        """
+        return hashlib.md5(self.trace.encode()).hexdigest()
+
+    @property
+    def duration(self) -> float:
+        """
+        Seconds the span took.
+        """
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+# The innermost running span, copied with the context into the prefetch and calendar I/O threads.
+current_span = ContextVar("current_span", default=None)
+
+
+def otlp_value(value: Any) -> Dict:
+    """
+    Converts an attribute value to an OTLP AnyValue.
+    """
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Tracer:
+    """
+    Records spans. The last `max_spans` finished spans are kept for export, span
+    latencies, LLM token counts and cache hits are aggregated for the whole process.
+    """
+
+    def __init__(
+        self, max_spans: int = TRACE_MAX_SPANS, buckets=TRACE_LATENCY_BUCKETS
+    ) -> None:
+        """
+        Sets up an empty tracer.
+        """
+        self.finished = deque(maxlen=max_spans)
+        self.buckets = list(buckets)
+        self.lock = threading.Lock()
+        # (kind, name) -> per bucket counts, with a last +Inf bucket, and the sum of the latencies.
+        self.histograms = defaultdict(lambda: [[0] * (len(self.buckets) + 1), 0.0])
+        self.errors = defaultdict(int)
+        self.llm = {"calls": 0, "cache_hits": 0, "input_tokens": 0, "output_tokens": 0}
+        # LLM tokens of the most recent traces, for per turn budgets.
+        self.trace_tokens = OrderedDict()
+        # (name, labels) -> count, of events worth alerting on.
+        self.counters = defaultdict(int)
+
+    def start_span(
+        self,
+        name: str,
+        kind: str,
+        parent: Optional[Span] = None,
+        attributes: Optional[Dict] = None,
+    ) -> Span:
+        """
+        Starts a span.
+        """
+        return Span(name, kind, parent, attributes)
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        """
+        Ends a span and records it.
+        """
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self.lock:
+            self.finished.append(span)
+            histogram = self.histograms[(span.kind, span.name)]
+            histogram[0][bisect.bisect_left(self.buckets, span.duration)] += 1
+            histogram[1] += span.duration
+            if error is not None:
+                self.errors[(span.kind, span.name)] += 1
+            if span.kind == "llm":
+                self.llm["calls"] += 1
+                if span.attributes.get("llm.cache_hit"):
+                    self.llm["cache_hits"] += 1
+                else:
+                    input_tokens = span.attributes.get("gen_ai.usage.input_tokens", 0)
+                    output_tokens = span.attributes.get("gen_ai.usage.output_tokens", 0)
+                    self.llm["input_tokens"] += input_tokens
+                    self.llm["output_tokens"] += output_tokens
+                    self.trace_tokens[span.trace] = (
+                        self.trace_tokens.get(span.trace, 0)
+                        + input_tokens
+                        + output_tokens
+                    )
+                    self.trace_tokens.move_to_end(span.trace)
+                    if len(self.trace_tokens) > self.finished.maxlen:
+                        self.trace_tokens.popitem(last=False)
+
+    def tokens(self, trace: str) -> int:
+        """
+        LLM tokens used so far in a trace (correlation id), cache hits are free.
+        """
+        with self.lock:
+            return self.trace_tokens.get(trace, 0)
+
+    def increment(self, name: str, **labels) -> None:
+        """
+        Counts an event, exported as the `jarvis_<name>_total` Prometheus counter.
+        """
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += 1
+
+    @contextmanager
+    def span(self, name: str, kind: str, **attributes) -> Iterator[Span]:
+        """
+        Records the enclosed block as a span, nested in the current span of the context.
+        """
+        span = self.start_span(name, kind, current_span.get(), attributes)
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            self.end_span(span, err)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            current_span.reset(token)
+
+    def spans(self, trace: Optional[str] = None) -> List[Span]:
+        """
+        The kept spans, only those of a trace (correlation id) when given.
+        """
+        with self.lock:
+            spans = list(self.finished)
+        if trace is None:
+            return spans
+        return [span for span in spans if span.trace == trace]
+
+    def export_otlp(self, trace: Optional[str] = None) -> Dict:
+        """
+        Exports the kept spans in the OpenTelemetry (OTLP) JSON format.
+        """
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {"key": "service.name", "value": otlp_value(LOGGER_NAME)}
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": __name__},
+                            "spans": [
+                                self.otlp_span(span) for span in self.spans(trace)
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    @staticmethod
+    def otlp_span(span: Span) -> Dict:
+        """
+        Converts a span to an OTLP JSON span.
+        """
+        attributes = dict(span.attributes, **{"jarvis.kind": span.kind})
+        attributes["jarvis.correlation_id"] = span.trace
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": (
+                SPAN_KIND_CLIENT if span.kind in CLIENT_KINDS else SPAN_KIND_INTERNAL
+            ),
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [
+                {"key": key, "value": otlp_value(value)}
+                for key, value in attributes.items()
+            ],
+            # OTLP status codes: 1 ok, 2 error.
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id is not None:
+            otlp_span["parentSpanId"] = span.parent_id
+        return otlp_span
+
+    def export_prometheus(self) -> str:
+        """
+        Exports the aggregated metrics in the Prometheus text format.
+        """
+        with self.lock:
+            histograms = {key: (list(h[0]), h[1]) for key, h in self.histograms.items()}
+            errors = dict(self.errors)
+            llm = dict(self.llm)
+            counters = dict(self.counters)
+
+        lines = [
+            "# HELP jarvis_span_duration_seconds Latency of graph nodes, LLM, tool and calendar API calls.",
+            "# TYPE jarvis_span_duration_seconds histogram",
+        ]
+        for (kind, name), (counts, total) in sorted(histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], counts):
+                cumulative += count
+                lines.append(
+                    f'jarvis_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"jarvis_span_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"jarvis_span_duration_seconds_count{{{labels}}} {cumulative}")
+        lines += [
+            "# HELP jarvis_span_errors_total Spans which ended with an error.",
+            "# TYPE jarvis_span_errors_total counter",
+        ]
+        for (kind, name), count in sorted(errors.items()):
+            lines.append(
+                f'jarvis_span_errors_total{{kind="{kind}",name="{name}"}} {count}'
+            )
+        lines += [
+            "# HELP jarvis_llm_calls_total LLM calls, including the ones served from the response cache.",
+            "# TYPE jarvis_llm_calls_total counter",
+            f"jarvis_llm_calls_total {llm['calls']}",
+            "# HELP jarvis_llm_cache_hits_total LLM calls served from the response cache.",
+            "# TYPE jarvis_llm_cache_hits_total counter",
+            f"jarvis_llm_cache_hits_total {llm['cache_hits']}",
+            "# HELP jarvis_llm_tokens_total Tokens sent to and generated by the LLM.",
+            "# TYPE jarvis_llm_tokens_total counter",
+            f'jarvis_llm_tokens_total{{direction="input"}} {llm["input_tokens"]}',
+            f'jarvis_llm_tokens_total{{direction="output"}} {llm["output_tokens"]}',
+        ]
+        typed = set()
+        for (name, labels), count in sorted(counters.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE jarvis_{name}_total counter")
+            label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f"jarvis_{name}_total{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def profile(self, trace: Optional[str] = None) -> str:
+        """
+        Summarizes the kept spans (of a trace) as a table of latencies per operation,
+        followed by the LLM calls, tokens and cache hits.
+        """
+        spans = self.spans(trace)
+        groups = defaultdict(list)
+        for span in spans:
+            groups[(span.kind, span.name)].append(span.duration)
+
+        lines = [
+            f"{'kind':<6}{'name':<36}{'count':>6}{'total':>10}{'mean':>10}{'max':>10}"
+        ]
+        for (kind, name), durations in sorted(
+            groups.items(), key=lambda group: -sum(group[1])
+        ):
+            lines.append(
+                f"{kind:<6}{name[:35]:<36}{len(durations):>6}{sum(durations):>9.3f}s"
+                f"{statistics.mean(durations):>9.3f}s{max(durations):>9.3f}s"
+            )
+        llm_spans = [span for span in spans if span.kind == "llm"]
+        billed = [
+            span for span in llm_spans if not span.attributes.get("llm.cache_hit")
+        ]
+        lines.append(
+            f"LLM calls: {len(llm_spans)} ({len(llm_spans) - len(billed)} cached), "
+            f"tokens: {sum(span.attributes.get('gen_ai.usage.input_tokens', 0) for span in billed)} input, "
+            f"{sum(span.attributes.get('gen_ai.usage.output_tokens', 0) for span in billed)} output"
+        )
+        return "\n".join(lines)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Records LangChain runs as spans: graph nodes, chat model calls (with their
+    token usage and whether the response cache served them) and tool calls.
+    Pass it in the `callbacks` of the graph config.
+    """
+
+    # spans are cheap to record, there is no need to hop to an executor on the async path.
+    run_inline = True
+
+    def __init__(self, tracer: Tracer) -> None:
+        """
+        Records spans on `tracer`.
+        """
+        self.tracer = tracer
+        self.runs = dict()
+        self.lock = threading.Lock()
+
+    def start(
+        self,
+        run_id: UUID,
+        parent_run_id: Optional[UUID],
+        name: str,
+        kind: str,
+        attributes: Dict,
+    ) -> None:
+        # the parent span is that of the closest enclosing run which is traced.
+        with self.lock:
+            parent = self.runs.get(parent_run_id)
+        span = self.tracer.start_span(name, kind, parent, attributes)
+        span.run_id = run_id
+        with self.lock:
+            self.runs[run_id] = span
+        # the run's callbacks are called in its context, calls made by the run nest in its span.
+        current_span.set(span)
+
+    def inherit(self, run_id: UUID, parent_run_id: Optional[UUID]) -> None:
+        """
+        Remembers the traced ancestor of a run which is not traced itself.
+        """
+        with self.lock:
+            self.runs[run_id] = self.runs.get(parent_run_id)
+
+    def end(self, run_id: UUID, error: Optional[BaseException] = None) -> None:
+        span = self.pop(run_id)
+        if span is not None:
+            self.tracer.end_span(span, error)
+
+    def pop(self, run_id: UUID) -> Optional[Span]:
+        """
+        Forgets a run, returning its span if it is traced.
+        """
+        with self.lock:
+            span = self.runs.pop(run_id, None)
+        # runs which are not traced map to their traced ancestor, if any.
+        if span is None or span.run_id != run_id:
+            return None
+        current_span.set(span.parent)
+        return span
+
+    def on_chain_start(
+        self,
+        serialized: Dict,
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        tags: Optional[List[str]] = None,
+        metadata: Optional[Dict] = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or dict()
+        node = metadata.get("langgraph_node")
+        # node runs are the ones tagged with their graph step, __start__ only writes the input.
+        if (
+            node
+            and not node.startswith("__")
+            and any(tag.startswith("graph:step:") for tag in tags or list())
+        ):
+            self.start(
+                run_id,
+                parent_run_id,
+                node,
+                "node",
+                {"langgraph.step": metadata.get("langgraph_step", 0)},
+            )
+        else:
+            self.inherit(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end(run_id)
+
+    def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self.end(run_id, error)
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict,
+        messages: List,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        metadata: Optional[Dict] = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or dict()
+        self.start(
+            run_id,
+            parent_run_id,
+            metadata.get("langgraph_node", "llm"),
+            "llm",
+            {"gen_ai.request.model": metadata.get("ls_model_name", "")},
+        )
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any) -> None:
+        span = self.pop(run_id)
+        if span is None:
+            return
+        message = getattr(response.generations[0][0], "message", None)
+        usage = getattr(message, "usage_metadata", None) or dict()
+        cache_hit = bool(
+            message is not None and message.response_metadata.get("cache_hit")
+        )
+        span.attributes["llm.cache_hit"] = cache_hit
+        span.attributes["gen_ai.usage.input_tokens"] = usage.get("input_tokens", 0)
+        span.attributes["gen_ai.usage.output_tokens"] = usage.get("output_tokens", 0)
+        self.tracer.end_span(span)
+
+    def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self.end(run_id, error)
+
+    def on_tool_start(
+        self,
+        serialized: Dict,
+        input_str: str,
+        *,
+        run_id: UUID,
+        parent_run_id: Optional[UUID] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.start(
+            run_id,
+            parent_run_id,
+            kwargs.get("name") or serialized.get("name", "tool"),
+            "tool",
+            dict(),
+        )
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        self.end(run_id)
+
+    def on_tool_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self.end(run_id, error)
+
+
+# Shared by the whole process, like the calendar request executor.
+tracer = Tracer()
+tracing_handler = TracingCallbackHandler(tracer)
+
+
+def trace_callbacks() -> List[BaseCallbackHandler]:
+    """
+    The callbacks to run graphs with, empty when TRACING is off.
+    """
+    return [tracing_handler] if TRACING else list()